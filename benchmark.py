@@ -0,0 +1,384 @@
+import argparse
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+from pathlib import Path
+import cv2
+import numpy as np
+import psutil
+import torch
+from job_scheduler import JobScheduler
+from small_protozoa.features_match import MotionEstimator
+from small_protozoa.small_protozoa_detect import FrameDifferDetector
+from tools.path_manager import PathDir
+
+# 基准测试使用的流水线配置(与main.py一致, 不显示画面, 全帧检测)
+BENCHMARK_CONFIG = {
+    'video_display': False,
+    'video_save': True,
+    'video_save_mode': 'video',
+    'output_level': 'full',
+    'output_every_n': 10,
+    'output_scale': 0.5,
+    'ring_slots': 32,
+    'yolo_batch_size': 8,
+    'torch_threads': None,
+    'prefetch': 16,
+    'stride': 1,
+    'blur_method': 'fft',
+    'blur_workers': 2,
+    'blur_threshold': -10000,
+    'blur_hysteresis': 2,
+    'blur_max_gap': 10,
+    'differ_pyramid': False,
+    'noise_mask_path': None,
+    'motion_backend': 'orb',
+    'record_live': False,
+    'methods': 'all',
+    'manual_option': 'end_detect',
+    'start_index': 0,
+    'end_index': 0,
+    'detect_index': 0,
+}
+
+
+def make_synthetic_clip(video_path, frames=300, width=1824, height=1216, fps=17, seed=0):
+    """
+    生成合成视频(随机纹理背景整体平移, 叠加若干运动的小目标与大目标)
+    :param video_path: 视频保存路径
+    :param frames: 帧数
+    :param width: 宽度
+    :param height: 高度
+    :param fps: 帧率
+    :param seed: 随机种子
+    :return: 视频保存路径
+    """
+    rng = np.random.default_rng(seed)
+    margin = frames + 10
+    # 背景纹理(低频噪声, 保证特征点匹配可以计算位移矢量)
+    texture = rng.integers(0, 256, ((height + margin) // 8 + 1, (width + margin) // 8 + 1), dtype=np.uint8)
+    texture = cv2.resize(texture, ((width + margin) // 8 * 8 + 8, (height + margin) // 8 * 8 + 8),
+                         interpolation=cv2.INTER_CUBIC)
+    texture = cv2.GaussianBlur(texture, (5, 5), 0)
+    texture = cv2.cvtColor((texture // 2 + 100).astype(np.uint8), cv2.COLOR_GRAY2BGR)
+
+    small = rng.uniform((100, 100), (width - 100, height - 100), (12, 2))  # 小目标位置
+    small_velocity = rng.uniform(-4, 4, (12, 2))
+    large = rng.uniform((200, 200), (width - 200, height - 200), (3, 2))  # 大目标位置
+    large_velocity = rng.uniform(-2, 2, (3, 2))
+
+    writer = cv2.VideoWriter(str(video_path), cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+    for index in range(frames):
+        frame = texture[index // 2:index // 2 + height, index:index + width].copy()  # 背景整体平移
+        for x, y in small:
+            cv2.circle(frame, (int(x), int(y)), 6, (40, 40, 40), -1)
+        for x, y in large:
+            cv2.ellipse(frame, (int(x), int(y)), (60, 30), 30, 0, 360, (60, 80, 60), -1)
+        writer.write(frame)
+        small = np.clip(small + small_velocity, 20, (width - 20, height - 20))
+        large = np.clip(large + large_velocity, 80, (width - 80, height - 80))
+    writer.release()
+    return video_path
+
+
+class MemorySampler(threading.Thread):
+    """
+    峰值内存采样(当前进程与所有子进程的常驻内存之和)
+    """
+    INTERVAL = 0.5  # 采样间隔(单位/秒)
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.peak_rss = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        process = psutil.Process()
+        while not self._stop_event.wait(self.INTERVAL):
+            rss = 0
+            for p in [process] + process.children(recursive=True):
+                try:
+                    rss += p.memory_info().rss
+                except psutil.Error:
+                    pass  # 进程已结束
+            self.peak_rss = max(self.peak_rss, rss)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+class PipelineBenchmark:
+    """
+    端到端流水线基准测试(yolo、DeepSORT、帧差法、数据管理、视频处理与数据保存)
+    """
+    HIGHER_IS_BETTER = ('fps',)  # 越大越好的指标, 其余指标越小越好
+
+    def __init__(self, output_dir, config=None):
+        """
+
+        :param output_dir: 输出目录
+        :param config: 流水线配置(None表示使用BENCHMARK_CONFIG)
+        """
+        self.output_dir = Path(output_dir)
+        self.config = dict(config or BENCHMARK_CONFIG)
+
+    def run(self, video_path):
+        """
+        运行一次基准测试
+        :param video_path: 视频路径
+        :return: 测试结果字典
+        """
+        video_path = Path(video_path)
+        video_output_dir = self.output_dir / video_path.name
+        if video_output_dir.exists():
+            shutil.rmtree(video_output_dir)  # 清除上次的输出, 保证输出大小准确
+        path_dir = PathDir(self.output_dir, video_path.name, str(video_path.parent))
+
+        sampler = MemorySampler()
+        sampler.start()
+        start_time = time.time()
+        scheduler = JobScheduler(self.config, max_jobs=1)
+        scheduler.add(path_dir)
+        finish_info = list(scheduler.run().values())[0]
+        wall_time = time.time() - start_time
+        sampler.stop()
+        if finish_info is None:
+            raise RuntimeError(f'{video_path.name} 流水线异常退出')
+
+        with open(path_dir.telemetry_path, 'r', encoding='utf-8') as f:
+            telemetry = json.loads(f.read())
+        stages = {}
+        for summary in telemetry['stages']:
+            frames = summary['frames']
+            stages[summary['stage']] = {
+                'frames': frames,
+                'fps': summary['fps'],
+                'busy_time': summary['busy_time'],
+                'idle_time': summary['idle_time'],
+                'busy_per_frame': round(summary['busy_time'] / frames, 6) if frames else 0,
+                'latency_p50': summary['latency']['p50'],
+                'latency_p90': summary['latency']['p90'],
+                'rss_bytes_max': summary['rss_bytes']['max'],
+            }
+        frames = stages['video_input']['frames']
+        detect_time = finish_info['detect_time']
+
+        return {
+            'video': video_path.name,
+            'frames': frames,
+            'detect_time': round(detect_time, 3),
+            'wall_time': round(wall_time, 3),
+            'fps': round(frames / detect_time, 3) if detect_time else 0,
+            'peak_rss_bytes': sampler.peak_rss,
+            'output_bytes': self.output_bytes(video_output_dir),
+            'stages': stages,
+            'config': self.config,
+        }
+
+    @staticmethod
+    def output_bytes(video_output_dir):
+        """
+        统计输出文件大小
+        :param video_output_dir: 视频输出目录
+        :return: {子目录名称: 字节数, 'total': 总字节数}
+        """
+        result = {'total': 0}
+        for root, _, files in os.walk(video_output_dir):
+            relative = Path(root).relative_to(video_output_dir).parts
+            key = relative[0] if relative else '.'
+            size = sum(os.path.getsize(os.path.join(root, file)) for file in files)
+            result[key] = result.get(key, 0) + size
+            result['total'] += size
+        return result
+
+    @classmethod
+    def compare(cls, result, baseline, tolerance):
+        """
+        与基准结果比较
+        :param result: 本次测试结果
+        :param baseline: 基准结果
+        :param tolerance: 允许的相对变化(如0.1表示10%)
+        :return: 性能回退信息列表
+        """
+        metrics = [('fps', result['fps'], baseline['fps']),
+                   ('peak_rss_bytes', result['peak_rss_bytes'], baseline['peak_rss_bytes'])]
+        for stage, values in result['stages'].items():
+            base_values = baseline['stages'].get(stage)
+            if base_values:
+                metrics.append((f'{stage}.busy_per_frame', values['busy_per_frame'], base_values['busy_per_frame']))
+
+        regressions = []
+        for name, value, base_value in metrics:
+            if not base_value:
+                continue
+            change = (value - base_value) / base_value
+            print(f'{name:<32} {base_value:>14} -> {value:<14} ({change:+.1%})')
+            if name.split('.')[-1] in cls.HIGHER_IS_BETTER:
+                regressed = change < -tolerance
+            else:
+                regressed = change > tolerance
+            if regressed:
+                regressions.append(f'{name}: {base_value} -> {value} ({change:+.1%})')
+
+        # 输出大小只做汇报(输出内容可能随功能变化)
+        base_bytes, output_bytes = baseline['output_bytes']['total'], result['output_bytes']['total']
+        print(f'{"output_bytes":<32} {base_bytes:>14} -> {output_bytes}')
+        return regressions
+
+
+class DifferParity:
+    """
+    帧差法核心一致性检查
+        fixture: 与仓库中的参考数据比较(FIXTURE_PATH, 由优化前的frame_differ录制, 不依赖视频解码)
+        run: 在视频上与旧版核心的重新实现(reference_boxes)逐帧比较, 同时统计耗时
+    """
+    # 参考数据: deltas为逐帧差分编码的灰度帧序列(uint8回绕相加还原), 相邻两帧作为一次输入;
+    # counts为每次输入的检测结果数量, points为依次拼接的检测结果(中心点x, 中心点y, 面积);
+    # 录制时屏幕噪点列表为空(噪点过滤已由噪点掩膜替代, 掩膜未标定时不过滤)
+    FIXTURE_PATH = Path(__file__).resolve().parent / 'input' / 'benchmark' / 'differ_parity.npz'
+
+    @classmethod
+    def fixture(cls, fixture_path=FIXTURE_PATH):
+        """
+        与参考数据逐次比较检测结果
+        :param fixture_path: 参考数据路径
+        :return: 比较结果字典(mismatch_frames为结果不一致的输入序号)
+        """
+        data = np.load(fixture_path)
+        frames = np.cumsum(data['deltas'], axis=0, dtype=np.uint8)
+        offsets = np.concatenate([[0], np.cumsum(data['counts'])])
+        detector = FrameDifferDetector()
+        result = {'fixture': Path(fixture_path).name, 'frames': len(frames) - 1, 'mismatch_frames': []}
+        for index in range(len(frames) - 1):
+            points = detector.frame_differ(frames[index], frames[index + 1])
+            expected = [tuple(point) for point in data['points'][offsets[index]:offsets[index + 1]].tolist()]
+            if points != expected:
+                result['mismatch_frames'].append(index)
+        result['mismatches'] = len(result['mismatch_frames'])
+        return result
+
+    @staticmethod
+    def reference_boxes(per_frame_gary, frame_gary):
+        """
+        旧版帧差法核心(完整排序求中位数, 浮点腐蚀核, 3x3膨胀10次, 每帧重新分配内存)
+        :param per_frame_gary: 前一帧
+        :param frame_gary: 当前帧
+        :return: 运动区域的外接矩形列表[(x1, y1, x2, y2)]
+        """
+        diff = cv2.absdiff(per_frame_gary, frame_gary)
+        if np.median(diff) > FrameDifferDetector.MEDIAN_LIMIT:
+            return []
+        diff = cv2.GaussianBlur(diff, (5, 5), 0)
+        _, binary = cv2.threshold(diff, 20, 255, cv2.THRESH_BINARY)
+        binary = cv2.morphologyEx(binary, cv2.MORPH_ERODE, np.ones((3, 3), np.float64))
+        binary = cv2.morphologyEx(binary, cv2.MORPH_DILATE, np.ones((3, 3), np.uint8), iterations=10)
+        cnts, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        if len(cnts) >= 20:
+            return []
+        return [(x, y, x + w, y + h) for x, y, w, h in map(cv2.boundingRect, cnts)]
+
+    @classmethod
+    def run(cls, video_path, max_frames=None):
+        """
+        逐帧比较检测结果(帧间先按位移矢量对齐, 与流水线一致)
+        :param video_path: 视频路径
+        :param max_frames: 最多比较的帧数(None表示全部)
+        :return: 比较结果字典
+        """
+        detector, pyramid_detector = FrameDifferDetector(), FrameDifferDetector(pyramid=True)
+        result = {'video': Path(video_path).name, 'frames': 0, 'mismatches': 0, 'pyramid_mismatches': 0,
+                  'reference_time': 0.0, 'kernel_time': 0.0, 'pyramid_time': 0.0}
+        capture = cv2.VideoCapture(str(video_path))
+        motion_estimator = MotionEstimator()
+        while max_frames is None or result['frames'] < max_frames:
+            ret, frame = capture.read()
+            if not ret:
+                break
+            translation, img1, img2 = motion_estimator.estimate(frame)
+            if len(translation) == 0:
+                continue
+
+            # 先运行优化后的核心(标定中的噪点掩膜在核心中更新, 两者使用同一个掩膜过滤)
+            start_time = time.time()
+            points = detector.frame_differ(img1, img2, translation)
+            result['kernel_time'] += time.time() - start_time
+            start_time = time.time()
+            reference = detector.locate(cls.reference_boxes(img1, img2))
+            result['reference_time'] += time.time() - start_time
+            start_time = time.time()
+            pyramid_points = pyramid_detector.frame_differ(img1, img2, translation)
+            result['pyramid_time'] += time.time() - start_time
+
+            result['frames'] += 1
+            result['mismatches'] += points != reference
+            result['pyramid_mismatches'] += pyramid_points != reference
+        capture.release()
+        for key in ('reference_time', 'kernel_time', 'pyramid_time'):
+            result[key] = round(result[key], 3)
+        return result
+
+
+def parse_opt():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--video', type=str, default=None, help='video path, a synthetic clip is used if not given')
+    parser.add_argument('--synthetic-frames', type=int, default=300, help='frames of the synthetic clip')
+    parser.add_argument('--output', type=str, default='./output/benchmark', help='benchmark output directory')
+    parser.add_argument('--baseline', type=str, default='./output/benchmark/baseline.json', help='baseline json path')
+    parser.add_argument('--save-baseline', action='store_true', help='save this run as the baseline')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='allowed relative regression')
+    parser.add_argument('--differ-parity', action='store_true', help='only check the frame differ kernel parity, exit 1 on mismatch')
+    return parser.parse_args()
+
+
+def main(opt):
+    torch.multiprocessing.set_start_method('spawn', force=True)
+    output_dir = Path(opt.output)
+    os.makedirs(output_dir, exist_ok=True)
+
+    video_path = opt.video
+    if video_path is None:
+        input_dir = output_dir / 'input'
+        os.makedirs(input_dir, exist_ok=True)
+        video_path = make_synthetic_clip(input_dir / 'synthetic.mp4', opt.synthetic_frames)
+
+    if opt.differ_parity:
+        # 参考数据与视频上的比较都需要一致(半分辨率模式的差异只做汇报)
+        fixture = DifferParity.fixture()
+        parity = DifferParity.run(video_path)
+        print(json.dumps({'fixture': fixture, 'video': parity}, indent=2))
+        return 1 if fixture['mismatches'] or parity['mismatches'] else 0
+
+    benchmark = PipelineBenchmark(output_dir / 'runs')
+    result = benchmark.run(video_path)
+    print(f"{result['video']}: {result['frames']}帧, {result['fps']}帧/秒, 峰值内存 {result['peak_rss_bytes']}字节, "
+          f"输出 {result['output_bytes']['total']}字节")
+    with open(output_dir / 'result.json', 'w', encoding='utf-8') as f:
+        f.write(json.dumps(result, indent=2))
+
+    if opt.save_baseline:
+        with open(opt.baseline, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(result, indent=2))
+        print(f'基准结果已保存: {opt.baseline}')
+        return 0
+    if not os.path.exists(opt.baseline):
+        print(f'基准结果不存在: {opt.baseline}, 使用 --save-baseline 保存')
+        return 0
+
+    with open(opt.baseline, 'r', encoding='utf-8') as f:
+        baseline = json.loads(f.read())
+    regressions = PipelineBenchmark.compare(result, baseline, opt.tolerance)
+    if regressions:
+        print('性能回退:')
+        for regression in regressions:
+            print(f'  {regression}')
+        return 1
+    print('未发现性能回退')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(parse_opt()))
@@ -1,13 +1,15 @@
 import math
-from copy import deepcopy
-from tools.real_time_speed import linear_velocity, angular_velocity
+import numpy as np
+from tools.track_history import TrackHistory
+from tools.real_time_speed import linear_velocity, angular_velocity, speed_and_distance
+from tools.drawer import TrackSnapshot
 
 
 class AbstractBug:
     """
     大虫子预测信息
     """
-    SURVIVAL_TIME = 200  # 信息存在时间(单位/帧)
+    SURVIVAL_TIME = 200  # 信息存在时间(单位/读取到的帧, 抽帧步长为stride时对应stride倍的原视频帧; 由AbstractBugManager按出现的第一帧统一计算)
     SCREENSHOT_SAVE_TIME = 30  # 大虫子截图保存时间 min(SCREENSHOT_SAVE_TIME, 最后被检测到的一帧)
 
     def __init__(self, frame_index, track_id):
@@ -20,50 +22,46 @@ class AbstractBug:
         self.first_frame = frame_index  # 出现的第一帧
         self.first_frame = f'{self.first_frame}(id: {self.track_id})'
         self.screenshot = None  # 截图
-        self.bbox_list = []  # 预测框信息
-        self.detection_sequence = []  # 检测序列
         self.cls_dict = {}  # 类别字典
-        self.bug_nums_list = []  # 聚簇数量
-        self.survival_time = self.SURVIVAL_TIME  # 信息存在时间(单位/帧)
-        self.blurry_list = []  # 模糊度列表
-        self.center_point_list = []  # 中心点列表(跟随位移矢量更新)
-        self.trajectory_list = []  # 大虫子最终轨迹
+        # 每帧的信息: 预测框, 是否被检测到, 是否模糊
+        self.frames = TrackHistory({'bbox': (4, np.int64), 'detected': (0, np.int8), 'blurry': (0, np.bool_)})
+        # 每次被检测到的信息: 中心点(载物台坐标, 屏幕坐标 = 载物台坐标 + 累计位移), 聚簇数量
+        self.detections = TrackHistory({'point': (2, np.float64), 'bug_nums': (0, np.int64)})
+        self.trajectory_offset = (0, 0)  # 最后一次被检测到时的累计位移
 
-    def update(self, bbox=None, cls=None, blurry=None, bug_nums=None, translation=None):
+    def update(self, bbox, point, cls, bug_nums, blurry=False, offset=(0, 0)):
         """
-        更新大虫子信息
+        添加一次检测信息(已有的点不随位移矢量改写, 每次O(1))
         :param bbox: 预测框信息
+        :param point: 预测框中心点(载物台坐标, 由AbstractBugManager批量计算)
         :param cls: 类别
         :param bug_nums: 聚簇数量
         :param blurry: 是否模糊
-        :param translation: 位移矢量
+        :param offset: 累计位移(由AbstractBugManager维护)
         :return: None
         """
-        self.survival_time -= 1  # 存在时间减一
-        # 添加各种信息
-        self.blurry_list.append(blurry)  # 当前帧的模糊度
-        self._update_translation(translation)
-
-        if bbox:
-            self.detection_sequence.append(1)  # 是否被检测到
-            self.bbox_list.append(bbox)
-            if cls not in self.cls_dict:
-                self.cls_dict[cls] = 0
-            self.cls_dict[cls] += 1
-            self.bug_nums_list.append(bug_nums)
-            x1, y1, x2, y2 = bbox
-            self.center_point_list.append(((x1 + x2) / 2, (y1 + y2) / 2))
-            self.trajectory_list = deepcopy(self.center_point_list)
-        else:
-            self.detection_sequence.append(0)  # 是否被检测到
-            self.bbox_list.append(self.bbox_list[-1])
+        self.frames.append(bbox=bbox, detected=1, blurry=bool(blurry))
+        if cls not in self.cls_dict:
+            self.cls_dict[cls] = 0
+        self.cls_dict[cls] += 1
+        self.detections.append(point=point, bug_nums=bug_nums)
+        self.trajectory_offset = offset
+
+    def miss(self, blurry_flags):
+        """
+        批量添加未被检测到的帧(沿用最后的预测框, 只在再次被检测到时补齐, 最后一次被检测到之后的帧不会添加)
+        :param blurry_flags: 这些帧是否模糊
+        :return: None
+        """
+        if len(blurry_flags):
+            self.frames.extend(len(blurry_flags), bbox=self.frames.last('bbox'), detected=0, blurry=blurry_flags)
 
     def is_update_screenshot(self):
         """
         是否更新大虫子截图
         :return: 是否更新(True: 更新, False: 不更新)
         """
-        is_update = True if sum(self.detection_sequence) <= self.SCREENSHOT_SAVE_TIME else False
+        is_update = True if len(self.detections) <= self.SCREENSHOT_SAVE_TIME else False
 
         return is_update
 
@@ -75,24 +73,45 @@ class AbstractBug:
         """
         self.screenshot = screenshot
 
-    def alive(self):
+    @property
+    def bbox_list(self):
+        """
+        预测框信息
+        :return: 预测框列表
+        """
+        return self.frames.column('bbox').tolist()
+
+    @property
+    def detection_sequence(self):
         """
-        大虫子信息是否存在(移出屏幕)
-        :return: 是否存在(存在为True,不存在为False)
+        检测序列
+        :return: 检测序列列表(1: 被检测到, 0: 未被检测到)
         """
+        return self.frames.column('detected').tolist()
 
-        is_alive = True if self.survival_time > 0 else False
-        if not is_alive:
-            while self.detection_sequence[-1] == 0:
-                self.detection_sequence.pop()
+    @property
+    def blurry_list(self):
+        """
+        模糊度列表
+        :return: 每帧是否模糊的列表
+        """
+        return self.frames.column('blurry').tolist()
 
-            length = len(self.detection_sequence)
-            self.bbox_list = self.bbox_list[:length]
-            self.blurry_list = self.blurry_list[:length]
-            self.center_point_list = self.center_point_list[:length]
-            self.trajectory_list = self.trajectory_list[:length]
+    @property
+    def center_point_list(self):
+        """
+        中心点(载物台坐标)
+        :return: (n, 2)数组视图
+        """
+        return self.detections.column('point')
 
-        return is_alive
+    @property
+    def trajectory_list(self):
+        """
+        大虫子最终轨迹(最后一次被检测到时的屏幕坐标, 读取时计算)
+        :return: (n, 2)数组
+        """
+        return self.center_point_list + self.trajectory_offset
 
     def cls(self):
         """
@@ -109,7 +128,7 @@ class AbstractBug:
         :return: 实时移动速度v1
         """
 
-        v1 = linear_velocity(self.trajectory_list)
+        v1 = linear_velocity(self.center_point_list)  # 速度与坐标系平移无关, 直接使用载物台坐标
         return v1
 
     def angular_velocity(self):
@@ -118,26 +137,25 @@ class AbstractBug:
         :return: 实时移动速度w1
         """
 
-        w1 = angular_velocity(self.trajectory_list)
+        w1 = angular_velocity(self.center_point_list)
         return w1
 
+    def snapshot(self):
+        """
+        显示快照接口
+        :return: 显示快照
+        """
+        bbox = tuple(self.frames.last('bbox').tolist())
+        return TrackSnapshot(self.cls(), self.track_id, bool(self.frames.last('detected')), bbox, (),
+                             self.linear_velocity(), self.angular_velocity())
+
     def speed_and_distance_data(self):
         """
         绘制平均速度与路程图像的数据接口
         :return: (速度列表，路程列表)
         """
 
-        speed_list, distance_list = [], []
-        for i in range(1, len(self.trajectory_list)):
-            point1, point2 = self.trajectory_list[i - 1], self.trajectory_list[i]
-            distance = math.sqrt((point1[0] - point2[0]) ** 2 + (point1[1] - point2[1]) ** 2)
-            if len(distance_list) > 0:
-                distance_list.append(distance_list[-1] + distance)
-            else:
-                distance_list.append(distance)
-            speed = distance_list[-1] / i
-            speed_list.append(speed)
-        return speed_list, distance_list
+        return speed_and_distance(self.center_point_list)
 
     def transfer(self):
         """
@@ -148,22 +166,12 @@ class AbstractBug:
         return [self.first_frame, self.screenshot, self._bug_number(), self.bbox_list, self.detection_sequence,
                 self.trajectory_list]
 
-    def _update_translation(self, translation):
-        """
-        使用位移矢量更新数据点
-        :param translation: 位移矢量
-        :return: None
-        """
-        if translation:
-            for i in range(len(self.center_point_list)):
-                self.center_point_list[i] = (int(self.center_point_list[i][0] + translation[0]),
-                                             int(self.center_point_list[i][1] + translation[1]))
-
     def _bug_number(self):
         """
         计算大虫子聚簇数量
         :return: 大虫子聚簇数量
         """
 
-        bug_number = math.ceil(sum(self.bug_nums_list) / len(self.bug_nums_list))
+        bug_nums = self.detections.column('bug_nums')
+        bug_number = math.ceil(int(bug_nums.sum()) / len(bug_nums))
         return bug_number
@@ -1,4 +1,6 @@
-from copy import deepcopy
+import heapq
+import numpy as np
+from tools.track_history import TrackHistory
 from .abstract_bug import AbstractBug
 
 
@@ -7,10 +9,19 @@ class AbstractBugManager:
     初步检测到的大虫子信息管理
     """
     NAMES = {0: 'Gs', 1: 'Mo', 2: 'Do', 3: 'Eu', 4: 'Ne', 5: 'Ar'}  # 微生物类别与名称映射（如果增加新的类别需要修改）
+    FREE = np.iinfo(np.int64).max  # 空闲槽位的出现步数(永不过期)
 
     def __init__(self):
-        self.bug_dict = {}  # 所有的初级微生物信息
+        # 追踪id -> 槽位, 槽位 -> 微生物; 每个槽位在数组中记录出现的步数与最后一次添加信息的步数(步数为update的调用次数)
+        self.slot_dict = {}
+        self._bugs = []  # 所有的初级微生物信息(按槽位)
+        self._birth_steps = np.empty(0, dtype=np.int64)
+        self._last_steps = np.empty(0, dtype=np.int64)
+        self._free_slots = []  # 空闲槽位(最小堆, 同一步内按出现顺序分配递增的槽位)
+        self._step = -1
+        self._blurry_history = TrackHistory({'blurry': (0, np.bool_)})  # 每一步是否模糊(未被检测到的帧批量补齐时使用)
         self._display_list = []  # 当前需要显示的微生物信息
+        self.offset = (0, 0)  # 累计位移(所有微生物的轨迹以载物台坐标保存, 屏幕坐标 = 载物台坐标 + 累计位移)
 
     @classmethod
     def _cls_to_english_name(cls, bug_cls):
@@ -22,56 +33,97 @@ class AbstractBugManager:
         english_name = cls.NAMES.get(int(bug_cls))
         return english_name
 
+    def _allocate(self, frame_index, track_id):
+        """
+        为新被检测到的微生物分配槽位
+        :param frame_index: 帧数
+        :param track_id: 追踪id
+        :return: 槽位
+        """
+        if self._free_slots:
+            slot = heapq.heappop(self._free_slots)
+            self._bugs[slot] = AbstractBug(frame_index, track_id)
+        else:
+            slot = len(self._bugs)
+            self._bugs.append(AbstractBug(frame_index, track_id))
+            if slot == len(self._birth_steps):
+                capacity = max(16, 2 * slot)
+                self._birth_steps = np.resize(self._birth_steps, capacity)
+                self._birth_steps[slot:] = self.FREE
+                self._last_steps = np.resize(self._last_steps, capacity)
+        self._birth_steps[slot] = self._step
+        self._last_steps[slot] = self._step - 1
+        self.slot_dict[track_id] = slot
+        return slot
+
     def update(self, frame_index, frame, outputs, others, blurry, translation=None):
         """
+        更新所有微生物的信息(检测结果一次向量化处理, 每次O(检测数量));
+        未被检测到的微生物只随位移矢量平移, 由累计位移统一表示, 缺失的帧在再次被检测到时批量补齐
 
         :param frame_index: 帧数
         :param frame: 当前帧图象
         :param outputs: 检测结果信息, outputs中的每一项：(x1, y1, x2, y2, track_id)
         :param others:  与检测对应的其他信息
-        :param blurry:  当前帧是否模糊
+        :param blurry:  当前帧是否模糊(模糊帧跳过检测, outputs为空, 所有微生物只按位移矢量更新)
         :param translation: 位移矢量
         :return: None
         """
-        boundary_boxs, track_ids, clss, bug_nums_list = self._parse_message(outputs, others)
+        self._step += 1
+        self._blurry_history.append(blurry=bool(blurry))
         self._display_list.clear()
+        if translation:
+            self.offset = (self.offset[0] + translation[0], self.offset[1] + translation[1])
+
+        boundary_boxs, track_ids, clss, bug_nums_list = self._parse_message(outputs, others)
+        if not len(track_ids):
+            return
+        # 中心点(载物台坐标)
+        points = (boundary_boxs[:, :2] + boundary_boxs[:, 2:]) / 2 - self.offset
+
+        slots = np.array([self.slot_dict.get(track_id, -1) for track_id in track_ids.tolist()], dtype=np.int64)
+        for index in np.flatnonzero(slots < 0).tolist():
+            slots[index] = self._allocate(frame_index, int(track_ids[index]))  # 添加新被检测到的微生物
 
-        # 添加新出现的微生物
-        for track_id, bug_id in enumerate(track_ids):
-            if bug_id not in self.bug_dict:
-                self.bug_dict[bug_id] = AbstractBug(frame_index, bug_id)  # 添加新被检测到的微生物
+        # 补齐上次添加信息之后未被检测到的帧
+        starts = self._last_steps[slots] + 1
+        blurry_column = self._blurry_history.column('blurry')
+        for index in np.flatnonzero(starts < self._step).tolist():
+            self._bugs[slots[index]].miss(blurry_column[starts[index]:self._step])
+        self._last_steps[slots] = self._step
 
-        # 更新所有检测到的微生物的信息
-        for bug_id, bug in self.bug_dict.items():
-            if bug_id in track_ids:
-                track_id = track_ids.index(bug_id)
-                if bug.is_update_screenshot():
-                    screenshot = deepcopy(frame[boundary_boxs[track_id][1]:boundary_boxs[track_id][3],
-                                          boundary_boxs[track_id][0]:boundary_boxs[track_id][2]])
-                    bug.update_screenshot(screenshot)
-                bbox, cls, bug_nums = boundary_boxs[track_id], clss[track_id], bug_nums_list[track_id]
-                bug.update(bbox, cls, bug_nums, blurry, translation)
-                self._display_list.append(bug)
-            else:
-                bug.update(translation=translation)
+        # 更新所有检测到的微生物的信息(按出现顺序显示)
+        order = np.lexsort((slots, self._birth_steps[slots]))
+        for index in order.tolist():
+            bug = self._bugs[slots[index]]
+            bbox = boundary_boxs[index]
+            if bug.is_update_screenshot():
+                bug.update_screenshot(frame[bbox[1]:bbox[3], bbox[0]:bbox[2]].copy())
+            bug.update(bbox, points[index], clss[index], bug_nums_list[index], blurry=blurry, offset=self.offset)
+            self._display_list.append(bug)
 
     def clear(self):
         """
-        清理过期的大虫子信息
+        清理过期的大虫子信息(出现之后SURVIVAL_TIME步过期, 最后一次被检测到之后的帧不保存)
         :return: 储存过期的大虫子的列表
         """
+        expired = np.flatnonzero(self._birth_steps <= self._step + 1 - AbstractBug.SURVIVAL_TIME)
         clear_list = []
-        for key, bug in list(self.bug_dict.items()):
-            if not bug.alive():
-                clear_list.append(self.bug_dict.pop(key))
+        for slot in expired[np.argsort(self._birth_steps[expired], kind='stable')].tolist():
+            bug = self._bugs[slot]
+            del self.slot_dict[bug.track_id]
+            self._bugs[slot] = None
+            self._birth_steps[slot] = self.FREE
+            heapq.heappush(self._free_slots, slot)
+            clear_list.append(bug)
         return clear_list
 
     def display_tracks(self):
         """
         需要显示的大虫子
-        :return:
+        :return: 大虫子显示快照列表
         """
-        display_tracks = deepcopy(self._display_list)
+        display_tracks = [bug.snapshot() for bug in self._display_list]
         return display_tracks
 
     def _parse_message(self, outputs, others):
@@ -79,8 +131,10 @@ class AbstractBugManager:
         预测信息解析
         :param outputs: yolo预测信息
         :param others: 其他信息(类别, 聚簇数量)
-        :return: 预测框列表, 追踪id列表, 类别列表, 聚簇数量列表
+        :return: 预测框数组(n, 4), 追踪id数组, 类别列表, 聚簇数量列表
         """
-        boundary_box_list, track_id_list, cls_list, bug_nums_list = outputs[:, :4].tolist(), outputs[:, 4].tolist(), [
-            self._cls_to_english_name(other.cls) for other in others], [other.bug_nums for other in others]
-        return boundary_box_list, track_id_list, cls_list, bug_nums_list
+        outputs = np.asarray(outputs, dtype=np.int64).reshape(-1, 5)
+        boundary_boxs, track_ids = outputs[:, :4], outputs[:, 4]
+        cls_list = [self._cls_to_english_name(other.cls) for other in others]
+        bug_nums_list = [other.bug_nums for other in others]
+        return boundary_boxs, track_ids, cls_list, bug_nums_list
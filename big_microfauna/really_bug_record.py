@@ -3,8 +3,37 @@ from writer.write_to_others import (DrawBigProtozoaImage, DrawArColorImage, Draw
                                     SaveText)
 
 
+class BugRecordResult:
+    """
+    微生物记录结果(数据管理进程结束时一次性交给主进程, 供JSONWriter与ExcelWriter使用)
+    """
+
+    def __init__(self, video_path, fps, frames, bug_numbers, bug_dead_or_live, bug_record, gs_area_list,
+                 ar_colors_list, skipped_frames=None):
+        """
+
+        :param video_path: 视频名称
+        :param fps: 帧率
+        :param frames: 视频总帧数
+        :param bug_numbers: 各类微生物数量
+        :param bug_dead_or_live: 大虫子死活数量
+        :param bug_record: 微生物各项数据
+        :param gs_area_list: Gs面积列表
+        :param ar_colors_list: Ar颜色图片路径列表
+        :param skipped_frames: 模糊跳过检测的帧数列表
+        """
+        self.video_path, self.fps, self.frames = video_path, fps, frames
+        self.bug_numbers = bug_numbers
+        self.bug_dead_or_live = bug_dead_or_live
+        self.bug_record = bug_record
+        self.gs_area_list = gs_area_list
+        self.ar_colors_list = ar_colors_list
+        self.skipped_frames = skipped_frames or []
+
+
 class ReallyBugRecord:
     BUG_NAMES = ['Gs', 'Mo', 'Do', 'Eu', 'Ne', 'Ar', 'SmallProtozoa']
+    RECORD_NAMES = ['Ar', 'Do', 'Mo', 'Ne', 'Eu', 'Gs', 'SmallProtozoa']  # 数据记录顺序(与表格列顺序一致)
 
     def __init__(self, path_dir, video_name, fps, frames):
         """
@@ -21,10 +50,11 @@ class ReallyBugRecord:
         # 微生物与对应实体类的映射列表
         self.class_map = {'Ar': Ar, "Do": Do, 'Mo': Mo, 'Ne': Ne, 'Eu': Eu, 'Gs': Gs, 'SmallProtozoa': SmallProtozoa}
 
-        self.bug_dead_or_live = None
-        self.bug_record = None
-        self.gs_area_list = None
-        self.ar_colors_list = None
+        # 数据储存对象(默认在数据管理进程中本地累计, 通过set_*替换为Manager代理对象后可在其他进程实时查看)
+        self.bug_dead_or_live = {name: {'die': 0, 'live': 0} for name in self.RECORD_NAMES[:5]}
+        self.bug_record = {name: [] for name in self.RECORD_NAMES}
+        self.gs_area_list = []
+        self.ar_colors_list = []
 
         self.video_path, self.fps, self.frames = video_name, fps, frames
         self.draw_speed_distance = DrawSpeedAndDistance(self.path_dir.speed_distance_picture_dir)
@@ -105,3 +135,13 @@ class ReallyBugRecord:
         :return:
         """
         self.ar_colors_list = ar_colors_list
+
+    def result(self):
+        """
+        生成记录结果(代理对象会一次性复制为本地数据)
+        :return: 微生物记录结果
+        """
+        bug_dead_or_live = {name: dict(alive) for name, alive in self.bug_dead_or_live.items()}
+        bug_record = {name: list(bug_list) for name, bug_list in self.bug_record.items()}
+        return BugRecordResult(self.video_path, self.fps, self.frames, dict(self.bug_numbers), bug_dead_or_live,
+                               bug_record, list(self.gs_area_list), list(self.ar_colors_list))
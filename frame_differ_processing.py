@@ -1,68 +1,67 @@
+import time
+from collections import deque
 from small_protozoa.small_protozoa_detect import FrameDifferDetector
-from multiprocessing import Lock
+from stage_processing import StageProcessing
 
-lock = Lock()
 
-
-class FrameDifferProcessing:
+class FrameDifferProcessing(StageProcessing):
     """
     小虫子检测进程
     """
+    SIGN_NAME = 'frame_detect_sign'
 
-    def __init__(self, sign_dict, frame_input_queue, frame_result_queue):
+    def __init__(self, sign_dict, frame_ring, frame_input_queue, frame_result_queue):
         """
 
         :param sign_dict: 进程通信标记
+        :param frame_ring: 共享内存帧缓冲区
         :param frame_input_queue: 帧差法输入队列
         :param frame_result_queue: 帧差法结果队列
         """
-        self.sign_dict = sign_dict
+        super().__init__(sign_dict)
+        self.frame_ring = frame_ring
         self.frame_input_queue = frame_input_queue
         self.frame_result_queue = frame_result_queue
-        self.frame_input_list = []
+        self.frame_input_list = deque()
+        self.pyramid = False  # 是否在半分辨率图像上做帧差法
+        self.noise_mask_path = None  # 屏幕噪点掩膜缓存文件路径
 
-    def start(self):
+    def set_pyramid(self, pyramid):
         """
-        开始进程
-        :return:
+        设置帧差法是否使用半分辨率模式
+        :param pyramid: 是否使用半分辨率模式
+        :return: None
         """
-        small_protozoa_detect = FrameDifferDetector()
-        while not self.sign_dict['frame_detect_sign']:
-            self._get_data()
-            # try:
-            if len(self.frame_input_list) > 0:
-                frame_index, frame, blurry, blurry_text, outputs, others = self.frame_input_list.pop(0)
-                # 检测
-                result = small_protozoa_detect.detect(blurry, frame_index, frame, outputs)
-                self._set_result_queue((*result, blurry, blurry_text))
-            else:
-                if not self.sign_dict['yolo_detect_sign']:
-                    continue
-                else:
-                    break
-            # except:
-            #     print('帧差法检测器出了一些问题，但是没有影响。')
-        lock.acquire()
-        self.sign_dict['frame_detect_sign'] = True
-        print('frame differ finish')
-        lock.release()
+        self.pyramid = pyramid
 
-    def _get_data(self):
+    def set_noise_mask_path(self, noise_mask_path):
         """
-        获取输入数据
-        :return:
+        设置屏幕噪点掩膜缓存文件路径(同一台显微镜的视频共用, None表示每个视频单独标定)
+        :param noise_mask_path: 缓存文件路径
+        :return: None
         """
-        lock.acquire()
-        if not self.frame_input_queue.empty():
-            self.frame_input_list.append(self.frame_input_queue.get())
-        lock.release()
+        self.noise_mask_path = noise_mask_path
 
-    def _set_result_queue(self, result):
+    def start(self):
         """
-        向帧差法结果队列放入数据
-        :param result: 需要放入的数据
+        开始进程
         :return:
         """
-        lock.acquire()
-        self.frame_result_queue.put(result)
-        lock.release()
+        small_protozoa_detect = FrameDifferDetector(self.pyramid, self.noise_mask_path)
+        self.telemetry.start(frame_input=self.frame_input_queue)
+        finished = False
+        while not finished:
+            finished = self._get_data(self.frame_input_queue, self.frame_input_list)
+            while len(self.frame_input_list) > 0:
+                start_time = time.time()
+                frame_index, slot, blurry, blurry_text, outputs, others, translation = self.frame_input_list.popleft()
+                # 检测(位移矢量由位移矢量进程计算)
+                result = small_protozoa_detect.detect(blurry, frame_index, self.frame_ring.get(slot), outputs,
+                                                      translation)
+                frame_index, *result = result
+                self.frame_result_queue.put((frame_index, slot, *result, blurry, blurry_text))
+                self.telemetry.record(time.time() - start_time)
+
+        # 通知下游并更改完成标志
+        self._finish(self.frame_result_queue)
+        print('frame differ finish')
@@ -0,0 +1,123 @@
+import queue
+from multiprocessing import Process, Queue
+import psutil
+from video.video_reader import VideoReader
+from video_pipeline import VideoPipeline
+
+
+class JobScheduler:
+    """
+    多视频任务调度器
+    按视频总帧数从长到短排序, 在CPU与内存预算内同时运行多个视频流水线, 并汇报每个视频的进度与完成情况
+    """
+    PROCESSES_PER_JOB = 6  # 每个视频流水线的进程数(输入、位移矢量、yolo、帧差法、数据管理、视频处理)
+    JOB_BASE_MEMORY = 2 * 1024 ** 3  # 每个视频流水线除帧缓冲区以外的内存估计(模型、进程等, 单位/字节)
+    POLL_TIMEOUT = 1  # 等待进度信息的超时时间(单位/秒)
+
+    def __init__(self, config, max_jobs=None, cpu_budget=None, memory_budget=None):
+        """
+
+        :param config: 流水线配置(见VideoPipeline)
+        :param max_jobs: 最大同时运行的视频数量(None表示只受预算限制)
+        :param cpu_budget: 可使用的CPU核数(None表示全部核数)
+        :param memory_budget: 可使用的内存(单位/字节, None表示当前可用内存)
+        """
+        VideoPipeline.check_ring_slots(config['ring_slots'], config['yolo_batch_size'])  # 创建任务进程前检查配置
+        self.config = config
+        self.max_jobs = max_jobs
+        self.cpu_budget = cpu_budget or psutil.cpu_count()
+        self.memory_budget = memory_budget or psutil.virtual_memory().available
+        self.progress_queue = Queue()
+        self.results = {}  # 任务编号: 完成信息(None表示任务异常退出)
+        self._jobs = []  # (总帧数, 内存估计, 路径对象)
+        self._totals = {}  # 任务编号: 视频总帧数
+
+    def add(self, path_dir):
+        """
+        添加视频任务
+        :param path_dir: 路径管理器对象
+        :return: None
+        """
+        video_reader = VideoReader(path_dir.video_input_path)
+        frame_bytes = video_reader.width * video_reader.height * 3
+        memory = self.config['ring_slots'] * frame_bytes + self.JOB_BASE_MEMORY
+        self._jobs.append((video_reader.total_frames, memory, path_dir))
+        video_reader.release()
+
+    def concurrency(self):
+        """
+        CPU预算允许同时运行的视频数量
+        :return: 视频数量
+        """
+        jobs = max(1, self.cpu_budget // self.PROCESSES_PER_JOB)
+        if self.max_jobs:
+            jobs = min(jobs, self.max_jobs)
+        return jobs
+
+    def run(self):
+        """
+        运行所有视频任务直到全部完成
+        :return: 任务完成信息字典
+        """
+        pending = sorted(self._jobs, key=lambda job: job[0], reverse=True)  # 最长的视频优先
+        max_running = self.concurrency()
+        job_config = dict(self.config)
+        if job_config.get('torch_threads') is None:
+            job_config['torch_threads'] = max(1, self.cpu_budget // max_running)
+        print(f'共{len(pending)}个视频, 同时运行{max_running}个')
+
+        running = {}  # 任务编号: (进程, 内存估计)
+        task_id = 0
+        while pending or running:
+            # 在预算内启动新任务(至少保证一个任务运行)
+            while pending and len(running) < max_running:
+                total_frames, memory, path_dir = pending[0]
+                used_memory = sum(job_memory for _, job_memory in running.values())
+                if running and used_memory + memory > self.memory_budget:
+                    break
+                pending.pop(0)
+                task_id += 1
+                pipeline = VideoPipeline(task_id, path_dir, job_config, self.progress_queue)
+                p = Process(target=pipeline.start)
+                p.start()
+                running[task_id] = (p, memory)
+
+            self._poll_progress(self.POLL_TIMEOUT)
+
+            # 回收已结束的任务
+            finished = [job_id for job_id, (p, _) in running.items() if not p.is_alive()]
+            if finished:
+                self._poll_progress(0)
+            for job_id in finished:
+                p, _ = running.pop(job_id)
+                p.join()
+                if job_id not in self.results:
+                    self.results[job_id] = None
+                    print(f'任务{job_id} 异常退出(exitcode: {p.exitcode})')
+
+        return self.results
+
+    def _poll_progress(self, timeout):
+        """
+        读取并汇报进度信息
+        :param timeout: 等待第一条信息的超时时间(单位/秒)
+        :return: None
+        """
+        try:
+            message = self.progress_queue.get(timeout=timeout) if timeout else self.progress_queue.get_nowait()
+        except queue.Empty:
+            return
+        while True:
+            event, task_id, video_name, info = message
+            if event == 'start':
+                self._totals[task_id] = info
+                print(f'任务{task_id} {video_name} 开始, 总帧数: {info}')
+            elif event == 'progress':
+                print(f'任务{task_id} {video_name} 已经输入第 {info} 帧 / {self._totals.get(task_id)}')
+            elif event == 'finish':
+                self.results[task_id] = info
+                print(f'任务{task_id} {video_name} 完成, 检测时间: {info["detect_time"]:.1f}s')
+            try:
+                message = self.progress_queue.get_nowait()
+            except queue.Empty:
+                return
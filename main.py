@@ -1,54 +1,51 @@
 import multiprocessing
 import signal
 from pathlib import Path
-from multiprocessing import Process, Queue, Lock
-from video.video_reader import VideoReader
-from video.images_video import images_to_video_recursive
+from multiprocessing import Process, Queue
 from video_processing import VideoProcessing
+from video.video_handle import OutputPolicy
 from yolo_processing import YoloProcessing
-from tools.blur_detector import BlueDetector
+from motion_processing import MotionProcessing
 from tools.path_manager import PathManager, PathDir
-from tools.frame_set import frame_set
+from tools.frame_ring import FrameRing
 from frame_differ_processing import FrameDifferProcessing
 from manager_processing import ManagerProcessing
 from big_microfauna.really_bug_record import ReallyBugRecord
-from writer.write_to_execl import ExcelWriter, JSONWriter
-from writer.write_to_others import save_blurry_list
-import time
-import threading
+from job_scheduler import JobScheduler
+from video_pipeline import VideoPipeline
 import os
 import torch
 
-lock = Lock()
-
-
-def processing_forced_stop(sign_dict, processing_dict):
-    """
-    进程检测器（到时间进程未终止则强制杀死）
-    :param sign_dict: 进程终止标志
-    :param processing_dict: 进程终止标志所对应的进程l
-    :return:
-    """
-    tack_id = sign_dict['task_id']
-    if not sign_dict['finish']:
-        print(f'任务{tack_id} 监测器执行')
-        for key, p in processing_dict.items():
-            lock.acquire()
-            sign_dict[key] = True
-            p.kill()
-            lock.release()
-        print(f'任务{tack_id} 监测器执行完毕')
-
-
 if __name__ == '__main__':
 
     torch.multiprocessing.set_start_method('spawn', force=True)
-    bd = BlueDetector(threshold=-10000)
     manager = multiprocessing.Manager()
     detect_type = 'video'  # video or real-time
     pwd = os.getcwd()
     video_display = False
     video_save = True
+    video_save_mode = 'video'  # 保存方式(video: 直接编码为视频, images: 每帧保存为图片, both: 两者都保存)
+    # 保存等级(off: 不保存, nth: 每output_every_n帧保存一帧, downscaled: 按output_scale缩小后保存,
+    # full: 全部原尺寸保存), 不保存的帧跳过绘制
+    output_level = 'full'
+    output_every_n = 10
+    output_scale = 0.5
+    ring_slots = 32  # 共享内存帧缓冲区槽位数量(限制流水线中帧数据的内存占用)
+    yolo_batch_size = 8  # yolo批量检测的帧数(槽位数量需不小于该值+2, 1表示逐帧检测)
+    prefetch = 16  # 预解码缓存帧数(0表示在输入循环中同步解码)
+    # 抽帧步长(每stride帧检测一帧, 跳过的帧不做图像转换); 追踪器中以帧为单位的常量(AbstractBug.SURVIVAL_TIME,
+    # Track.SERVAL_TIME/MISSING_THRESHOLD, DeepSORT的MAX_AGE等)按读取到的帧计数, 对应stride倍的原视频帧
+    stride = 1
+    blur_method = 'fft'  # 模糊度检测方法(fft为旧版本复数FFT, rfft为实数FFT(更快, 与fft相差约0.1以内), laplacian为拉普拉斯方差)
+    blur_workers = 2  # 模糊度检测线程数(0表示在输入循环中同步检测)
+    blur_threshold = -10000  # 模糊阈值(模糊度小于等于阈值的帧跳过yolo与帧差法检测, -10000表示不跳过)
+    blur_hysteresis = 2  # 恢复检测所需超过模糊阈值的回滞量
+    blur_max_gap = 10  # 最多连续跳过的模糊帧数(之后强制检测一帧)
+    differ_pyramid = False  # 帧差法是否在半分辨率图像上计算(更快, 检测结果与全分辨率略有差异)
+    motion_backend = 'orb'  # 位移矢量估计方法(orb: 特征匹配, phase: 缩小图像的相位相关, 更快但只估计纯平移)
+    noise_mask_path = None  # 屏幕噪点掩膜缓存文件(.npy, 同一台显微镜共用; None表示每个视频用前几十帧单独标定)
+    record_live = False  # 微生物记录是否使用Manager代理对象(可在运行中实时查看, 但每次记录都需进程间通信)
+    camera_shape = (1216, 1824, 3)  # 实时检测的相机图像尺寸(高, 宽, 通道), 需与采集设备输出的图像一致
 
     error_video = []  # 需考量视频列表
     frame_interval = {}  # 视频对应检测帧区间
@@ -60,6 +57,39 @@ if __name__ == '__main__':
     end_index = 300  # 结束帧980
     detect_index = 300  # 固定检测帧数
 
+    # 多视频并行(None表示按CPU与内存预算自动计算)
+    max_jobs = None  # 最大同时运行的视频数量
+    cpu_budget = None  # 可使用的CPU核数
+    memory_budget = None  # 可使用的内存(单位/字节)
+
+    pipeline_config = {
+        'video_display': video_display,
+        'video_save': video_save,
+        'video_save_mode': video_save_mode,
+        'output_level': output_level,
+        'output_every_n': output_every_n,
+        'output_scale': output_scale,
+        'ring_slots': ring_slots,
+        'yolo_batch_size': yolo_batch_size,
+        'torch_threads': None,  # yolo推理线程数(None表示按CPU预算平均分配)
+        'prefetch': prefetch,
+        'stride': stride,
+        'blur_method': blur_method,
+        'blur_workers': blur_workers,
+        'blur_threshold': blur_threshold,
+        'blur_hysteresis': blur_hysteresis,
+        'blur_max_gap': blur_max_gap,
+        'differ_pyramid': differ_pyramid,
+        'noise_mask_path': noise_mask_path,
+        'motion_backend': motion_backend,
+        'record_live': record_live,
+        'methods': methods,
+        'manual_option': manual_option,
+        'start_index': start_index,
+        'end_index': end_index,
+        'detect_index': detect_index,
+    }
+
     # input_path = r'Z:\ROMIDAS0.3\ROMIDAS-NAS\D\123\impact video\pfoa'
     # output_path = r'Z:\ROMIDAS0.3\out\pfoa'
     input_path = r"Z:\ROMIDAS0.3\ROMIDAS-NAS\D\123\impact video\pfoa"
@@ -70,178 +100,16 @@ if __name__ == '__main__':
         # path_manager = PathManager(f'{pwd}/input', f'{pwd}/output')
         path_manager = PathManager(input_path, output_path)
 
-        for i, path_dir in enumerate(path_manager.items()):
-
-            # 进程通信标志
-            sign_dict = manager.dict({
-                'task_id': i + 1,
-                'finish': False,
-                'video_display': video_display,
-                'video_save': video_save,
-                'video_input_sign': False,
-                'yolo_detect_sign': False,
-                'frame_detect_sign': False,
-                'manager_sign': False,
-                'video_manager_sign': False,
-            })
-            # 视频读入器
-            video_reader = VideoReader(path_dir.video_input_path)
-            # 进程通信队列
-            yolo_result_queue = Queue(maxsize=100)
-            frame_result_queue = Queue(maxsize=100)
-            frame_input_queue = Queue(maxsize=100)
-            yolo_input_queue = Queue(maxsize=100)
-            video_queue = Queue(maxsize=100)
-
-            # 设置进程
-
-            # 设置视频管理器进程
-            video_manager_processing = VideoProcessing(sign_dict, video_queue)
-            video_manager_processing.set_fps(video_reader.fps)
-            video_manager_processing.set_video_message(video_reader.video_message())
-            video_manager_processing.set_video_save_path(path_dir.video_path)
-            video_manager_p = Process(target=video_manager_processing.start)
-
-            # 设置yolo检测器进程
-            yolo_processing = YoloProcessing(sign_dict, yolo_result_queue, yolo_input_queue, frame_input_queue)
-            yolo_p = Process(target=yolo_processing.start)
-
-            # 设置帧差法检测器进程
-            differ_processing = FrameDifferProcessing(sign_dict, frame_input_queue, frame_result_queue)
-            differ_p = Process(target=differ_processing.start)
-
-            # 数据存储对象
-            bug_dead_or_live = manager.dict({
-                'Ar': manager.dict({'die': 0, 'live': 0}),
-                "Do": manager.dict({'die': 0, 'live': 0}),
-                'Mo': manager.dict({'die': 0, 'live': 0}),
-                'Ne': manager.dict({'die': 0, 'live': 0}),
-                'Eu': manager.dict({'die': 0, 'live': 0}),
-            })
-            bug_record_dict = manager.dict({
-                'Ar': manager.list(),
-                "Do": manager.list(),
-                'Mo': manager.list(),
-                'Ne': manager.list(),
-                'Eu': manager.list(),
-                'Gs': manager.list(),
-                "SmallProtozoa": manager.list(),
-            })
-            ar_colors_list = manager.list()
-            gs_area_list = manager.list()
-
-            # 初始化微生物记录器
-            bug_record = ReallyBugRecord(path_dir, video_reader.video_name, video_reader.fps, video_reader.total_frames)
-            bug_record.set_ar_colors_list(ar_colors_list)
-            bug_record.set_gs_area_list(gs_area_list)
-            bug_record.set_bug_dead_or_live(bug_dead_or_live)
-            bug_record.set_bug_record(bug_record_dict)
-
-            # 设置数据同步管理器进程
-            manager_processing = ManagerProcessing(sign_dict, yolo_result_queue, frame_result_queue, video_queue,
-                                                   bug_record)
-            manager_p = Process(target=manager_processing.start)
-
-            # 开启所有进程
-            manager_p.start()
-            yolo_p.start()
-            video_manager_p.start()
-            differ_p.start()
-
-            # 开始输入数据
-            video_start_time = time.time()
-            print(f'第{i + 1}个视频 {video_reader.video_name} 开始时间: {time.ctime()}')
-            blurry_list = []
-
-            total_index = video_reader.total_frames
-            frame_list1 = frame_set(methods, manual_option, start_index, end_index, detect_index, total_index,
-                                    video_reader.video_name)
-            print(frame_list1)
-            if isinstance(frame_list1, list) and len(frame_list1) > 0:
-                frame_interval[video_reader.video_name] = frame_list1
-
-            for frame_index, frame in enumerate(video_reader):
-                # time.sleep(0.005)
-
-                # if frame_index % 200 == 0 and not video_display:
-                # print(f'已经输入 {frame_index} 帧')
-                # time.sleep(1)
-
-                # blurry, blurry_text, blurry_mean = bd.detect(frame)
-                # blurry_list.append(blurry_mean)
-                # lock.acquire()
-                # yolo_input_queue.put((frame_index, frame, blurry, blurry_text))
-                # lock.release()
-
-                if isinstance(frame_list1, list) and len(frame_list1) == 0:
-                    blurry, blurry_text, blurry_mean = bd.detect(frame)
-                    blurry_list.append(blurry_mean)
-                    lock.acquire()
-                    yolo_input_queue.put((frame_index, frame, blurry, blurry_text))
-                    lock.release()
-
-                    if frame_index % 200 == 0 and not video_display:
-                        print(f'已经输入第 {frame_index} 帧')
-
-                elif isinstance(frame_list1, list) and len(frame_list1) > 0:
-
-                    if frame_list1[0] <= frame_index <= frame_list1[1]:
-                        blurry, blurry_text, blurry_mean = bd.detect(frame)
-                        blurry_list.append(blurry_mean)
-                        lock.acquire()
-                        yolo_input_queue.put((frame_index, frame, blurry, blurry_text))
-                        lock.release()
-
-                        if frame_index % 200 == 0 and not video_display:
-                            print(f'已经输入第 {frame_index} 帧')
-
-                elif isinstance(frame_list1, str):
-                    if frame_list1 not in error_video:
-                        error_video.append(frame_list1)
-
-                else:
-                    print("指定视频检测帧数有误")
-
-            # 数据输入结束
-            lock.acquire()
-            sign_dict['video_input_sign'] = True
-            lock.release()
-
-            # 进程监测器字典
-            processing_dict = {
-                'yolo_detect_sign': yolo_p,
-                'frame_detect_sign': differ_p,
-                'manager_sign': manager_p,
-                'video_manager_sign': video_manager_p,
-            }
-            # 开启进程监测器
-            rest_length = max([yolo_input_queue.qsize(), frame_input_queue.qsize(), yolo_result_queue.qsize(),
-                               frame_result_queue.qsize(), video_queue.qsize()])
-            timer = threading.Timer(rest_length / 10, processing_forced_stop, args=(sign_dict, processing_dict))
-            timer.start()
-            # 等待所有开启的进程结束，如果到规定时间未结束，会直接杀死未结束的进程
-            yolo_p.join()
-            differ_p.join()
-            video_manager_p.join()
-
-            # 数据保存
-            print('数据保存中')
-            save_blurry_list(path_dir.blurry_path, blurry_list)
-            print('模糊度列表保存完成')
-            json_writer = JSONWriter(path_dir.json_path)
-            json_writer.write(bug_record)
-            print('json数据保存成功')
-            try:
-                excel_writer = ExcelWriter(path_dir.execl_path)
-                excel_writer.write(bug_record)
-                print('excel数据保存成功')
-            except:
-                print('xlwings库出现异常，excel数据保存失败')
-            print('数据保存完成')
-            video_end_time = time.time()
-            print(f'第 {i + 1}个视频结束时间: {time.ctime()}')
-            print(f'第 {i + 1}个视频检测时间: {video_end_time - video_start_time}')
-            sign_dict['finish'] = True
+        scheduler = JobScheduler(pipeline_config, max_jobs, cpu_budget, memory_budget)
+        for path_dir in path_manager.items():
+            scheduler.add(path_dir)
+        for result in scheduler.run().values():
+            if result is None:
+                continue
+            for video_name in result['error_video']:
+                if video_name not in error_video:
+                    error_video.append(video_name)
+            frame_interval.update(result['frame_interval'])
     elif detect_type == 'real-time':
 
         classes_list = ['Gs', 'Mo', 'Do', 'Eu', 'Ne', 'Ar']
@@ -255,34 +123,52 @@ if __name__ == '__main__':
             'finish': False,
             'video_display': video_display,
             'video_save': video_save,
+            'video_save_mode': video_save_mode,
             'video_input_sign': False,
+            'motion_sign': False,
             'yolo_detect_sign': False,
             'frame_detect_sign': False,
             'manager_sign': False,
             'video_manager_sign': False,
         })
         # 进程通信队列
+        motion_input_queue = Queue()
         yolo_result_queue = Queue()
         frame_result_queue = Queue()
         frame_input_queue = Queue()
         yolo_input_queue = Queue()
         video_queue = Queue()
+        # 共享内存帧缓冲区
+        VideoPipeline.check_ring_slots(ring_slots, yolo_batch_size)
+        frame_ring = FrameRing(ring_slots, camera_shape)
 
         # 设置进程
 
         # 设置视频管理器进程
-        video_manager_processing = VideoProcessing(sign_dict, video_queue)
+        video_manager_processing = VideoProcessing(sign_dict, frame_ring, video_queue)
         video_manager_processing.set_fps(fps)
         video_manager_processing.set_video_message(video_message)
         video_manager_processing.set_video_save_path(path_dir.video_path)
+        video_manager_processing.set_images_save_path(path_dir.images_dir)
+        video_manager_processing.set_save_mode(video_save_mode)
+        output_policy = OutputPolicy(output_level, output_every_n, output_scale)
+        video_manager_processing.set_output_policy(output_policy)
         video_manager_p = Process(target=video_manager_processing.start)
 
+        # 设置位移矢量进程
+        motion_processing = MotionProcessing(sign_dict, frame_ring, motion_input_queue, yolo_input_queue)
+        motion_processing.set_motion_backend(motion_backend)
+        motion_p = Process(target=motion_processing.start)
+
         # 设置yolo检测器进程
-        yolo_processing = YoloProcessing(sign_dict, yolo_result_queue, yolo_input_queue, frame_input_queue)
+        yolo_processing = YoloProcessing(sign_dict, frame_ring, yolo_result_queue, yolo_input_queue, frame_input_queue,
+                                         yolo_batch_size)
         yolo_p = Process(target=yolo_processing.start)
 
         # 设置帧差法检测器进程
-        differ_processing = FrameDifferProcessing(sign_dict, frame_input_queue, frame_result_queue)
+        differ_processing = FrameDifferProcessing(sign_dict, frame_ring, frame_input_queue, frame_result_queue)
+        differ_processing.set_pyramid(differ_pyramid)
+        differ_processing.set_noise_mask_path(noise_mask_path)
         differ_p = Process(target=differ_processing.start)
 
         # 数据存储对象
@@ -313,12 +199,14 @@ if __name__ == '__main__':
         bug_record.set_bug_record(bug_record_dict)
 
         # 设置数据同步管理器进程
-        manager_processing = ManagerProcessing(sign_dict, yolo_result_queue, frame_result_queue, video_queue,
-                                               bug_record)
+        manager_processing = ManagerProcessing(sign_dict, frame_ring, yolo_result_queue, frame_result_queue,
+                                               video_queue, bug_record)
+        manager_processing.set_output_policy(output_policy)
         manager_p = Process(target=manager_processing.start)
 
         # 开启所有进程
         manager_p.start()
+        motion_p.start()
         yolo_p.start()
         video_manager_p.start()
         differ_p.start()
@@ -328,12 +216,6 @@ if __name__ == '__main__':
 
     else:
         print('检测类型错误')
-    # root_path = r".\output"
-    # txt_path = r".\output\record.txt"
-    root_path = output_path
-    txt_path = os.path.join(output_path, "record.txt")
-    # txt_path = r"Z:\ROMIDAS0.3\out\Cu2\record.txt"
-    images_to_video_recursive(root_path, txt_path)
     print('finish')
     print("需重新考量的视频:", error_video)
     print("视频对应检测帧区间：", frame_interval)
@@ -1,105 +1,139 @@
-from copy import deepcopy
-from multiprocessing import Lock
-from tools.drawer import draw_messages
+import math
+import time
+from collections import deque
+from tools.drawer import draw_messages, draw_trails
 from big_microfauna.abstract_bug_manager import AbstractBugManager
+from stage_processing import StageProcessing
+from video.video_handle import OutputPolicy
 
-lock = Lock()
 
+class ManagerProcessing(StageProcessing):
+    SIGN_NAME = 'manager_sign'
 
-class ManagerProcessing:
-
-    def __init__(self, sign_dict, yolo_result_queue, frame_result_queue, video_queue, bug_record):
+    def __init__(self, sign_dict, frame_ring, yolo_result_queue, frame_result_queue, video_queue, bug_record,
+                 result_queue=None):
         """
 
         :param sign_dict: 进程通信标记
+        :param frame_ring: 共享内存帧缓冲区
         :param yolo_result_queue: 大虫子结果队列
         :param frame_result_queue: 小虫子结果队列
         :param video_queue: 结果图像数据队列
-        :param bug_record:
+        :param bug_record: 微生物记录器
+        :param result_queue: 记录结果队列(进程结束时放入一次记录结果, None表示不返回)
         """
 
-        self.sign_dict = sign_dict
+        super().__init__(sign_dict)
+        self.frame_ring = frame_ring
         self.yolo_result_queue = yolo_result_queue
         self.frame_result_queue = frame_result_queue
         self.video_queue = video_queue
 
-        self.yolo_result_list = []
-        self.frame_result_list = []
+        self.yolo_result_list = deque()
+        self.frame_result_list = deque()
 
         self.video_display = self.sign_dict['video_display']
         self.video_save = self.sign_dict['video_save']
+        self.output_policy = OutputPolicy()
 
         self.abstract_bug_manager = AbstractBugManager()
         self.bug_record = bug_record
+        self.result_queue = result_queue
+
+    def set_output_policy(self, output_policy):
+        """
+        设置保存等级
+        :param output_policy: 保存等级对象
+        :return: None
+        """
+        self.output_policy = output_policy
 
     def start(self):
         """
         开始进程
         :return:
         """
+        self.telemetry.start(yolo_result=self.yolo_result_queue, frame_result=self.frame_result_queue)
+        yolo_finished, differ_finished = False, False
         while True:
-            self._get_data()
-            try:
-                if len(self.yolo_result_list) > 0 and len(self.frame_result_list) > 0:
-
-                    yolo_frame_index, differ_frame_index = self.yolo_result_list[0][0], self.frame_result_list[0][0]
-                    translation, bug_list = None, []
-
-                    if yolo_frame_index < differ_frame_index:
-                        yolo_frame_index, yolo_frame, outputs, others, blurry, \
-                            blurry_text = self.yolo_result_list.pop(0)
-                    elif yolo_frame_index > differ_frame_index:
-                        differ_frame_index, differ_frame, differ_clear_list, translation, display_tracks, blurry, \
-                            blurry_text = self.frame_result_list.pop(0)
-                        bug_list.extend(display_tracks)
-                    else:
-                        yolo_frame_index, yolo_frame, outputs, others, blurry, \
-                            blurry_text = self.yolo_result_list.pop(0)
-                        differ_frame_index, differ_frame, differ_clear_list, translation, display_tracks, blurry, \
-                            blurry_text = self.frame_result_list.pop(0)
-                        bug_list.extend(display_tracks)
-
-                    if yolo_frame_index <= differ_frame_index:
-                        self.abstract_bug_manager.update(yolo_frame_index, yolo_frame, outputs, others, blurry,
-                                                         translation)
-                        clear_list = self.abstract_bug_manager.clear()
-                        self.bug_record.allocation(clear_list)
-
-                    if differ_frame_index <= yolo_frame_index:
-                        # 帧间差分法数据处理(包含绘制)
-                        self.bug_record.allocation(differ_clear_list)
-
-                    # 图像绘制
-                    if self.video_display or self.video_save:
-                        bug_list.extend(self.abstract_bug_manager.display_tracks())
-                        if yolo_frame_index < differ_frame_index:
-                            image = draw_messages(yolo_frame, self.abstract_bug_manager.display_tracks())
-                        else:
-                            image = draw_messages(differ_frame, self.abstract_bug_manager.display_tracks())
-                    if self.video_display or self.video_save:
-                        self.video_queue.put((image, blurry_text, yolo_frame_index, differ_frame_index, bug_list,
-                                              deepcopy(self.bug_record.bug_numbers)))
-
-                else:
-                    if not self.sign_dict['frame_detect_sign']:
-                        continue
-                    else:
-                        break
-            except:
-                print('分配器出了点问题，但是没有影响。')
-        lock.acquire()
-        self.sign_dict['manager_sign'] = True
+            # 只在本地缓存为空时阻塞等待对应的输入
+            if len(self.yolo_result_list) == 0 and not yolo_finished:
+                yolo_finished = self._get_data(self.yolo_result_queue, self.yolo_result_list)
+            if len(self.frame_result_list) == 0 and not differ_finished:
+                differ_finished = self._get_data(self.frame_result_queue, self.frame_result_list)
+
+            yolo_waiting = len(self.yolo_result_list) == 0 and not yolo_finished
+            differ_waiting = len(self.frame_result_list) == 0 and not differ_finished
+            if yolo_waiting or differ_waiting:
+                continue
+            if len(self.yolo_result_list) == 0 and len(self.frame_result_list) == 0:
+                break
+            start_time = time.time()
+            self._merge()
+            self.telemetry.record(time.time() - start_time)
+
+        # 记录结果一次性交给主进程
+        if self.result_queue is not None:
+            self.result_queue.put(self.bug_record.result())
+
+        # 通知下游并更改完成标志
+        self._finish(self.video_queue)
         print('manager finish')
-        lock.release()
 
-    def _get_data(self):
+    def _merge(self):
         """
-        获取输入数据
-        :return:
+        按帧数合并一次大虫子与小虫子的结果(某一路结束后其帧数视为无穷大)
+        :return: None
         """
-        lock.acquire()
-        if not self.yolo_result_queue.empty():
-            self.yolo_result_list.append(self.yolo_result_queue.get(timeout=10))
-        if not self.frame_result_queue.empty():
-            self.frame_result_list.append(self.frame_result_queue.get(timeout=10))
-        lock.release()
+        slots = []  # 本轮取出的槽位引用
+        try:
+            yolo_frame_index = self.yolo_result_list[0][0] if self.yolo_result_list else math.inf
+            differ_frame_index = self.frame_result_list[0][0] if self.frame_result_list else math.inf
+            translation, bug_list, display_tracks = None, [], []
+
+            # 位移矢量使用yolo结果中附带的逐帧位移矢量(由位移矢量进程计算, 帧差法结果中的为两次输入之间的累计值)
+            if yolo_frame_index < differ_frame_index:
+                yolo_frame_index, yolo_slot, outputs, others, translation, blurry, \
+                    blurry_text = self.yolo_result_list.popleft()
+                slots.append(yolo_slot)
+            elif yolo_frame_index > differ_frame_index:
+                differ_frame_index, differ_slot, differ_clear_list, _, display_tracks, blurry, \
+                    blurry_text = self.frame_result_list.popleft()
+                slots.append(differ_slot)
+                bug_list.extend(display_tracks)
+            else:
+                yolo_frame_index, yolo_slot, outputs, others, translation, blurry, \
+                    blurry_text = self.yolo_result_list.popleft()
+                differ_frame_index, differ_slot, differ_clear_list, _, display_tracks, blurry, \
+                    blurry_text = self.frame_result_list.popleft()
+                slots.extend([yolo_slot, differ_slot])
+                bug_list.extend(display_tracks)
+
+            if yolo_frame_index <= differ_frame_index:
+                yolo_frame = self.frame_ring.get(yolo_slot)
+                self.abstract_bug_manager.update(yolo_frame_index, yolo_frame, outputs, others, blurry,
+                                                 translation)
+                clear_list = self.abstract_bug_manager.clear()
+                self.bug_record.allocation(clear_list)
+
+            if differ_frame_index <= yolo_frame_index:
+                # 帧间差分法数据处理(包含绘制)
+                self.bug_record.allocation(differ_clear_list)
+
+            # 图像绘制(直接绘制在共享内存槽位中, 之后只有视频进程读取该槽位), 不显示也不保存的帧跳过绘制
+            store = self.video_save and self.output_policy.store()
+            if self.video_display or store:
+                big_tracks = self.abstract_bug_manager.display_tracks()
+                bug_list.extend(big_tracks)
+                image_slot = yolo_slot if yolo_frame_index < differ_frame_index else differ_slot
+                image = self.frame_ring.get(image_slot)
+                draw_trails(image, display_tracks)
+                draw_messages(image, big_tracks)
+                slots.remove(image_slot)
+                self.video_queue.put((image_slot, blurry_text, yolo_frame_index, differ_frame_index, bug_list,
+                                      self.bug_record.bug_numbers.copy(), store))
+        except:
+            print('分配器出了点问题，但是没有影响。')
+        finally:
+            for slot in slots:
+                self.frame_ring.release(slot)
@@ -0,0 +1,58 @@
+import time
+from collections import deque
+from small_protozoa.features_match import MotionEstimator
+from stage_processing import StageProcessing
+
+
+class MotionProcessing(StageProcessing):
+    """
+    全局位移矢量进程
+    每一帧只计算一次相对前一帧的位移矢量, 附加在帧信息中交给yolo阶段, 再由yolo阶段转交给帧差法与数据管理阶段,
+    DeepSORT、大虫子管理器、小虫子追踪器与大虫子过滤器都使用同一个估计值
+    """
+    SIGN_NAME = 'motion_sign'
+
+    def __init__(self, sign_dict, frame_ring, motion_input_queue, yolo_input_queue):
+        """
+
+        :param sign_dict: 进程通信标记
+        :param frame_ring: 共享内存帧缓冲区
+        :param motion_input_queue: 位移矢量输入队列
+        :param yolo_input_queue: yolo输入队列
+        """
+        super().__init__(sign_dict)
+        self.frame_ring = frame_ring
+        self.motion_input_queue = motion_input_queue
+        self.yolo_input_queue = yolo_input_queue
+        self.motion_input_list = deque()
+        self.motion_backend = 'orb'  # 位移矢量估计方法
+
+    def set_motion_backend(self, motion_backend):
+        """
+        设置位移矢量估计方法
+        :param motion_backend: 估计方法(orb: 特征匹配, phase: 缩小图像的相位相关)
+        :return: None
+        """
+        self.motion_backend = motion_backend
+
+    def start(self):
+        """
+        开始进程
+        :return:
+        """
+        motion_estimator = MotionEstimator(self.motion_backend)
+        self.telemetry.start(motion_input=self.motion_input_queue)
+        finished = False
+        while not finished:
+            finished = self._get_data(self.motion_input_queue, self.motion_input_list)
+            while len(self.motion_input_list) > 0:
+                start_time = time.time()
+                frame_index, slot, blurry, blurry_text = self.motion_input_list.popleft()
+                # 模糊帧同样计算位移矢量(跳过检测的帧也需要随载物台平移), 计算失败为None
+                translation, _, _ = motion_estimator.estimate(self.frame_ring.get(slot), align=False)
+                self.yolo_input_queue.put((frame_index, slot, blurry, blurry_text, translation or None))
+                self.telemetry.record(time.time() - start_time)
+
+        # 通知下游并更改完成标志
+        self._finish(self.yolo_input_queue)
+        print('motion estimate finish')
@@ -1,5 +1,5 @@
 class BBox:
-    SERVAL_TIME = 80  # 检测框存活时间(单位/帧)
+    SERVAL_TIME = 80  # 检测框存活时间(单位/帧差法的输入, 即每隔一帧读取到的帧)
     OFFSET = 5  # 检测影响的边缘区域(单位/像素)
 
     def __init__(self, track_id, x1, y1, x2, y2):
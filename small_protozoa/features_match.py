@@ -1,87 +1,182 @@
+import time
+import logging
 import numpy as np
 import cv2
-import threading
 
-orb = cv2.ORB_create()
 
-
-def create(src, result):
+def warp_translation(gray, translation):
     """
-    用于加速的函数
-    :param src: 图像
-    :param result: 结果
-    :return: None
+    按位移矢量平移前一帧, 使其与当前帧对齐
+    :param gray: 前一帧灰度图
+    :param translation: 位移矢量(x, y)
+    :return: 平移后的灰度图
     """
-    result[0], result[1] = orb.detectAndCompute(src, None)
+    x_t, y_t = translation
+    H = np.array([[1, 0, x_t],
+                  [0, 1, y_t]])
+    return cv2.warpAffine(gray, H, gray.shape[::-1])
 
 
-def calc_translation(src1, src2, method='orb'):
+class MotionEstimator:
     """
-    位移矢量的计算
-    :param src1: 前一帧
-    :param src2: 当前帧
-    :param method: 计算方法(不用动)
-    :return: (位移矢量，前一阵灰度图，当前帧灰度图)
+    全局位移矢量(载物台平移)估计, 有状态: 缓存前一帧的灰度图与特征, 每帧只计算一次
+    后端:
+        orb: ORB特征匹配(复用同一个FLANN匹配器), 位移取匹配点位移的中位数或RANSAC内点的均值
+        phase: 缩小后的灰度图做相位相关, 只估计纯平移, 计算量远小于特征匹配
+    每帧的耗时与置信度(orb: 内点比例, phase: 相位相关峰值)记录在last_time与last_confidence中并写入日志
     """
-    translation = ()
-    try:
-        MIN_MATCH_COUNT = 10
-        if len(src1.shape) > 2:
-            src1 = cv2.cvtColor(src1, cv2.COLOR_BGR2GRAY)
-        if len(src2.shape) > 2:
-            src2 = cv2.cvtColor(src2, cv2.COLOR_BGR2GRAY)
-        if method == 'sift':
-            sift = cv2.SIFT_create()
-            kp1, des1 = sift.detectAndCompute(src1, None)
-            kp2, des2 = sift.detectAndCompute(src2, None)
-            FLANN_INDEX_KDTREE = 1
-            index_params = dict(algorithm=FLANN_INDEX_KDTREE, trees=5)
-        else:
-            # orb = cv2.ORB_create()
-            #
-            # kp1, des1 = orb.detectAndCompute(src1, None)
-            # kp2, des2 = orb.detectAndCompute(src2, None)
-            result1 = [0, 0]
-            result2 = [0, 0]
-            t1 = threading.Thread(target=create, args=(src1, result1))
-            t2 = threading.Thread(target=create, args=(src2, result2))
-            t1.start()
-            t2.start()
-            t1.join()
-            t2.join()
-            (kp1, des1), (kp2, des2) = result1, result2
+    BACKENDS = ('orb', 'phase')
+    ROBUST_METHODS = ('median', 'ransac')
+    MIN_MATCH_COUNT = 10  # 有效匹配数量下限
+    RATIO = 0.7  # 最近邻比值检验阈值
+    INLIER_DISTANCE = 2  # 与位移估计值的距离不超过该值的匹配视为内点(单位/像素)
+    RANSAC_SAMPLES = 64  # RANSAC的候选位移数量
+    MIN_PHASE_RESPONSE = 0.05  # 相位相关峰值下限(低于该值视为计算失败)
 
-            FLANN_INDEX_LSH = 6
-            index_params = dict(algorithm=FLANN_INDEX_LSH,
-                                table_number=6,
-                                key_size=12,
-                                multi_probe_level=2)
-        search_params = dict(checks=50)
-        flann = cv2.FlannBasedMatcher(index_params, search_params)
-        matches = flann.knnMatch(des1, des2, k=2)
+    def __init__(self, backend='orb', robust='ransac', scale=0.25):
+        """
 
-        good = []
-        for m in matches:
-            if len(m) == 2:
-                if m[0].distance < 0.7 * m[1].distance:
-                    good.append(m[0])
-        if len(good) > MIN_MATCH_COUNT:
+        :param backend: 估计方法(orb, phase)
+        :param robust: orb后端的位移统计方法(median: 中位数, ransac: RANSAC)
+        :param scale: phase后端的缩放比例
+        """
+        if backend not in self.BACKENDS:
+            raise ValueError(f'位移矢量估计方法需为{self.BACKENDS}之一, 当前为{backend}')
+        if robust not in self.ROBUST_METHODS:
+            raise ValueError(f'位移统计方法需为{self.ROBUST_METHODS}之一, 当前为{robust}')
+        self.backend = backend
+        self.robust = robust
+        self.scale = scale
+        self.last_time = 0.0  # 最近一帧的耗时(单位/秒)
+        self.last_confidence = 0.0  # 最近一帧的置信度
+        self._gray = None  # 前一帧灰度图
+        self._features = None  # 前一帧的特征(orb: (特征点坐标, 描述子), phase: 缩小后的浮点图像)
+        self._orb = cv2.ORB_create()
+        index_params = dict(algorithm=6, table_number=6, key_size=12, multi_probe_level=2)  # FLANN_INDEX_LSH
+        self._matcher = cv2.FlannBasedMatcher(index_params, dict(checks=50))
+        self._rng = np.random.default_rng(0)
+        self._window = None  # 相位相关的汉宁窗
 
-            # x_t = np.median([(kp2[m.trainIdx].pt[0] - kp1[m.queryIdx].pt[0]) for m in good])
-            x_t = np.mean([(kp2[m.trainIdx].pt[0] - kp1[m.queryIdx].pt[0]) for m in good])
-            # y_t = np.median([(kp2[m.trainIdx].pt[1] - kp1[m.queryIdx].pt[1]) for m in good])
-            y_t = np.mean([(kp2[m.trainIdx].pt[1] - kp1[m.queryIdx].pt[1]) for m in good])
+    def reset(self):
+        """
+        清除缓存的前一帧与最近一帧的耗时和置信度
+        :return: None
+        """
+        self._gray = None
+        self._features = None
+        self.last_time = 0.0
+        self.last_confidence = 0.0
 
-            H = np.array([[1, 0, x_t],
-                          [0, 1, y_t]])
-            translation = (x_t, y_t)
-
-            src1 = cv2.warpAffine(src1, H, src1.shape[::-1])
+    def _orb_features(self, gray):
+        """
+        计算ORB特征
+        :param gray: 灰度图
+        :return: (特征点坐标(n, 2), 描述子)
+        """
+        keypoints, descriptors = self._orb.detectAndCompute(gray, None)
+        points = np.array([keypoint.pt for keypoint in keypoints], dtype=np.float64).reshape(-1, 2)
+        return points, descriptors
 
+    def _robust_translation(self, displacements):
+        """
+        由匹配点位移统计全局位移
+        :param displacements: 匹配点位移(n, 2)
+        :return: (位移矢量, 内点比例)
+        """
+        if self.robust == 'median':
+            translation = np.median(displacements, axis=0)
         else:
-            pass
+            # 以部分匹配点的位移为候选, 取内点最多的候选, 再用内点的均值修正
+            samples = displacements[self._rng.choice(len(displacements), min(self.RANSAC_SAMPLES,
+                                                                             len(displacements)), replace=False)]
+            distances = np.linalg.norm(displacements[None, :, :] - samples[:, None, :], axis=2)
+            best = np.argmax((distances <= self.INLIER_DISTANCE).sum(axis=1))
+            translation = displacements[distances[best] <= self.INLIER_DISTANCE].mean(axis=0)
+        inliers = np.linalg.norm(displacements - translation, axis=1) <= self.INLIER_DISTANCE
+        return translation, float(inliers.mean())
+
+    def _phase_features(self, gray):
+        """
+        缩小灰度图(相位相关的输入)
+        :param gray: 灰度图
+        :return: 缩小后的浮点图像
+        """
+        height, width = gray.shape
+        size = (max(1, round(width * self.scale)), max(1, round(height * self.scale)))
+        small = cv2.resize(gray, size, interpolation=cv2.INTER_AREA).astype(np.float32)
+        if self._window is None or self._window.shape != small.shape:
+            self._window = cv2.createHanningWindow(size, cv2.CV_32F)
+        return small
+
+    def _estimate_orb(self, previous, current):
+        """
+        ORB特征匹配估计位移
+        :param previous: 前一帧的特征
+        :param current: 当前帧的特征
+        :return: (位移矢量或None, 置信度)
+        """
+        (points1, des1), (points2, des2) = previous, current
+        if des1 is None or des2 is None or len(des1) < 2 or len(des2) < 2:
+            return None, 0.0
+
+        query, train = [], []
+        for m in self._matcher.knnMatch(des1, des2, k=2):
+            if len(m) == 2 and m[0].distance < self.RATIO * m[1].distance:
+                query.append(m[0].queryIdx)
+                train.append(m[0].trainIdx)
+        if len(query) <= self.MIN_MATCH_COUNT:
+            return None, 0.0
+        return self._robust_translation(points2[train] - points1[query])
+
+    def _estimate_phase(self, previous, current):
+        """
+        相位相关估计位移
+        :param previous: 前一帧缩小后的图像
+        :param current: 当前帧缩小后的图像
+        :return: (位移矢量或None, 置信度)
+        """
+        if previous.shape != current.shape:
+            return None, 0.0
+        (dx, dy), response = cv2.phaseCorrelate(previous, current, self._window)
+        if response < self.MIN_PHASE_RESPONSE:
+            return None, response
+        return np.array([dx / self.scale, dy / self.scale]), response
 
-    except Exception as e:
-        print('My Exception: ', e)
+    def estimate(self, frame, align=True):
+        """
+        估计当前帧相对前一帧的位移矢量(接口与旧版calc_translation一致)
+        :param frame: 当前帧(彩色图或灰度图)
+        :param align: 是否按位移矢量平移前一帧(只需要位移矢量时不平移)
+        :return: (位移矢量(x, y)(计算失败为空元组), 按位移对齐后的前一帧灰度图(第一帧为None), 当前帧灰度图)
+        """
+        start_time = time.time()
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim > 2 else frame
+        per_gray, self._gray = self._gray, gray
+        translation = ()
+        self.last_confidence = 0.0
+        try:
+            if self.backend == 'orb':
+                features = self._orb_features(gray)
+            else:
+                features = self._phase_features(gray)
+            previous, self._features = self._features, features
 
-    return translation, src1, src2
+            # 第一帧没有前一帧, 只缓存特征(同样计时并写入日志)
+            if per_gray is not None and previous is not None:
+                if self.backend == 'orb':
+                    estimate, confidence = self._estimate_orb(previous, features)
+                else:
+                    estimate, confidence = self._estimate_phase(previous, features)
+                self.last_confidence = float(confidence)
+                if estimate is not None:
+                    translation = (float(estimate[0]), float(estimate[1]))
+                    if align:
+                        per_gray = warp_translation(per_gray, translation)
+        except Exception as e:
+            print('My Exception: ', e)
+            self.last_confidence = 0.0
+        finally:
+            self.last_time = time.time() - start_time
+            logging.info(f'位移矢量({self.backend}): {translation}, 置信度 {self.last_confidence:.3f}, '
+                         f'耗时 {self.last_time * 1000:.2f}ms')
+        return translation, per_gray, gray
@@ -0,0 +1,128 @@
+import os
+import numpy as np
+import cv2
+
+
+class NoiseMask:
+    """
+    屏幕静态噪点掩膜(镜头上的灰尘与坏点), 查询O(1)
+    由载物台移动时的CALIBRATION_FRAMES帧帧差二值图逐像素统计自动标定: 帧间按位移矢量对齐后样本静止, 只有固定在镜头上的
+    噪点随载物台的移动在对齐后的画面中反复出现在帧差二值图的同一位置, 出现频率不低于NOISE_RATIO的像素视为噪点, 再向外扩展
+    MARGIN像素(方形)覆盖轮廓中心的偏移;
+    载物台静止时噪点在帧差中相互抵消, 原地运动的虫子反而会被误判为噪点, 因此只统计位移不小于MIN_TRANSLATION的帧, 并且
+    载物台累计移动范围不小于MIN_DISPLACEMENT之前不生成掩膜(掩膜为空);
+    设置缓存路径时优先读取缓存的掩膜(同一台显微镜的视频共用), 没有缓存时标定完成后写入缓存
+    """
+    CALIBRATION_FRAMES = 50  # 标定帧数
+    BUILD_INTERVAL = 5  # 标定过程中每统计该帧数用当前统计结果更新一次掩膜
+    NOISE_RATIO = 0.5  # 噪点在帧差二值图中的最低出现频率
+    MARGIN = 25  # 噪点向外扩展的半径(单位/像素)
+    MIN_TRANSLATION = 3  # 参与统计的帧的最小位移(单位/像素)
+    MIN_DISPLACEMENT = 100  # 生成掩膜所需的载物台最小累计移动范围(单位/像素)
+
+    def __init__(self, cache_path=None):
+        """
+
+        :param cache_path: 掩膜缓存文件路径(.npy, None表示每个视频单独标定)
+        """
+        self.cache_path = cache_path
+        self.mask = None  # 噪点掩膜(原图尺寸, True为噪点)
+        self.frames = 0  # 已统计的帧数
+        self.calibrated = False  # 是否标定完成(读取缓存或统计的帧数与载物台移动范围都满足要求)
+        self.shape = None  # 原图尺寸(高, 宽), 未初始化为None
+        self._counts = None  # 每个像素在帧差二值图中出现的次数
+        self._position = np.zeros(2)  # 载物台累计位移(统计的帧)
+        self._low, self._high = np.zeros(2), np.zeros(2)  # 累计位移的最小值与最大值
+        self._kernel = np.ones((2 * self.MARGIN + 1, 2 * self.MARGIN + 1), np.uint8)  # 矩形核膨胀可分离计算
+
+    def init(self, shape):
+        """
+        初始化(读取缓存的掩膜)
+        :param shape: 原图尺寸(高, 宽)
+        :return: None
+        """
+        self.shape = tuple(shape)
+        if self.cache_path and os.path.exists(self.cache_path):
+            mask = np.load(self.cache_path)
+            if mask.shape == self.shape:
+                self.mask = mask
+                self.calibrated = True
+                return
+            print(f'噪点掩膜尺寸{mask.shape}与视频尺寸{self.shape}不一致, 重新标定')
+
+    @property
+    def calibrating(self):
+        """
+        是否正在标定
+        :return: 是否正在标定
+        """
+        return not self.calibrated
+
+    @property
+    def displacement(self):
+        """
+        载物台在统计的帧中的累计移动范围
+        :return: x, y方向累计位移范围的较大值(单位/像素)
+        """
+        return float(np.max(self._high - self._low))
+
+    def accumulate(self, binary, translation):
+        """
+        统计一帧帧差二值图(载物台移动范围足够时标定完成并写入缓存)
+        :param binary: 帧差二值图(可以是缩小后的图像)
+        :param translation: 帧差两帧间的位移矢量(x, y)(None表示未知, 不统计)
+        :return: None
+        """
+        if self.calibrated or translation is None or np.hypot(*translation) < self.MIN_TRANSLATION:
+            return
+        if self._counts is None or self._counts.shape != binary.shape:
+            self._counts = np.zeros(binary.shape, dtype=np.uint32)
+        self._counts += binary > 0
+        self._position += translation
+        np.minimum(self._low, self._position, out=self._low)
+        np.maximum(self._high, self._position, out=self._high)
+
+        self.frames += 1
+
+        # 移动范围不足时掩膜保持为空, 统计的帧数达到标定帧数后继续统计直到移动范围足够
+        moved = self.displacement >= self.MIN_DISPLACEMENT
+        self.calibrated = moved and self.frames >= self.CALIBRATION_FRAMES
+        if moved and (self.frames % self.BUILD_INTERVAL == 0 or self.calibrated):
+            self._build()
+        if self.calibrated:
+            self._counts = None
+            if self.cache_path:
+                self.save(self.cache_path)
+
+    def _build(self):
+        """
+        根据当前统计结果生成掩膜
+        :return: None
+        """
+        noisy = (self._counts >= self.NOISE_RATIO * self.frames).astype(np.uint8)
+        if noisy.shape != self.shape:
+            noisy = cv2.resize(noisy, self.shape[::-1], interpolation=cv2.INTER_NEAREST)
+        self.mask = cv2.dilate(noisy, self._kernel).astype(bool)
+
+    def save(self, path):
+        """
+        保存掩膜(先写入临时文件再替换, 多个视频同时标定时不会读到不完整的文件)
+        :param path: 文件路径
+        :return: None
+        """
+        temp_path = f'{path}.{os.getpid()}.tmp'
+        with open(temp_path, 'wb') as f:
+            np.save(f, self.mask)
+        os.replace(temp_path, path)
+
+    def is_noisy(self, point):
+        """
+        判断一个点是否在噪点区域
+        :param point: 待检测的点(x, y)
+        :return: 是否为噪点
+        """
+        if self.mask is None:
+            return False
+        x, y = int(point[0]), int(point[1])
+        height, width = self.mask.shape
+        return 0 <= x < width and 0 <= y < height and bool(self.mask[y, x])
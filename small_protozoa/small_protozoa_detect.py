@@ -1,123 +1,136 @@
 import numpy as np
 import cv2
-import math
-from .features_match import calc_translation
-from copy import deepcopy
+from .features_match import warp_translation
 from .tracker import Tracker
 from .bugs_filter import BBoxFilter
+from .noise_mask import NoiseMask
 
 
 class FrameDifferDetector:    
-    NOISY_LIST = [(912, 608, 150), (1132, 718, 50), (800, 80, 50), (510, 1080, 50), (1650, 560, 50), (1400, 1130, 100), (96, 366, 50), (294, 33, 50), (381, 218, 50), (1368, 718, 50), (1518, 905, 50), (1575, 1052, 50), (1666, 487, 50), (1612, 85, 50), (1195, 970, 50), (1378, 670, 50)]  # 屏幕噪点 (x, y, r)
+    MEDIAN_LIMIT = 2  # 差分图中位数大于该值时视为整体运动(位移矢量不准确), 跳过当前帧
+    # 核大小: (高斯模糊, 腐蚀, 膨胀), 3x3膨胀10次等价于一次21x21膨胀; 半分辨率模式下按比例缩小
+    KERNEL_SIZES = (5, 3, 21)
+    PYRAMID_KERNEL_SIZES = (3, 2, 11)
 
-    def __init__(self):
-
-        self.per_frame = None  # 前一帧
-        self.tracker = Tracker()  # 管理器
-        self.bbox_filter = BBoxFilter()  # 大虫子过滤器
-
-    @staticmethod
-    def calc_distance(point1, point2):
-        """
-        计算两点间距离
-        :param point1: 第一个点
-        :param point2: 第二个点
-        :return: 距离
+    def __init__(self, pyramid=False, noise_mask_path=None):
         """
-        distance = math.sqrt((point1[0] - point2[0]) ** 2 + (point1[1] - point2[1]) ** 2)
-        return distance
 
-    @classmethod
-    def filter_screen_noisy(cls, center_point):
+        :param pyramid: 是否在半分辨率图像上做帧差法(轮廓坐标放大回原图, 结果与全分辨率略有差异)
+        :param noise_mask_path: 屏幕噪点掩膜缓存文件路径(None表示每个视频单独标定)
         """
-        过滤屏幕噪点
-        :param center_point: 待检测的点
-        :return: 过滤后的点
-        """
-
-        near_noisy_point = False
-        for noisy in cls.NOISY_LIST:
-            *noisy_point, distance_threshold = noisy
-            distance = cls.calc_distance(center_point, noisy_point)
-            if distance <= distance_threshold:
-                near_noisy_point = True
-                break
-
-        return near_noisy_point
+        self.per_frame = None  # 前一帧灰度图
+        self.tracker = Tracker()  # 管理器
+        self.bbox_filter = BBoxFilter()  # 大虫子过滤器
+        self.noise_mask = NoiseMask(noise_mask_path)  # 屏幕噪点掩膜
+        self.pyramid = pyramid
+        blur_size, erode_size, dilate_size = self.PYRAMID_KERNEL_SIZES if pyramid else self.KERNEL_SIZES
+        self._blur_size = (blur_size, blur_size)
+        self._erode_kernel = np.ones((erode_size, erode_size), np.uint8)
+        self._dilate_kernel = np.ones((dilate_size, dilate_size), np.uint8)
+        self._buffers = {}  # 帧间复用的缓冲区 {名称: 数组}
 
     def cluster(self, location_list, threshold=50):
         """
-        散点聚类
-        :param location_list:  需要聚类的点的信息
+        散点聚类(每轮取剩余列表的最后一个矩形为中心, 与其中心点距离不超过阈值的矩形合并为一组, 不做传递合并);
+        中心点只计算一次, 比较距离的平方; motion_boxes在轮廓数量不少于20时返回空列表, 输入最多19个矩形, 聚类开销有上限
+        :param location_list:  需要聚类的点的信息[(x1, y1, x2, y2)]
         :param threshold:  聚类距离阈值
-        :return:
+        :return: 合并后的矩形列表[(left, top, right, bottom)]
         """
+        limit = threshold * threshold
+        remaining = [(x1, y1, x2, y2, (x1 + x2) / 2, (y1 + y2) / 2) for x1, y1, x2, y2 in location_list]
         result_list = []
-        while len(location_list) > 0:
-            x1, y1, x2, y2 = location_list.pop()
-            left, right, top, bottom = x1, x2, y1, y2
+        while remaining:
+            left, top, right, bottom, center_x, center_y = remaining.pop()
             temp_list = []
-            all_points = [(x1, y1, x2, y2)]
-            while len(location_list) > 0:
-                temp_x1, temp_y1, temp_x2, temp_y2 = location_list.pop()
-                temp_center_point = ((temp_x1 + temp_x2) / 2, (temp_y1 + temp_y2) / 2)
-                find = False
-                for point in all_points:
-                    center_point = ((point[0] + point[2]) / 2, (point[1] + point[3]) / 2)
-                    distance = self.calc_distance(center_point, temp_center_point)
-                    if distance <= threshold:
-                        left = min(left, temp_x1)
-                        right = max(right, temp_x2)
-                        top = min(top, temp_y1)
-                        bottom = max(bottom, temp_y2)
-                        find = True
-                        break
-                if not find:
-                    temp_list.append((temp_x1, temp_y1, temp_x2, temp_y2))
-            location_list = temp_list
+            for item in reversed(remaining):
+                if (item[4] - center_x) ** 2 + (item[5] - center_y) ** 2 <= limit:
+                    left, top = min(left, item[0]), min(top, item[1])
+                    right, bottom = max(right, item[2]), max(bottom, item[3])
+                else:
+                    temp_list.append(item)
+            remaining = temp_list
             result_list.append((left, top, right, bottom))
 
         return result_list
 
-    def frame_differ(self, per_frame_gary, frame_gary):
+    def _buffer(self, name, shape):
         """
-        魔改版帧差法
-        :param per_frame_gary: 前一帧
-        :param frame_gary: 当前帧
-        :return: 可能为运动目标的区域信息
+        获取复用的缓冲区(尺寸变化时重新分配)
+        :param name: 缓冲区名称
+        :param shape: 尺寸
+        :return: uint8数组
         """
+        buffer = self._buffers.get(name)
+        if buffer is None or buffer.shape != shape:
+            buffer = self._buffers[name] = np.empty(shape, dtype=np.uint8)
+        return buffer
 
-        # 帧差法
-        diff = cv2.absdiff(per_frame_gary, frame_gary)
-        diff_stat = np.median(diff)
+    @staticmethod
+    def median(image):
+        """
+        直方图计算uint8图像的中位数(与np.median结果相同, 不需要排序)
+        :param image: uint8图像
+        :return: 中位数
+        """
+        cumsum = np.cumsum(np.bincount(image.ravel(), minlength=256))
+        total = int(cumsum[-1])
+        low = int(np.searchsorted(cumsum, (total - 1) // 2 + 1))
+        high = int(np.searchsorted(cumsum, total // 2 + 1))
+        return (low + high) / 2
 
-        if diff_stat > 2:
+    def motion_boxes(self, per_frame_gary, frame_gary, translation=None):
+        """
+        帧差法核心(差分, 中位数判断, 模糊, 二值化, 腐蚀, 膨胀, 轮廓提取), 缓冲区在帧间复用
+        :param per_frame_gary: 前一帧
+        :param frame_gary: 当前帧
+        :param translation: 两帧间的位移矢量(用于判断噪点掩膜标定时载物台是否移动, None表示未知)
+        :return: 运动区域的外接矩形列表[(x1, y1, x2, y2)](原图坐标)
+        """
+        if self.noise_mask.shape is None:
+            self.noise_mask.init(frame_gary.shape)  # 读取缓存的掩膜
+        scale = 1
+        if self.pyramid:
+            height, width = frame_gary.shape
+            shape = ((height + 1) // 2, (width + 1) // 2)
+            per_frame_gary = cv2.pyrDown(per_frame_gary, dst=self._buffer('per_frame', shape))
+            frame_gary = cv2.pyrDown(frame_gary, dst=self._buffer('frame', shape))
+            scale = 2
+        shape = frame_gary.shape
+
+        diff = cv2.absdiff(per_frame_gary, frame_gary, dst=self._buffer('diff', shape))
+        if self.median(diff) > self.MEDIAN_LIMIT:
             return []
-        diff = cv2.GaussianBlur(diff, (5, 5), 0)
-
-        ret, binary = cv2.threshold(diff, 20, 255, cv2.THRESH_BINARY)
-
-        ksize1, ksize2 = (3, 3)
-        kernel1 = np.ones((ksize1, ksize1), np.float64)
-
-        binary = cv2.morphologyEx(binary, cv2.MORPH_ERODE, kernel1)
-
-        kernel2 = np.ones((ksize2, ksize2), np.uint8)
-        binary = cv2.morphologyEx(binary, cv2.MORPH_DILATE, kernel2, iterations=10)
-
-        cnts, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-
+        blurred = cv2.GaussianBlur(diff, self._blur_size, 0, dst=self._buffer('blurred', shape))
+        binary = self._buffer('binary', shape)
+        cv2.threshold(blurred, 20, 255, cv2.THRESH_BINARY, dst=binary)
+        eroded = cv2.erode(binary, self._erode_kernel, dst=self._buffer('eroded', shape))
+        if self.noise_mask.calibrating:
+            self.noise_mask.accumulate(eroded, translation)
+        dilated = cv2.dilate(eroded, self._dilate_kernel, dst=binary)
+
+        cnts, _ = cv2.findContours(dilated, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
         if len(cnts) >= 20:
             return []
+        boxes = []
+        for cnt in cnts:
+            x, y, w, h = cv2.boundingRect(cnt)
+            boxes.append((x * scale, y * scale, (x + w) * scale, (y + h) * scale))
+        return boxes
+
+    def locate(self, boxes):
+        """
+        运动区域过滤与聚类
+        :param boxes: 运动区域的外接矩形列表
+        :return: 可能为运动目标的区域信息[(中心点x, 中心点y, 面积)]
+        """
 
         # 初步过滤
         location_list = []
-        for cnt in cnts:
-            x, y, w, h = cv2.boundingRect(cnt)
-            x1, y1, x2, y2 = x, y, x + w, y + h
+        for x1, y1, x2, y2 in boxes:
             center_point = ((x1 + x2) / 2, (y1 + y2) / 2)
             area = (x2 - x1) * (y2 - y1)
-            if 100 < area < 10000 and not self.filter_screen_noisy(center_point):
+            if 100 < area < 10000 and not self.noise_mask.is_noisy(center_point):
                 location_list.append((x1, y1, x2, y2))
 
         # 散点聚类
@@ -130,41 +143,46 @@ class FrameDifferDetector:
 
         return point_list
 
-    def detect(self, blurry, frame_index, frame, outputs):
+    def frame_differ(self, per_frame_gary, frame_gary, translation=None):
+        """
+        魔改版帧差法
+        :param per_frame_gary: 前一帧
+        :param frame_gary: 当前帧
+        :param translation: 两帧间的位移矢量(None表示未知)
+        :return: 可能为运动目标的区域信息
+        """
+        return self.locate(self.motion_boxes(per_frame_gary, frame_gary, translation))
+
+    def detect(self, blurry, frame_index, frame, outputs, translation):
         """
         小虫子检测
-        :param blurry: 当前帧是否模糊
+        :param blurry: 当前帧是否模糊(模糊帧跳过检测)
         :param frame_index: 帧数
-        :param frame: 图像
+        :param frame: 图像(共享内存视图, 不在检测器中保留)
         :param outputs: 大虫子检测框
-        :return: (帧数, 显示图像, 过期点列表, 位移矢量, 当前帧的显示信息)
+        :param translation: 当前帧相对上一次输入的位移矢量(由位移矢量进程计算, 计算失败为None)
+        :return: (帧数, 过期点列表, 位移矢量, 当前帧的显示信息)
         """
 
+        # 前一帧只保留灰度图(当前帧属于共享内存, 处理完成后会被回收)
+        per_frame, self.per_frame = self.per_frame, cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
         # 初始化
-        if self.per_frame is None:
-            self.per_frame = frame
+        if per_frame is None:
             frame_height, frame_width, _ = frame.shape
             self.bbox_filter.set_width(frame_width)
             self.bbox_filter.set_height(frame_height)
             self.bbox_filter.update_bbox(outputs)
-            return frame_index, frame, [], None, []
-
-        # 模糊帧不检测
-        if blurry:
-            self.per_frame = frame
-            self.bbox_filter.update_bbox(outputs)
-            return frame_index, frame, [], None, []
-
-        translation, img1, img2 = calc_translation(self.per_frame, frame)
+            return frame_index, [], None, []
 
         # 位移矢量计算有误
-        if len(translation) == 0:
-            self.per_frame = frame
+        if translation is None:
             self.bbox_filter.update_bbox(outputs)
-            return frame_index, frame, [], None, []
+            return frame_index, [], None, []
+        img1, img2 = warp_translation(per_frame, translation), self.per_frame
 
-        # 帧差法
-        message_list = self.frame_differ(img1, img2)
+        # 帧差法(模糊帧跳过帧差法, 只用位移矢量推进追踪器, 追踪序列与帧数保持对齐)
+        message_list = [] if blurry else self.frame_differ(img1, img2, translation)
 
         # 大虫子过滤
         self.bbox_filter.update_bbox(outputs, translation)
@@ -173,12 +191,6 @@ class FrameDifferDetector:
         # 数据更新
         self.tracker.update(frame_index, message_list, translation)
 
-        # 显示处理
-        show_image = deepcopy(frame)
-        for track in self.tracker.display_tracks():
-            track.draw(show_image)
-
-        self.per_frame = frame
         clear_list = self.tracker.clear()
 
-        return frame_index, show_image, clear_list, translation, self.tracker.display_tracks()
+        return frame_index, clear_list, translation, self.tracker.display_tracks()
@@ -1,10 +1,17 @@
 import math
-import cv2
-from copy import deepcopy
-from tools.real_time_speed import linear_velocity, angular_velocity
+import numpy as np
+from tools.track_history import TrackHistory
+from tools.real_time_speed import linear_velocity, angular_velocity, speed_and_distance
+from tools.drawer import TrackSnapshot, draw_trails
 
 
 class Track:
+    """
+    小虫子追踪信息
+    展示点轨迹以累计位移坐标系保存(屏幕坐标 = 轨迹点 + 累计位移), 每帧只更新累计位移, 不改写已有的点;
+    检测次数与跨度(y的最小/最大值)随更新累计, 不再逐帧遍历序列; 历史数据保存在轨迹历史数组中
+    """
+    # 存活时间与丢失阈值以帧差法的输入为单位(每隔一帧读取到的帧, 抽帧步长为stride时对应2*stride帧原视频帧)
     SERVAL_TIME = 100  # 存活时间
     BUG_TYPE = 'SmallProtozoa'  # 小虫子类别
     MISSING_THRESHOLD = 15  # 追踪目标丢失阈值
@@ -22,12 +29,20 @@ class Track:
         self.bug_type = self.BUG_TYPE
         self.serval_time = self.SERVAL_TIME
         self.missing_counter = 0
-        self.base_point = (message[0], message[1])  # 预测基准点
-        self.area_list = [message[2]]  # 面积列表
-        self.detection_sequence = [1]  # 检测序列
-        self.real_point_list = [self.base_point]  # 真实点序列
-        self.trajectory_list = [self.base_point]  # 小虫子最终轨迹
-        self.display_trajectory_list = [self.base_point]  # 展示点轨迹
+        self.base_point = (message[0], message[1])  # 预测基准点(屏幕坐标)
+        # 每帧的信息: 展示点(累计位移坐标系), 是否被检测到
+        self.frames = TrackHistory({'point': (2, np.int64), 'detected': (0, np.int8)})
+        self.frames.append(point=self.base_point, detected=1)
+        # 每次被检测到的信息: 真实点, 面积
+        self.detections = TrackHistory({'point': (2, np.int64), 'area': (0, np.float64)})
+        self.detections.append(point=self.base_point, area=message[2])
+
+        self.offset = (0, 0)  # 累计位移(整数)
+        self.trajectory_length = 1  # 最终轨迹长度(最后一次被检测到时的展示点数量)
+        self.trajectory_offset = (0, 0)  # 最后一次被检测到时的累计位移
+        self._trajectory = None  # 已经展开的最终轨迹(屏幕坐标, None表示由展示点轨迹计算)
+        self._bounds = [message[0], message[0], message[1], message[1]]  # 所有展示点的[x最小, x最大, y最小, y最大]
+        self._span = [math.inf, -math.inf]  # 除最后一个点以外的展示点的[y最小, y最大]
 
     @classmethod
     def cls(cls):
@@ -37,6 +52,66 @@ class Track:
         """
         return cls.BUG_TYPE
 
+    @property
+    def hits(self):
+        """
+        被检测到的帧数(检测序列中1的数量)
+        :return: 帧数
+        """
+        return len(self.detections)
+
+    @property
+    def detection_sequence(self):
+        """
+        检测序列
+        :return: 检测序列列表(1: 被检测到, 0: 未被检测到)
+        """
+        return self.frames.column('detected').tolist()
+
+    @property
+    def area_list(self):
+        """
+        面积列表
+        :return: 每次被检测到时的面积列表
+        """
+        return self.detections.column('area').tolist()
+
+    @property
+    def real_point_list(self):
+        """
+        真实点序列
+        :return: 每次被检测到时的坐标列表
+        """
+        return [tuple(point) for point in self.detections.column('point').tolist()]
+
+    @property
+    def display_trajectory_list(self):
+        """
+        展示点轨迹(屏幕坐标, 读取时计算)
+        :return: 轨迹点列表
+        """
+        return [tuple(point) for point in (self.frames.column('point') + self.offset).tolist()]
+
+    @property
+    def trajectory_list(self):
+        """
+        小虫子最终轨迹(最后一次被检测到时的屏幕坐标, 读取时计算)
+        :return: 轨迹点列表
+        """
+        if self._trajectory is not None:
+            return [tuple(point) for point in self._trajectory.tolist()]
+        trajectory = self.frames.column('point')[:self.trajectory_length] + self.trajectory_offset
+        return [tuple(point) for point in trajectory.tolist()]
+
+    def _trajectory_points(self):
+        """
+        计算速度与路程使用的最终轨迹(与屏幕坐标只相差一个整数平移, 距离与转角不变)
+        :return: (n, 2)数组视图
+        """
+        if self._trajectory is not None:
+            return self._trajectory
+        return self.frames.column('point')[:self.trajectory_length]
+
     def update(self, message=None, translation=None):
         """
         更新小虫子信息
@@ -49,32 +124,80 @@ class Track:
         self.update_display_queue(translation)
 
         if message:
-            self.detection_sequence.append(1)
-            self.real_point_list.append((message[0], message[1]))
             self.base_point = (message[0], message[1])
-            self.area_list.append(message[2])
-            self.display_trajectory_list.append((message[0], message[1]))
-            self.trajectory_list = deepcopy(self.display_trajectory_list)
+            self.detections.append(point=self.base_point, area=message[2])
+            self._append_point(self.base_point, 1)
+            self.trajectory_length = len(self.frames)
+            self.trajectory_offset = self.offset
+            self._trajectory = None
             self.missing_counter = 0
         else:
-            self.detection_sequence.append(0)
             if self.missing_counter < self.MISSING_THRESHOLD:
                 self.base_point = (int(self.base_point[0] + translation[0]), int(self.base_point[1] + translation[1]))
                 self.missing_counter += 1
-            self.display_trajectory_list.append(self.base_point)
+            self._append_point(self.base_point, 0)
+
+    def _append_point(self, point, detected):
+        """
+        添加展示点
+        :param point: 屏幕坐标
+        :param detected: 是否被检测到
+        :return: None
+        """
+        last_y = int(self.frames.last('point')[1])
+        self._span = [min(self._span[0], last_y), max(self._span[1], last_y)]
+        x, y = point[0] - self.offset[0], point[1] - self.offset[1]
+        self.frames.append(point=(x, y), detected=detected)
+        self._bounds = [min(self._bounds[0], x), max(self._bounds[1], x), min(self._bounds[2], y),
+                        max(self._bounds[3], y)]
+
+    @staticmethod
+    def _shift(low, high, t):
+        """
+        计算整数坐标区间内所有点按位移平移后(int截断)的统一增量
+        :param low: 坐标最小值
+        :param high: 坐标最大值
+        :param t: 位移
+        :return: 增量(区间内的点增量不一致时为None)
+        """
+        if (low + t >= 0) != (high + t >= 0):
+            return None  # 截断方向不同
+        shift = int(low + t) - low
+        # 浮点舍入只可能发生在数值较大的一端, 两端增量相同则区间内所有点增量相同
+        return shift if int(high + t) - high == shift else None
 
     def update_display_queue(self, translation=None):
         """
-        更新用于显示的轨迹
+        更新用于显示的轨迹(只更新累计位移, 与逐点int(点 + 位移)的结果一致)
         :param translation: 位移矢量
         :return:
         """
 
         if translation:
-            for i in range(len(self.display_trajectory_list)):
-                self.display_trajectory_list[i] = (
-                    int(self.display_trajectory_list[i][0] + translation[0]),
-                    int(self.display_trajectory_list[i][1] + translation[1]))
+            offset_x, offset_y = self.offset
+            shift_x = self._shift(self._bounds[0] + offset_x, self._bounds[1] + offset_x, translation[0])
+            shift_y = self._shift(self._bounds[2] + offset_y, self._bounds[3] + offset_y, translation[1])
+            if shift_x is not None and shift_y is not None:
+                self.offset = (offset_x + shift_x, offset_y + shift_y)
+                return
+
+            # 各点增量不一致(部分点移出屏幕左上方), 逐点平移并改写展示点
+            points = self.frames.column('point')
+            if self._trajectory is None:
+                self._trajectory = points[:self.trajectory_length] + self.trajectory_offset
+            screen = points + self.offset + np.asarray(translation, dtype=np.float64)
+            points[:] = np.trunc(screen).astype(np.int64) - self.offset
+            self._reset_bounds()
+
+    def _reset_bounds(self):
+        """
+        重新计算展示点的坐标范围与跨度
+        :return: None
+        """
+        points = self.frames.column('point')
+        xs, ys = points[:, 0], points[:, 1]
+        self._bounds = [int(xs.min()), int(xs.max()), int(ys.min()), int(ys.max())]
+        self._span = [int(ys[:-1].min()), int(ys[:-1].max())] if len(ys) > 1 else [math.inf, -math.inf]
 
     def missing(self):
         """
@@ -91,11 +214,14 @@ class Track:
         """
         die = False
         if self.serval_time <= 0:
-            while len(self.detection_sequence) > 0 and self.detection_sequence[-1] == 0:
-                self.detection_sequence.pop()
-            length = len(self.detection_sequence)
-            self.trajectory_list = self.trajectory_list[:length]
-            self.display_trajectory_list = self.display_trajectory_list[:length]
+            # 去掉最后一次被检测到之后的帧
+            length = int(np.flatnonzero(self.frames.column('detected'))[-1]) + 1
+            self.trajectory_length = min(self.trajectory_length, length)
+            if self._trajectory is not None:
+                self._trajectory = self._trajectory[:length]
+            if length < len(self.frames):
+                self.frames.truncate(length)
+                self._reset_bounds()
             die = True
         return die
 
@@ -104,10 +230,9 @@ class Track:
         跨度的计算
         :return: 跨度
         """
-        span_list = [point[1] for point in self.display_trajectory_list[:-1]]
-        if len(span_list) <= 1:
+        if len(self.frames) - 1 <= 1:
             return float('inf')
-        return round(max(span_list) - min(span_list), 2)
+        return round(self._span[1] - self._span[0], 2)
 
     def display(self):
         """
@@ -115,7 +240,7 @@ class Track:
         :return: 是否绘制(显示)(True: 显示, False: 不显示)
         """
 
-        display = True if self.detection_sequence.count(1) > 2 else False
+        display = True if self.hits > 2 else False
         return display
 
     def draw(self, frame):
@@ -126,19 +251,15 @@ class Track:
         """
 
         if self.display():
-            circle_color = (0, 0, 255)
-            line_color = (0, 255, 0)
-            # 绘制移动轨迹
-            for i in range(1, len(self.display_trajectory_list)):
-                cv2.line(frame, self.display_trajectory_list[i - 1], self.display_trajectory_list[i], line_color,
-                         thickness=5)
-            # 绘制当前位置
-            x, y = self.display_trajectory_list[-1]
-            cv2.circle(frame, (x, y), 10, circle_color, -1)
-            # 绘制文本信息
-            x = (x + 50) if x < 500 else (x - 100)
-            y = (y + 30) if y < 500 else (y - 20)
-            cv2.putText(frame, f'SP {self.track_id}', (x, y), cv2.FONT_HERSHEY_SIMPLEX, 1, circle_color, 2)
+            draw_trails(frame, [self.snapshot()])
+
+    def snapshot(self):
+        """
+        显示快照接口
+        :return: 显示快照
+        """
+        return TrackSnapshot(self.BUG_TYPE, self.track_id, bool(self.frames.last('detected')), None,
+                             tuple(self.display_trajectory_list), self.linear_velocity(), self.angular_velocity())
 
     def detect(self):
         """
@@ -147,14 +268,14 @@ class Track:
         """
         really = False
 
-        if self.angular_velocity() <= 0 or self.detection_sequence.count(1) < 3:
+        if self.angular_velocity() <= 0 or self.hits < 3:
             return False
 
-        if self.detection_sequence.count(1) > 2 and self.span() <= 50:
+        if self.hits > 2 and self.span() <= 50:
             really = True
-        elif self.detection_sequence.count(1) > 5 and self.span() <= 150:
+        elif self.hits > 5 and self.span() <= 150:
             really = True
-        elif self.detection_sequence.count(1) > 20 and self.span() <= 500:
+        elif self.hits > 20 and self.span() <= 500:
             really = True
 
         return really
@@ -165,7 +286,8 @@ class Track:
         :return: 面积
         """
 
-        area = sum(self.area_list) / len(self.area_list)
+        area = self.detections.column('area')
+        area = float(area.cumsum()[-1]) / len(area)  # 按顺序累加, 与逐项求和结果一致
         return area
 
     def linear_velocity(self):
@@ -174,7 +296,7 @@ class Track:
         :return: 移动速度
         """
 
-        v1 = linear_velocity(self.trajectory_list)
+        v1 = linear_velocity(self._trajectory_points())
         return v1
 
     def angular_velocity(self):
@@ -183,7 +305,7 @@ class Track:
         :return: 角速度
         """
 
-        w1 = angular_velocity(self.trajectory_list)
+        w1 = angular_velocity(self._trajectory_points())
         return w1
 
     def transfer(self):
@@ -199,15 +321,4 @@ class Track:
         :return: (速度列表，路程列表)
         """
 
-        speed_list, distance_list = [], []
-        for i in range(1, len(self.trajectory_list)):
-            point1, point2 = self.trajectory_list[i - 1], self.trajectory_list[i]
-            distance = math.sqrt((point1[0] - point2[0]) ** 2 + (point1[1] - point2[1]) ** 2)
-            if len(distance_list) > 0:
-                distance_list.append(distance_list[-1] + distance)
-            else:
-                distance_list.append(distance)
-            speed = distance_list[-1] / i
-            speed_list.append(speed)
-
-        return speed_list, distance_list
+        return speed_and_distance(self._trajectory_points())
@@ -1,6 +1,5 @@
 import math
 from .track import Track
-from copy import deepcopy
 
 
 class Tracker:
@@ -87,9 +86,9 @@ class Tracker:
     def display_tracks(self):
         """
         当前检测到的小虫子
-        :return: 小虫子信息列表
+        :return: 小虫子显示快照列表
         """
 
-        display_tracks = deepcopy(
-            [display_track for display_track in self.display_tracks_list if display_track.display()])
+        display_tracks = [display_track.snapshot() for display_track in self.display_tracks_list if
+                          display_track.display()]
         return display_tracks
@@ -0,0 +1,125 @@
+import queue
+import time
+from multiprocessing import Array
+from tools.telemetry import StageTelemetry
+
+END_OF_STREAM = 'END_OF_STREAM'  # 数据流结束标记(依次经过每个队列通知下游)
+
+
+def is_end_of_stream(data):
+    """
+    判断数据是否为结束标记
+    :param data: 队列中取出的数据
+    :return: 是否为结束标记
+    """
+    return isinstance(data, str) and data == END_OF_STREAM
+
+
+class StageMonitor:
+    """
+    阶段心跳记录(共享内存中保存每个阶段最近一次活动的时间, 阶段写入不经过Manager进程)
+    """
+
+    def __init__(self, names):
+        """
+
+        :param names: 阶段名称列表(与完成标志名称一致)
+        """
+        self.names = list(names)
+        self._beats = Array('d', len(self.names))
+        for name in self.names:
+            self.beat(name)
+
+    def beat(self, name):
+        """
+        记录阶段活动
+        :param name: 阶段名称
+        :return: None
+        """
+        self._beats[self.names.index(name)] = time.time()
+
+    def idle_time(self, name):
+        """
+        阶段距离最近一次活动的时间
+        :param name: 阶段名称
+        :return: 时间(单位/秒)
+        """
+        return time.time() - self._beats[self.names.index(name)]
+
+
+class StageProcessing:
+    """
+    流水线阶段进程基类
+    阶段进程阻塞等待输入(带超时), 通过结束标记通知下游, 不再轮询队列与加锁
+    每次取输入(收到数据或等待超时)都会记录心跳, 只有卡在处理或输出中的阶段才会停止心跳
+    """
+    TIMEOUT = 1  # 等待输入的超时时间(单位/秒)
+    SIGN_NAME = None  # 完成标志名称(子类设置)
+
+    def __init__(self, sign_dict):
+        """
+
+        :param sign_dict: 进程通信标记
+        """
+        self.sign_dict = sign_dict
+        self.stage_monitor = None
+        self.telemetry = StageTelemetry(self.SIGN_NAME.removesuffix('_sign'))  # 阶段运行指标
+        self.telemetry_queue = None
+
+    def set_monitor(self, stage_monitor):
+        """
+        设置阶段心跳记录
+        :param stage_monitor: 阶段心跳记录对象
+        :return: None
+        """
+        self.stage_monitor = stage_monitor
+
+    def set_telemetry_queue(self, telemetry_queue):
+        """
+        设置运行指标队列(阶段结束时放入一次指标汇总)
+        :param telemetry_queue: 运行指标队列
+        :return: None
+        """
+        self.telemetry_queue = telemetry_queue
+
+    def _beat(self):
+        """
+        记录心跳
+        :return: None
+        """
+        if self.stage_monitor is not None:
+            self.stage_monitor.beat(self.SIGN_NAME)
+
+    def _get_data(self, input_queue, backlog):
+        """
+        阻塞获取一条输入数据放入本地缓存
+        :param input_queue: 输入队列
+        :param backlog: 本地缓存(deque)
+        :return: 输入是否已经结束(True: 收到结束标记, False: 收到数据或等待超时)
+        """
+        self._beat()
+        self.telemetry.sample()
+        wait_start = time.time()
+        try:
+            data = input_queue.get(timeout=self.TIMEOUT)
+        except queue.Empty:
+            return False
+        finally:
+            self.telemetry.idle(time.time() - wait_start)
+        if is_end_of_stream(data):
+            return True
+        backlog.append(data)
+        return False
+
+    def _finish(self, *output_queues):
+        """
+        向下游队列发送结束标记并更改完成标志(确认本阶段的数据已全部处理并输出)
+        :param output_queues: 下游队列
+        :return: None
+        """
+        for output_queue in output_queues:
+            output_queue.put(END_OF_STREAM)
+        if self.telemetry_queue is not None:
+            self.telemetry_queue.put(self.telemetry.summary())
+        self._beat()
+        self.sign_dict[self.SIGN_NAME] = True
@@ -1,3 +1,6 @@
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import cv2
 import imutils
@@ -7,11 +10,31 @@ class BlueDetector:
     """
     模糊度检测
     详见 https://github.com/SrikanthIITB/Fast-Fourier-Transform-FFT-for-blur-detection-in-images-and-video
+    检测方法:
+        fft: 原始复数FFT计算(与旧版本模糊度值一致)
+        rfft: 实数FFT计算(去除的低频区域与fft相同), 先转灰度再缩放并复用缓冲区, 模糊度值与fft相差约0.1以内
+        laplacian: 拉普拉斯方差(值越小越模糊)
     """
+    METHODS = ('fft', 'rfft', 'laplacian')
 
-    def __init__(self, size=60, threshold=10):
+    def __init__(self, size=60, threshold=10, method='fft', width=500, workers=0):
+        """
+
+        :param size: 频域中去除的低频区域半径
+        :param threshold: 模糊阈值(小于等于阈值视为模糊)
+        :param method: 检测方法(fft, rfft, laplacian)
+        :param width: 缩放后的图像宽度
+        :param workers: 并行检测的线程数(0表示在调用线程中检测)
+        """
+        if method not in self.METHODS:
+            raise ValueError(f'模糊度检测方法需为{self.METHODS}之一, 当前为{method}')
         self.size = size
         self.threshold = threshold
+        self.method = method
+        self.width = width
+        self.workers = workers
+        self._local = threading.local()  # 每个线程独立的缩放缓冲区
+        self._executor = None
 
     def _detect_blur_fft(self, image):
         """
@@ -34,17 +57,187 @@ class BlueDetector:
 
         return mean, mean <= self.threshold
 
+    def _bases(self, h, w):
+        """
+        获取边界频率的复指数基(每个线程按图像尺寸缓存)
+        :param h: 图像高度
+        :param w: 图像宽度
+        :return: (水平频率-size~size的基(2size+1, w), 垂直频率-size~size-1的基(h, 2size),
+                  垂直频率size的基(含1/(h*w)归一化), 水平频率size的基)
+        """
+        bases = getattr(self._local, 'bases', None)
+        if bases is None or bases[0] != (h, w):
+            size = self.size
+            x, y = np.arange(w), np.arange(h)
+            bases = self._local.bases = ((h, w),
+                                         np.exp(2j * np.pi * np.outer(np.arange(-size, size + 1), x) / w),
+                                         np.exp(2j * np.pi * np.outer(y, np.arange(-size, size)) / h),
+                                         np.exp(2j * np.pi * size * y / h) / (h * w),
+                                         np.exp(2j * np.pi * size * x / w))
+        return bases[1:]
+
+    def _detect_blur_rfft(self, image):
+        """
+        实数FFT计算模糊度(同一灰度图上与复数FFT的结果一致)
+        复数FFT去除的低频区域为[-size, size)x[-size, size), 不对称, 重建结果为复数; 实数FFT只能去除对称区域
+        [-size, size]x[-size, size](重建结果为实数), 两者之差为频率size所在的一行和一列, 这部分单独按复指数求和补回
+        :param image: 灰度图像
+        :return: (模糊度值, 是否模糊)
+        """
+        h, w = image.shape
+        size = self.size
+        fft = np.fft.rfft2(image)
+        x_bases, y_bases, row_base, column_base = self._bases(h, w)
+
+        # 复数FFT保留而对称区域去除的频率: 垂直频率size的一行(水平频率-size~size, 负频率由共轭对称得到),
+        # 水平频率size的一列(垂直频率-size~size-1)
+        row = np.concatenate([np.conj(fft[h - size, size:0:-1]), fft[size, :size + 1]])
+        column = np.concatenate([fft[h - size:, size], fft[:size, size]])
+        extra = np.outer(row_base, row @ x_bases) + np.outer(y_bases @ column, column_base / (h * w))
+
+        # 未平移的频谱中低频位于四角, 实数FFT只保留非负的水平频率
+        fft[:size + 1, :size + 1] = 0
+        fft[h - size:, :size + 1] = 0
+        recon = np.fft.irfft2(fft, s=(h, w))
+
+        magnitude = 20 * np.log(np.hypot(recon + extra.real, extra.imag))
+        mean = np.mean(magnitude)
+
+        return mean, mean <= self.threshold
+
+    def _detect_blur_laplacian(self, image):
+        """
+        拉普拉斯方差计算模糊度
+        :param image: 灰度图像
+        :return: (模糊度值, 是否模糊)
+        """
+        variance = cv2.Laplacian(image, cv2.CV_64F).var()
+        return variance, variance <= self.threshold
+
+    def _gray(self, frame):
+        """
+        先转换为灰度图再缩放(只缩放单通道图像, 写入当前线程的复用缓冲区)
+        与fft方法(先缩放彩色图再转换)的灰度值只有取整差异, 模糊度值相差约0.1以内
+        :param frame: 图像
+        :return: 灰度图像
+        """
+        h, w = frame.shape[:2]
+        buffers = getattr(self._local, 'buffers', None)
+        if buffers is None or buffers[0] != (h, w):
+            # 与imutils.resize的尺寸一致(保持宽高比, 不缩放到最优DFT尺寸)
+            size = (self.width, max(1, int(h * (self.width / float(w)))))
+            full = np.empty((h, w), dtype=np.uint8)
+            gray = np.empty((size[1], size[0]), dtype=np.uint8)
+            buffers = self._local.buffers = ((h, w), full, gray)
+        _, full, gray = buffers
+
+        cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=full)
+        cv2.resize(full, (gray.shape[1], gray.shape[0]), dst=gray, interpolation=cv2.INTER_AREA)
+        return gray
+
     def detect(self, frame):
         """
         模糊度检测接口
         :param frame: 图像
         :return: (是否模糊,模糊度文本信息,模糊度值)
         """
-        frame = imutils.resize(frame, width=500)
+        if self.method == 'fft':
+            frame = imutils.resize(frame, width=self.width)
 
-        # convert the frame to grayscale and detect blur in it
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        mean, blurry = self._detect_blur_fft(gray)
+            # convert the frame to grayscale and detect blur in it
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            mean, blurry = self._detect_blur_fft(gray)
+        elif self.method == 'rfft':
+            mean, blurry = self._detect_blur_rfft(self._gray(frame))
+        else:
+            mean, blurry = self._detect_blur_laplacian(self._gray(frame))
         text = f"Blurry ({mean:.4f})" if blurry else f"Not Blurry ({mean:.4f})"
 
         return blurry, text, round(float(mean), 2)
+
+    def _pool(self):
+        """
+        获取检测线程池(首次使用时创建)
+        :return: 线程池
+        """
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    def detect_batch(self, frames):
+        """
+        批量模糊度检测
+        :param frames: 图像列表
+        :return: [(是否模糊,模糊度文本信息,模糊度值)]
+        """
+        if not self.workers:
+            return [self.detect(frame) for frame in frames]
+        return list(self._pool().map(self.detect, frames))
+
+    def detect_ahead(self, items, ahead=None):
+        """
+        在线程池中提前检测后续的帧, 按输入顺序返回结果(FFT与OpenCV计算时释放GIL, 检测与读取可以并行)
+        :param items: 可迭代对象, 每项为(帧标识, 图像)
+        :param ahead: 最多提前检测的帧数(None表示线程数的两倍)
+        :return: 生成器, 每项为(帧标识, 图像, (是否模糊,模糊度文本信息,模糊度值))
+        """
+        if not self.workers:
+            for key, frame in items:
+                yield key, frame, self.detect(frame)
+            return
+
+        ahead = ahead or self.workers * 2
+        pool = self._pool()
+        pending = deque()
+        for key, frame in items:
+            pending.append((key, frame, pool.submit(self.detect, frame)))
+            if len(pending) >= ahead:
+                key, frame, future = pending.popleft()
+                yield key, frame, future.result()
+        while pending:
+            key, frame, future = pending.popleft()
+            yield key, frame, future.result()
+
+    def close(self):
+        """
+        关闭检测线程池
+        :return: None
+        """
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+
+class BlurGate:
+    """
+    模糊帧门控
+    模糊度小于等于阈值时开始跳过检测, 模糊度大于阈值与回滞量之和时才恢复检测(避免在阈值附近反复切换),
+    连续跳过max_gap帧后强制检测一帧, 保证追踪器不会因长时间模糊而丢失目标
+    """
+
+    def __init__(self, threshold=-10000, hysteresis=0, max_gap=10):
+        """
+
+        :param threshold: 模糊阈值(与检测方法的模糊度值对应)
+        :param hysteresis: 恢复检测所需超过阈值的回滞量
+        :param max_gap: 最多连续跳过的帧数
+        """
+        self.threshold = threshold
+        self.hysteresis = hysteresis
+        self.max_gap = max_gap
+        self.blurry = False  # 当前是否处于模糊状态
+        self.gap = 0  # 已连续跳过的帧数
+
+    def skip(self, score):
+        """
+        当前帧是否跳过检测
+        :param score: 当前帧的模糊度值
+        :return: 是否跳过(True: 跳过, False: 检测)
+        """
+        threshold = self.threshold + self.hysteresis if self.blurry else self.threshold
+        self.blurry = score <= threshold
+        if self.blurry and self.gap < self.max_gap:
+            self.gap += 1
+            return True
+        self.gap = 0
+        return False
@@ -1,4 +1,5 @@
 import math
+import numpy as np
 from .ar_flaw import ar_flaw
 from .real_time_speed import linear_velocity, angular_velocity
 import logging
@@ -11,7 +12,7 @@ logging.basicConfig(level=logging.INFO, filename='app.log', filemode='a',
 def cal_translation_v1(center_point_list):
     """
     平均移动速度 v1
-    :param center_point_list: 轨迹列表
+    :param center_point_list: 轨迹列表或(n, 2)数组(可以是轨迹历史的数组视图)
     :return: 移动速度v1
     """
     v1 = linear_velocity(center_point_list)
@@ -21,7 +22,7 @@ def cal_translation_v1(center_point_list):
 def cal_translation_w1(center_point_list):
     """
     平均角速度 w1
-    :param center_point_list: 轨迹列表
+    :param center_point_list: 轨迹列表或(n, 2)数组(可以是轨迹历史的数组视图)
     :return: 角度苏w1
     """
     w1 = angular_velocity(center_point_list)
@@ -32,16 +33,13 @@ def cal_average_area(image, bbox_list):
     """
     计算微生物面积
     :param image:
-    :param bbox_list:
+    :param bbox_list: 检测框列表或(n, 4)数组
     :return: 微生物面积
     """
-    area_list = []
-    for bbox in bbox_list:
-        x1, y1, x2, y2 = bbox
-        area = (x2 - x1) * (y2 - y1)
-        area_list.append(area)
-    if len(area_list) > 0:
-        area = round(sum(area_list) / len(area_list), 2)
+    bboxes = np.asarray(bbox_list, dtype=np.float64).reshape(-1, 4)
+    if len(bboxes) > 0:
+        area_list = (bboxes[:, 2] - bboxes[:, 0]) * (bboxes[:, 3] - bboxes[:, 1])
+        area = round(float(area_list.cumsum()[-1]) / len(area_list), 2)
     else:
         area = 0
     # height, width = image.shape[:2]
@@ -1,21 +1,48 @@
 import cv2
-from copy import deepcopy
+from collections import namedtuple
+
+# 微生物显示快照(只包含绘制与数据面板需要的信息, 代替整个追踪对象在进程间传递)
+# cls: 类别英文名称缩写, track_id: 追踪id, detected: 当前帧是否被检测到,
+# bbox: 最后一个预测框(x1, y1, x2, y2)(小虫子为None), trail: 显示轨迹点元组(大虫子为空), v1: 实时移动速度, w1: 实时角速度
+TrackSnapshot = namedtuple('TrackSnapshot', ('cls', 'track_id', 'detected', 'bbox', 'trail', 'v1', 'w1'))
 
 
 def draw_messages(frame, bug_list):
     """
-    绘制大虫子检测信息
+    绘制大虫子检测信息(直接绘制在传入的视频帧上)
     :param frame: 需要绘制的视频帧
-    :param bug_list: 被检测到的大虫子信息
+    :param bug_list: 大虫子显示快照列表
     :return: 绘制好的图像
     """
-    image = deepcopy(frame)
 
     for bug in bug_list:
-        if bug.detection_sequence[-1]:
-            cls = bug.cls()
-            x1, y1, x2, y2 = bug.bbox_list[-1]
-            label = f'{cls} {bug.track_id}'
-            cv2.rectangle(image, (x1, y1), (x2, y2), (0, 0, 255), 3)  # 框
-            cv2.putText(image, label, (x1 - 20, y1 - 10), cv2.FONT_ITALIC, 1, [0, 0, 255], 3)
-    return image
+        if bug.detected:
+            x1, y1, x2, y2 = bug.bbox
+            label = f'{bug.cls} {bug.track_id}'
+            cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 0, 255), 3)  # 框
+            cv2.putText(frame, label, (x1 - 20, y1 - 10), cv2.FONT_ITALIC, 1, [0, 0, 255], 3)
+    return frame
+
+
+def draw_trails(frame, track_list):
+    """
+    绘制小虫子移动轨迹(直接绘制在传入的视频帧上)
+    :param frame: 需要绘制的视频帧
+    :param track_list: 小虫子显示快照列表
+    :return: 绘制好的图像
+    """
+    circle_color = (0, 0, 255)
+    line_color = (0, 255, 0)
+    for track in track_list:
+        trail = track.trail
+        # 绘制移动轨迹
+        for i in range(1, len(trail)):
+            cv2.line(frame, trail[i - 1], trail[i], line_color, thickness=5)
+        # 绘制当前位置
+        x, y = trail[-1]
+        cv2.circle(frame, (x, y), 10, circle_color, -1)
+        # 绘制文本信息
+        x = (x + 50) if x < 500 else (x - 100)
+        y = (y + 30) if y < 500 else (y - 20)
+        cv2.putText(frame, f'SP {track.track_id}', (x, y), cv2.FONT_HERSHEY_SIMPLEX, 1, circle_color, 2)
+    return frame
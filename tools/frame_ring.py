@@ -0,0 +1,140 @@
+import os
+from multiprocessing import Array, Queue
+from multiprocessing import shared_memory
+import numpy as np
+
+
+class FrameRing:
+    """
+    共享内存帧环形缓冲区
+    进程间只传递槽位索引与元数据, 帧数据保存在固定数量的共享内存槽位中;
+    槽位的引用计数归零(最后一个消费者使用完毕)后槽位回收, 槽位数量即流水线中帧数据的内存上限
+    """
+
+    def __init__(self, slots, shape, dtype=np.uint8):
+        """
+
+        :param slots: 槽位数量
+        :param shape: 单帧图像形状(高, 宽, 通道)
+        :param dtype: 图像数据类型
+        """
+        self.slots = slots
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.slot_size = int(np.prod(self.shape)) * self.dtype.itemsize  # 单个槽位字节数
+
+        self._shm = shared_memory.SharedMemory(create=True, size=self.slot_size * self.slots)
+        self.name = self._shm.name
+        self._owner = True  # 创建者负责释放共享内存
+        self._ref_counts = Array('i', self.slots)  # 槽位引用计数
+        self._free_queue = Queue()  # 空闲槽位队列
+        for slot in range(self.slots):
+            self._free_queue.put(slot)
+        self._frames = self._map()
+
+    def __getstate__(self):
+        """
+        进程间传递时只传递共享内存名称, 在子进程中重新映射
+        :return: 序列化状态
+        """
+        state = self.__dict__.copy()
+        state['_shm'] = None
+        state['_frames'] = None
+        state['_owner'] = False
+        return state
+
+    def __setstate__(self, state):
+        """
+        子进程中重新映射共享内存
+        :param state: 序列化状态
+        :return: None
+        """
+        self.__dict__.update(state)
+        self._shm = shared_memory.SharedMemory(name=self.name)
+        if os.name == 'posix':
+            # 子进程只是映射, 不应由资源追踪器在子进程退出时删除共享内存
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(self._shm._name, 'shared_memory')
+        self._frames = self._map()
+
+    def _map(self):
+        """
+        将共享内存映射为(槽位, 高, 宽, 通道)的数组
+        :return: 帧数组
+        """
+        return np.ndarray((self.slots, *self.shape), dtype=self.dtype, buffer=self._shm.buf)
+
+    def acquire(self, timeout=None):
+        """
+        申请一个空闲槽位(没有空闲槽位时阻塞), 申请到的槽位引用计数为1
+        :param timeout: 超时时间(单位/秒, None表示一直等待)
+        :return: 槽位索引
+        """
+        slot = self._free_queue.get(timeout=timeout)
+        with self._ref_counts.get_lock():
+            self._ref_counts[slot] = 1
+        return slot
+
+    def write(self, slot, frame):
+        """
+        写入帧数据
+        :param slot: 槽位索引
+        :param frame: 图像
+        :return: None
+        """
+        if frame.shape != self.shape:
+            raise ValueError(f'frame shape {frame.shape} does not match ring shape {self.shape}')
+        np.copyto(self._frames[slot], frame)
+
+    def put(self, frame, timeout=None):
+        """
+        申请槽位并写入帧数据
+        :param frame: 图像
+        :param timeout: 超时时间(单位/秒)
+        :return: 槽位索引
+        """
+        slot = self.acquire(timeout)
+        self.write(slot, frame)
+        return slot
+
+    def get(self, slot):
+        """
+        获取槽位中的图像(共享内存视图, 释放槽位后不可再使用)
+        :param slot: 槽位索引
+        :return: 图像
+        """
+        return self._frames[slot]
+
+    def retain(self, slot, count=1):
+        """
+        增加槽位引用计数(槽位被转发给多个消费者时使用)
+        :param slot: 槽位索引
+        :param count: 增加的引用数量
+        :return: None
+        """
+        with self._ref_counts.get_lock():
+            self._ref_counts[slot] += count
+
+    def release(self, slot):
+        """
+        释放一次槽位引用, 引用计数归零时回收槽位
+        :param slot: 槽位索引
+        :return: None
+        """
+        with self._ref_counts.get_lock():
+            self._ref_counts[slot] -= 1
+            free = self._ref_counts[slot] <= 0
+            if free:
+                self._ref_counts[slot] = 0
+        if free:
+            self._free_queue.put(slot)
+
+    def close(self):
+        """
+        关闭共享内存(创建者同时删除共享内存)
+        :return: None
+        """
+        self._frames = None
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
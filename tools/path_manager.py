@@ -14,9 +14,9 @@ class PathDir:
             video_name = 'real-time.mp4'
         else:
             self.video_input_path = str(Path(video_input_dir) / video_name)
-        # self.video_dir = self.mkdirs(save_dir / video_name / 'video')  # 视频保存路径（文件夹）
-        # self.video_path = f'{self.video_dir}/{video_name.split(".")[0]}_result.mp4'  # 视频保存文件路径（具体路径）
-        self.video_path = self.mkdirs(save_dir / video_name / 'images')  # 视频保存路径（文件夹）
+        self.video_dir = self.mkdirs(save_dir / video_name / 'video')  # 视频保存路径（文件夹）
+        self.video_path = f'{self.video_dir}/{video_name.split(".")[0]}_result.mp4'  # 视频保存文件路径（具体路径）
+        self.images_dir = str(save_dir / video_name / 'images')  # 视频帧图片保存路径（文件夹, 保存图片时创建）
 
         self.speed_distance_picture_dir = self.mkdirs(save_dir / video_name / 'speed-distance-picture')  # 速度图保存路径
         self.screenshot_dir = self.mkdirs(save_dir / video_name / 'screenshot')  # 微生物截图保存路径
@@ -26,6 +26,9 @@ class PathDir:
         self.json_dir = self.mkdirs(save_dir / video_name / 'json')  # JSON路径（文件夹）
         self.json_path = f'{self.json_dir}/{video_name.split(".")[0]}_result.json'  # JSON路径（具体路径）
         self.blurry_path = f'{save_dir / video_name}/{video_name.split(".")[0]}_blurry.json'  # 模糊度序列路径
+        self.telemetry_dir = self.mkdirs(save_dir / video_name / 'telemetry')  # 运行指标路径（文件夹）
+        self.telemetry_path = f'{self.telemetry_dir}/{video_name.split(".")[0]}_telemetry.json'  # 运行指标JSON路径
+        self.prometheus_path = f'{self.telemetry_dir}/{video_name.split(".")[0]}_telemetry.prom'  # Prometheus文本格式路径
 
     @staticmethod
     def mkdirs(dir_path):
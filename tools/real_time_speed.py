@@ -1,4 +1,5 @@
 import math
+import numpy as np
 
 
 def cal_distance(point1, point2):
@@ -12,20 +13,32 @@ def cal_distance(point1, point2):
     return math.sqrt((point2[0] - point1[0]) ** 2 + (point2[1] - point1[1]) ** 2)
 
 
+def step_distances(trajectory_list):
+    """
+    计算相邻轨迹点间的距离
+    :param trajectory_list: 轨迹点列表或(n, 2)数组(可以是轨迹历史的数组视图)
+    :return: 距离数组(长度为n-1)
+    """
+    points = np.asarray(trajectory_list, dtype=np.float64).reshape(-1, 2)
+    steps = np.diff(points, axis=0)
+    return np.sqrt(steps[:, 0] ** 2 + steps[:, 1] ** 2)
+
+
 def total_distance(trajectory_list):
     """
     计算移动距离
-    :param trajectory_list: 轨迹点列表
+    :param trajectory_list: 轨迹点列表或(n, 2)数组
     :return:
     """
-    distance = sum([cal_distance(trajectory_list[i - 1], trajectory_list[i]) for i in range(1, len(trajectory_list))])
+    steps = step_distances(trajectory_list)
+    distance = float(steps.cumsum()[-1]) if len(steps) else 0  # 按顺序累加, 与逐项求和结果一致
     return distance
 
 
 def linear_velocity(trajectory_list):
     """
     计算平均移动速度
-    :param trajectory_list: 轨迹点列表
+    :param trajectory_list: 轨迹点列表或(n, 2)数组
     :return: 平均移动速度v1
     """
 
@@ -58,15 +71,32 @@ def cal_angle(point1, point2, point3):
 
 def angular_velocity(trajectory_list):
     """
-    计算平均角速度
-    :param trajectory_list: 轨迹列表
+    计算平均角速度(与逐点调用cal_angle的计算方式一致)
+    :param trajectory_list: 轨迹点列表或(n, 2)数组
     :return: 平均角速度w1
     """
-    w_list = [cal_angle(trajectory_list[i - 2], trajectory_list[i - 1], trajectory_list[i]) for i in
-              range(2, len(trajectory_list))]
-
-    try:
-        w1 = sum(w_list) / len(w_list)
-    except ZeroDivisionError:
-        w1 = 0
+    points = np.asarray(trajectory_list, dtype=np.float64).reshape(-1, 2)
+    if len(points) < 3:
+        return 0
+    step = step_distances(points)
+    c, a = step[:-1], step[1:]
+    skip = points[2:] - points[:-2]
+    b = np.sqrt(skip[:, 0] ** 2 + skip[:, 1] ** 2)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cos_b = (a ** 2 + c ** 2 - b ** 2) / (2 * a * c)
+        w_list = 180 - np.round(np.arccos(cos_b) * 180 / np.pi, 2)
+    # 重合点(除零)与超出定义域的余弦值转角记为0
+    w_list[(a * c == 0) | (np.abs(cos_b) > 1)] = 0
+    w1 = float(w_list.cumsum()[-1]) / len(w_list)
     return w1
+
+
+def speed_and_distance(trajectory_list):
+    """
+    计算累计路程与平均速度(绘制平均速度与路程图像使用)
+    :param trajectory_list: 轨迹点列表或(n, 2)数组
+    :return: (速度列表，路程列表)
+    """
+    distance = step_distances(trajectory_list).cumsum()
+    speed = distance / np.arange(1, len(distance) + 1)
+    return speed.tolist(), distance.tolist()
@@ -0,0 +1,131 @@
+import time
+import numpy as np
+import psutil
+
+
+class StageTelemetry:
+    """
+    流水线阶段运行指标(在阶段进程内本地累计, 结束时汇总成一个字典交给主进程)
+    记录处理帧数、每帧耗时、忙碌与空闲时间、输入队列深度以及进程的CPU与常驻内存
+    """
+    SAMPLE_INTERVAL = 1  # 队列深度与CPU/内存的采样间隔(单位/秒)
+    SERIES_POINTS = 60  # 汇总时每条采样序列保留的最多点数
+    PERCENTILES = (50, 90, 99)  # 每帧耗时的分位数
+
+    def __init__(self, name):
+        """
+
+        :param name: 阶段名称
+        """
+        self.name = name
+        self.frames = 0  # 处理帧数
+        self.latencies = []  # 每帧耗时(单位/秒)
+        self.busy_time = 0.0  # 处理数据的时间(单位/秒)
+        self.idle_time = 0.0  # 等待输入的时间(单位/秒)
+        self.queue_depths = {}  # 队列名称: [(相对时间, 队列深度)]
+        self.cpu_samples = []  # [(相对时间, CPU占用率)]
+        self.rss_samples = []  # [(相对时间, 常驻内存)]
+        self._queues = {}
+        self._process = None
+        self._start_time = None
+        self._last_sample = 0
+
+    def start(self, **queues):
+        """
+        开始统计(在阶段进程中调用)
+        :param queues: 需要采样深度的队列(队列名称=队列)
+        :return: None
+        """
+        self._queues = queues
+        self.queue_depths = {name: [] for name in queues}
+        self._process = psutil.Process()
+        self._process.cpu_percent(None)  # 第一次调用只作为CPU占用率的起点
+        self._start_time = time.time()
+        self._last_sample = self._start_time
+
+    def idle(self, seconds):
+        """
+        记录等待输入的时间
+        :param seconds: 等待时间(单位/秒)
+        :return: None
+        """
+        self.idle_time += seconds
+
+    def record(self, seconds, frames=1):
+        """
+        记录一次处理(批量处理时每一帧的耗时均为整批的耗时)
+        :param seconds: 处理耗时(单位/秒)
+        :param frames: 处理的帧数
+        :return: None
+        """
+        self.frames += frames
+        self.busy_time += seconds
+        self.latencies.extend([seconds] * frames)
+
+    def sample(self):
+        """
+        按采样间隔记录队列深度与CPU/内存
+        :return: None
+        """
+        now = time.time()
+        if self._start_time is None or now - self._last_sample < self.SAMPLE_INTERVAL:
+            return
+        self._last_sample = now
+        elapsed = round(now - self._start_time, 3)
+        for name, sample_queue in self._queues.items():
+            try:
+                self.queue_depths[name].append((elapsed, sample_queue.qsize()))
+            except NotImplementedError:
+                pass  # 部分平台(macOS)不支持qsize
+        self.cpu_samples.append((elapsed, self._process.cpu_percent(None)))
+        self.rss_samples.append((elapsed, self._process.memory_info().rss))
+
+    @classmethod
+    def _thin(cls, series):
+        """
+        等间隔抽取采样序列
+        :param series: 采样序列
+        :return: 不超过SERIES_POINTS个点的序列
+        """
+        step = max(1, int(np.ceil(len(series) / cls.SERIES_POINTS)))
+        return series[::step]
+
+    def summary(self):
+        """
+        汇总运行指标
+        :return: 指标字典
+        """
+        wall_time = time.time() - self._start_time if self._start_time else 0
+        latencies = np.array(self.latencies) if self.latencies else np.zeros(1)
+        cpu = [value for _, value in self.cpu_samples]
+        rss = [value for _, value in self.rss_samples]
+        return {
+            'stage': self.name,
+            'frames': self.frames,
+            'wall_time': round(wall_time, 3),
+            'fps': round(self.frames / wall_time, 3) if wall_time else 0,
+            'busy_time': round(self.busy_time, 3),
+            'idle_time': round(self.idle_time, 3),
+            'latency': {
+                'mean': round(float(latencies.mean()), 6),
+                'max': round(float(latencies.max()), 6),
+                **{f'p{p}': round(float(np.percentile(latencies, p)), 6) for p in self.PERCENTILES},
+            },
+            'latency_sum': round(float(sum(self.latencies)), 6),
+            'queue_depth': {
+                name: {
+                    'max': max((depth for _, depth in series), default=0),
+                    'mean': round(float(np.mean([depth for _, depth in series])), 3) if series else 0,
+                    'series': self._thin(series),
+                } for name, series in self.queue_depths.items()
+            },
+            'cpu_percent': {
+                'mean': round(float(np.mean(cpu)), 3) if cpu else 0,
+                'max': max(cpu, default=0),
+                'series': self._thin(self.cpu_samples),
+            },
+            'rss_bytes': {
+                'max': max(rss, default=0),
+                'series': self._thin(self.rss_samples),
+            },
+        }
@@ -0,0 +1,82 @@
+import numpy as np
+
+
+class TrackHistory:
+    """
+    轨迹历史列式存储(大虫子与小虫子共用)
+    每一列是一个可增长的NumPy数组, 容量不足时翻倍扩容(均摊O(1)追加), 同一行的各列一起追加;
+    column返回当前长度的数组视图(不复制), 可以直接交给tools/real_time_speed.py与tools/calculation_index.py中的计算函数
+    """
+    __slots__ = ('_columns', '_length')
+    INITIAL_CAPACITY = 16  # 初始容量(单位/行)
+
+    def __init__(self, columns, capacity=INITIAL_CAPACITY):
+        """
+
+        :param columns: {列名: (每行的宽度, 数据类型)}, 宽度为0表示每行是一个标量
+        :param capacity: 初始容量
+        """
+        self._columns = {name: np.empty((capacity, width) if width else capacity, dtype=dtype)
+                         for name, (width, dtype) in columns.items()}
+        self._length = 0
+
+    def __len__(self):
+        return self._length
+
+    def __getstate__(self):
+        # 只保存有效数据
+        return {name: data[:self._length].copy() for name, data in self._columns.items()}, self._length
+
+    def __setstate__(self, state):
+        self._columns, self._length = state
+
+    def append(self, **values):
+        """
+        追加一行
+        :param values: 列名=值(需要包含所有列)
+        :return: None
+        """
+        length = self._length
+        for name, data in self._columns.items():
+            if length == len(data):
+                data = self._columns[name] = np.resize(data, (max(1, 2 * len(data)),) + data.shape[1:])
+            data[length] = values[name]
+        self._length = length + 1
+
+    def extend(self, count, **values):
+        """
+        批量追加多行
+        :param count: 行数
+        :param values: 列名=值(需要包含所有列, 每个值为一行或count行, 一行时重复count次)
+        :return: None
+        """
+        length, end = self._length, self._length + count
+        for name, data in self._columns.items():
+            if end > len(data):
+                data = self._columns[name] = np.resize(data, (max(end, 2 * len(data)),) + data.shape[1:])
+            data[length:end] = values[name]
+        self._length = end
+
+    def column(self, name):
+        """
+        列数据
+        :param name: 列名
+        :return: 数组视图(长度为当前行数, 追加扩容后需要重新获取)
+        """
+        return self._columns[name][:self._length]
+
+    def last(self, name):
+        """
+        列的最后一个值
+        :param name: 列名
+        :return: 最后一行的值
+        """
+        return self._columns[name][self._length - 1]
+
+    def truncate(self, length):
+        """
+        截断到指定行数
+        :param length: 行数
+        :return: None
+        """
+        self._length = max(0, min(length, self._length))
@@ -1,19 +1,94 @@
+import queue
+import threading
+from collections import deque
 import cv2
 import numpy as np
-from copy import deepcopy
 import os
 
 
+class OutputPolicy:
+    """
+    结果视频保存等级
+        off: 不保存
+        nth: 每every_n帧保存一帧(保存为视频时帧率同样除以every_n, 时间轴与原视频一致)
+        downscaled: 每帧按scale缩小后保存
+        full: 每帧原尺寸保存
+    不保存的帧在数据管理进程中就跳过绘制, 不再交给视频进程
+    (确认的大虫子截图由微生物记录器保存在screenshot文件夹中, 不属于保存等级)
+    """
+    LEVELS = ('off', 'nth', 'downscaled', 'full')
+
+    def __init__(self, level='full', every_n=10, scale=0.5):
+        """
+
+        :param level: 保存等级
+        :param every_n: nth等级的保存间隔(单位/帧)
+        :param scale: downscaled等级的缩放比例
+        """
+        if level not in self.LEVELS:
+            raise ValueError(f'保存等级需为{self.LEVELS}之一, 当前为{level}')
+        self.level = level
+        self.every_n = max(1, int(every_n))
+        self.scale = scale
+        self._frame_count = 0  # 已经判断过的帧数
+
+    def store(self):
+        """
+        当前帧是否保存(每帧调用一次)
+        :return: 是否保存(True: 保存, False: 不保存)
+        """
+        frame_count = self._frame_count
+        self._frame_count += 1
+        if self.level == 'off':
+            return False
+        if self.level == 'nth':
+            return frame_count % self.every_n == 0
+        return True
+
+    def video_fps(self, fps):
+        """
+        保存为视频时的帧率
+        :param fps: 原视频帧率
+        :return: 帧率
+        """
+        if self.level == 'nth':
+            return fps / self.every_n
+        return fps
+
+    def resize(self, frame):
+        """
+        按保存等级缩放图像
+        :param frame: 绘制好的图像
+        :return: 需要保存的图像
+        """
+        if self.level != 'downscaled' or self.scale == 1:
+            return frame
+        return cv2.resize(frame, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+
+
 class VideoHandle:
     """
     视频显示与保存
+    保存方式(save_mode):
+        video: 在后台写入线程中直接编码为视频
+        images: 每帧保存为图片
+        both: 同时保存视频与图片
     """
+    SAVE_MODES = ('video', 'images', 'both')
+    WRITE_QUEUE_SIZE = 16  # 等待写入的帧数上限(写入跟不上时阻塞绘制)
+    FONT = cv2.FONT_HERSHEY_SIMPLEX
+    NUMBER_NAMES = (('Ar', 'Arcellinida'), ('Do', 'Digononta'), ('Mo', 'Monogononta'), ('Ne', 'Nematoda'),
+                    ('Gs', 'Peritrichida'), ('Eu', 'Aspidisca'), ('SmallProtozoa', 'Small protozoa'))
+    TRACK_START = 100  # 单个微生物信息的起始位置(面板内横坐标)
+    TRACK_WIDTH = 150  # 单个微生物信息的列宽
 
     def __init__(self):
         self.video_type = 'mp4v'
         self.fps = 17
 
-        self.save_path = None
+        self.save_path = None  # 视频文件保存路径
+        self.images_path = None  # 图片保存路径(文件夹)
+        self.save_mode = 'video'
         self.background = None
         self.title_height = 70
         self.penal_width = 1000
@@ -26,6 +101,15 @@ class VideoHandle:
 
         self.frame_count = None
 
+        self.output_policy = None  # 保存等级(None表示原尺寸保存)
+
+        self._write_queue = None  # 后台写入队列
+        self._write_thread = None  # 后台写入线程
+
+        self._cells = None  # 动态文字区域列表[(区域名称, (y1, y2, x1, x2))]
+        self._canvas = None  # 当前绘制的输出缓冲区(图像, {区域名称: 已绘制的文字})
+        self._free_canvases = deque()  # 可以复用的输出缓冲区(写入线程写完后归还)
+
     def set_fps(self, fps):
         """
         设置视频帧率
@@ -42,6 +126,32 @@ class VideoHandle:
         """
         self.save_path = video_save_path
 
+    def set_images_save_path(self, images_save_path):
+        """
+        设置图片保存路径
+        :param images_save_path: 图片保存路径(文件夹)
+        :return: None
+        """
+        self.images_path = images_save_path
+
+    def set_save_mode(self, save_mode):
+        """
+        设置保存方式
+        :param save_mode: 保存方式(video, images, both)
+        :return: None
+        """
+        if save_mode not in self.SAVE_MODES:
+            raise ValueError(f'保存方式需为{self.SAVE_MODES}之一, 当前为{save_mode}')
+        self.save_mode = save_mode
+
+    def set_output_policy(self, output_policy):
+        """
+        设置保存等级
+        :param output_policy: 保存等级对象
+        :return: None
+        """
+        self.output_policy = output_policy
+
     def set_video_message(self, video_message):
         """
         设置视频信息
@@ -64,6 +174,46 @@ class VideoHandle:
         cv2.imshow('display window', frame)
         cv2.waitKey(1)
 
+    def save(self, frame):
+        """
+        保存视频(交给后台写入线程, 编码与绘制并行)
+        :param frame: 需要保存的图像(写入完成前不能再修改)
+        :return: None
+        """
+        canvas = None
+        if self._canvas is not None and frame is self._canvas[0]:
+            canvas, self._canvas = self._canvas, None  # 输出缓冲区交给写入线程, 写入完成后归还
+        if self.output_policy is not None:
+            frame = self.output_policy.resize(frame)
+            if canvas is not None and frame is not canvas[0]:
+                self._free_canvases.append(canvas)  # 缩放后已经是新图像, 缓冲区可以直接复用
+                canvas = None
+        if self._write_thread is None:
+            self._write_queue = queue.Queue(maxsize=self.WRITE_QUEUE_SIZE)
+            self._write_thread = threading.Thread(target=self._write_loop, daemon=True)
+            self._write_thread.start()
+        self._write_queue.put((frame, canvas))
+
+    def _write_loop(self):
+        """
+        后台写入线程
+        :return: None
+        """
+        while True:
+            item = self._write_queue.get()
+            if item is None:
+                break
+            frame, canvas = item
+            try:
+                if self.save_mode in ('video', 'both'):
+                    self.save1(frame)
+                if self.save_mode in ('images', 'both'):
+                    self.save_image(frame)
+            except Exception as e:
+                print('视频写入出现异常: ', e)
+            if canvas is not None:
+                self._free_canvases.append(canvas)
+
     def save1(self, frame):
         """
         保存视频
@@ -75,158 +225,171 @@ class VideoHandle:
 
             if self.save_path is None:
                 raise Exception('please input video save_dir!!!')
+            os.makedirs(os.path.dirname(self.save_path), exist_ok=True)
             fourcc = cv2.VideoWriter_fourcc(*self.video_type)
-            self.video_writer = cv2.VideoWriter(self.save_path, fourcc, self.fps, (frame.shape[1], frame.shape[0]))
+            fps = self.fps if self.output_policy is None else self.output_policy.video_fps(self.fps)
+            self.video_writer = cv2.VideoWriter(self.save_path, fourcc, fps, (frame.shape[1], frame.shape[0]))
         self.video_writer.write(frame)
 
-    def save(self, frame):
+    def save_image(self, frame):
         """
         保存视频帧为图片
         :param frame: 需要保存的图像帧
         :return: None
         """
-        if self.save_path is None:
+        if self.images_path is None:
             raise Exception('Please provide a save directory for the images!')
 
-        if not os.path.exists(self.save_path):
-            os.makedirs(self.save_path)
+        if not os.path.exists(self.images_path):
+            os.makedirs(self.images_path)
 
         if self.frame_count is None:
             self.frame_count = 0
 
         image_name = f"frame_{self.frame_count}.jpg"
-        image_path = os.path.join(self.save_path, image_name)
+        image_path = os.path.join(self.images_path, image_name)
 
         cv2.imwrite(image_path, frame)
         self.frame_count += 1
 
-    def init_background(self, frame):
+    def release(self):
         """
-        初始化显示面板
-        :param frame: 要显示的数据
+        结束视频处理(等待后台写入完成并关闭视频文件, 关闭显示窗口)
         :return: None
         """
-
-        self.background = np.zeros_like(frame)
-        self.video_width = self.background.shape[1]
-        self.background.resize(
-            (self.background.shape[0] + self.title_height, self.background.shape[1] + self.penal_width, 3))
-        self.background += 255
-
-    def draw_background(self, image, blurry_text, yolo_frame_index, differ_frame_index, bug_list, total_bug_numbers):
+        if self._write_thread is not None:
+            self._write_queue.put(None)
+            self._write_thread.join()
+            self._write_thread = None
+        if self.video_writer is not None:
+            self.video_writer.release()
+            self.video_writer = None
+        if self.window_init:
+            cv2.destroyWindow('display window')
+            self.window_init = False
+
+    def _put_text(self, image, text, org):
         """
-        绘制图像
-        :param image: 视频数据
-        :param blurry_text: 模糊度信息
-        :param yolo_frame_index: yolo检测帧数
-        :param differ_frame_index: 帧差法检测帧数
-        :param bug_list: 当前需要统计的微生物
-        :param total_bug_numbers: 微生物总体数量
-        :return: 绘制好的图像
+        绘制文字
+        :param image: 需要绘制的图像
+        :param text: 文字
+        :param org: 文字左下角坐标
+        :return: None
         """
+        cv2.putText(image, text, org, self.FONT, 1, (0, 0, 0), thickness=2)
 
-        if not self.background_init:
-            self.init_background(image)
-
-        self.background[:self.title_height, :] = 255
-        self.draw_title(self.background[:self.title_height, :], yolo_frame_index, differ_frame_index, blurry_text)
-        self.background[self.title_height:, self.video_width:] = 255
-        self.draw_penal(self.background[self.title_height:, self.video_width:], bug_list, total_bug_numbers)
-        self.background[self.title_height:, :self.video_width] = image
-
-        return deepcopy(self.background)
-
-    @staticmethod
-    def draw_penal(penal, bug_list, total_bug_numbers):
+    def init_background(self, frame):
         """
-        绘制数据面板
-        :param penal: 数据显示区域
-        :param bug_list: 当前需要统计的微生物
-        :param total_bug_numbers: 微生物总体数量
+        初始化显示面板(不变的文字只绘制一次, 并计算每帧需要更新的文字区域)
+        :param frame: 要显示的数据
         :return: None
         """
-
-        cv2.putText(penal, 'Group characteristics', (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 0), thickness=2)
-
-        total_number_text = [
-            '{:<20}'.format('Total numbers'),
-            '{:<20}'.format(f'Arcellinida: {total_bug_numbers["Ar"]:0>3}'),
-            '{:<20}'.format(f'Digononta: {total_bug_numbers["Do"]:0>3}'),
-            '{:<20}'.format(f'Monogononta: {total_bug_numbers["Mo"]:0>3}'),
-            '{:<20}'.format(f'Nematoda: {total_bug_numbers["Ne"]:0>3}'),
-            '{:<20}'.format(f'Peritrichida: {total_bug_numbers["Gs"]:0>3}'),
-            '{:<20}'.format(f'Aspidisca: {total_bug_numbers["Eu"]:0>3}'),
-            '{:<20}'.format(f'Small protozoa: {total_bug_numbers["SmallProtozoa"]:0>3}')
+        height, self.video_width = frame.shape[:2]
+        self.background = np.full((height + self.title_height, self.video_width + self.penal_width, 3), 255,
+                                  dtype=np.uint8)
+        top, left, half = self.title_height, self.video_width, self.penal_width // 2
+        title_split = self.background.shape[1] // 2 + 50
+
+        self._put_text(self.background, 'Group characteristics', (left + 10, top + 30))
+        self._put_text(self.background, 'Individual characteristics--Small protozoa', (left + 10, top + 350))
+        self._put_text(self.background, 'Linear', (left + 10, top + 450))
+        self._put_text(self.background, 'velocity', (left + 10, top + 480))
+        self._put_text(self.background, 'Angular', (left + 10, top + 550))
+        self._put_text(self.background, 'velocity', (left + 10, top + 580))
+
+        track_left = left + self.TRACK_START + self.TRACK_WIDTH - 10
+        self._cells = [
+            ('left_title', (0, top, 0, title_split)),
+            ('right_title', (0, top, title_split, self.background.shape[1])),
+            ('tracks', (top + 365, top + 600, track_left, left + self.penal_width)),
         ]
-        bug_numbers = {
-            'Ar': 0,
-            "Do": 0,
-            'Mo': 0,
-            'Ne': 0,
-            'Eu': 0,
-            'Gs': 0,
-            'SmallProtozoa': 0
-        }
-
-        for text_index, text in enumerate(total_number_text):
-            cv2.putText(penal, text, (10, 30 * (text_index + 3)), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 0), thickness=2)
-
-        cv2.putText(penal, 'Individual characteristics--Small protozoa', (10, 350), cv2.FONT_HERSHEY_SIMPLEX, 1,
-                    (0, 0, 0), thickness=2)
-
-        # cv2.putText(penal, 'MIC', (10, 50), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 0), thickness=2)
-        cv2.putText(penal, 'Linear', (10, 450), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 0), thickness=2)
-        cv2.putText(penal, 'velocity', (10, 480), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 0), thickness=2)
-        cv2.putText(penal, 'Angular', (10, 550), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 0), thickness=2)
-        cv2.putText(penal, 'velocity', (10, 580), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 0), thickness=2)
-        width = 150
-        start = 100
-        counter = 0
-        for bug in bug_list:
-            if bug.detection_sequence[-1]:
-                bug_numbers[bug.cls()] += 1
-                if bug.cls() == 'Ar' or bug.cls() == 'Gs':
-                    continue
-                counter += 1
-                bug_name = f'{bug.cls() if bug.cls() != "SmallProtozoa" else "Sp"} {bug.track_id}'
-                cv2.putText(penal, bug_name, (start + width * counter, 400), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 0),
-                            thickness=2)
-                cv2.putText(penal, str(round(bug.linear_velocity(), 2)), (start + width * counter, 460),
-                            cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 0),
-                            thickness=2)
-                cv2.putText(penal, str(round(bug.angular_velocity(), 2)), (start + width * counter, 560),
-                            cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 0),
-                            thickness=2)
-
-        live_number_text = [
-            '{:<20}'.format('Live numbers'),
-            '{:<20}'.format(f'Arcellinida: {bug_numbers["Ar"]:0>3}'),
-            '{:<20}'.format(f'Digononta: {bug_numbers["Do"]:0>3}'),
-            '{:<20}'.format(f'Monogononta: {bug_numbers["Mo"]:0>3}'),
-            '{:<20}'.format(f'Nematoda: {bug_numbers["Ne"]:0>3}'),
-            '{:<20}'.format(f'Peritrichida: {bug_numbers["Gs"]:0>3}'),
-            '{:<20}'.format(f'Aspidisca: {bug_numbers["Eu"]:0>3}'),
-            '{:<20}'.format(f'Small protozoa: {bug_numbers["SmallProtozoa"]:0>3}'),
-        ]
-        for text_index, text in enumerate(live_number_text):
-            cv2.putText(penal, text, (penal.shape[1] // 2 + 10, 30 * (text_index + 3)), cv2.FONT_HERSHEY_SIMPLEX, 1,
-                        (0, 0, 0), thickness=2)
-
-    def draw_title(self, title, yolo_frame_index, differ_frame_index, blurry_text):
+        # 数量只重绘数字部分, 名称绘制在静态层中
+        for column, (x, right, header) in enumerate(((10, half, 'Total numbers'),
+                                                     (half + 10, self.penal_width, 'Live numbers'))):
+            self._put_text(self.background, header, (left + x, top + 90))
+            for index, (key, name) in enumerate(self.NUMBER_NAMES):
+                label = f'{name}: '
+                y = top + 30 * (index + 4)
+                self._put_text(self.background, label, (left + x, y))
+                label_width = cv2.getTextSize(label, self.FONT, 1, 2)[0][0]
+                self._cells.append((f'{column}_{key}', (y - 24, y + 6, left + x + label_width, left + right)))
+
+        self._canvas = None
+        self._free_canvases.clear()
+        self.background_init = True
+
+    def _cell_texts(self, yolo_frame_index, differ_frame_index, blurry_text, bug_list, total_bug_numbers):
         """
-        绘制标题面板
-        :param title: 视频信息显示区域
+        计算每个动态区域需要绘制的文字
         :param yolo_frame_index: yolo检测帧数
         :param differ_frame_index: 帧差法检测帧数
         :param blurry_text: 模糊度信息
-        :return: None
+        :param bug_list: 当前需要统计的微生物显示快照
+        :param total_bug_numbers: 微生物总体数量
+        :return: {区域名称: ((文字, 文字左下角坐标(None表示区域左下角)),)}
         """
+        top, left = self.title_height, self.video_width
         instant_frame_number = min(yolo_frame_index, differ_frame_index)
         video_name, total_frame, frame_rate = self.video_message
         total_frame = instant_frame_number if total_frame is None else total_frame
         left_title_text = f'Video name: {video_name} Total frame: {total_frame} Frame rate: {frame_rate}'
-        cv2.putText(title, left_title_text, (0, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 0),
-                    thickness=2)
         right_title_text = f'Instant frame number {instant_frame_number} Blurry: {blurry_text}'
-        cv2.putText(title, right_title_text, (title.shape[1] // 2 + 50, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 0),
-                    thickness=2)
+        texts = {
+            'left_title': ((left_title_text, (0, 30)),),
+            'right_title': ((right_title_text, (self.background.shape[1] // 2 + 50, 30)),),
+        }
+
+        bug_numbers = {key: 0 for key, _ in self.NUMBER_NAMES}
+        tracks = []
+        for bug in bug_list:
+            if bug.detected:
+                bug_numbers[bug.cls] += 1
+                if bug.cls == 'Ar' or bug.cls == 'Gs':
+                    continue
+                x = left + self.TRACK_START + self.TRACK_WIDTH * (len(tracks) // 3 + 1)
+                bug_name = f'{bug.cls if bug.cls != "SmallProtozoa" else "Sp"} {bug.track_id}'
+                tracks.append((bug_name, (x, top + 400)))
+                tracks.append((str(round(bug.v1, 2)), (x, top + 460)))
+                tracks.append((str(round(bug.w1, 2)), (x, top + 560)))
+        texts['tracks'] = tuple(tracks)
+
+        for column, numbers in enumerate((total_bug_numbers, bug_numbers)):
+            for key, _ in self.NUMBER_NAMES:
+                texts[f'{column}_{key}'] = ((f'{numbers[key]:0>3}', None),)
+        return texts
+
+    def draw_background(self, image, blurry_text, yolo_frame_index, differ_frame_index, bug_list, total_bug_numbers):
+        """
+        绘制图像(静态文字预先绘制, 只重绘发生变化的区域, 结果写入复用的输出缓冲区)
+        :param image: 视频数据
+        :param blurry_text: 模糊度信息
+        :param yolo_frame_index: yolo检测帧数
+        :param differ_frame_index: 帧差法检测帧数
+        :param bug_list: 当前需要统计的微生物
+        :param total_bug_numbers: 微生物总体数量
+        :return: 绘制好的图像(下一次绘制前有效, 交给save后由写入线程写完再复用)
+        """
+
+        if not self.background_init:
+            self.init_background(image)
+
+        if self._canvas is not None:
+            self._free_canvases.append(self._canvas)  # 上一帧没有保存, 缓冲区可以直接复用
+        self._canvas = self._free_canvases.popleft() if self._free_canvases else (self.background.copy(), {})
+        canvas, drawn = self._canvas
+
+        texts = self._cell_texts(yolo_frame_index, differ_frame_index, blurry_text, bug_list, total_bug_numbers)
+        for name, (y1, y2, x1, x2) in self._cells:
+            cell_texts = texts[name]
+            if drawn.get(name) == cell_texts:
+                continue
+            # 恢复静态层后重绘该区域(绘制在区域视图中, 超出区域的部分被裁剪)
+            canvas[y1:y2, x1:x2] = self.background[y1:y2, x1:x2]
+            cell = canvas[y1:y2, x1:x2]
+            for text, org in cell_texts:
+                org = (0, y2 - y1 - 6) if org is None else (org[0] - x1, org[1] - y1)
+                self._put_text(cell, text, org)
+            drawn[name] = cell_texts
+        canvas[self.title_height:, :self.video_width] = image
+
+        return canvas
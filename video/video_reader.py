@@ -1,5 +1,6 @@
+import queue
+import threading
 import cv2
-from copy import deepcopy
 
 
 class VideoReader:
@@ -7,12 +8,14 @@ class VideoReader:
     视频输入器
     """
 
-    def __init__(self, video_path, start_frame=0, end_frame=50000):
+    def __init__(self, video_path, start_frame=0, end_frame=50000, stride=1, prefetch=0):
         """
 
         :param video_path: 视频路径
         :param start_frame: 开始帧数(默认第0帧开始)
-        :param end_frame: 结束帧数(默认播放整个视频)
+        :param end_frame: 结束帧数(不包含, 默认播放整个视频)
+        :param stride: 读取步长(每stride帧解码一帧, 其余帧只grab不retrieve)
+        :param prefetch: 预解码缓存帧数(大于0时在后台线程提前解码, 0表示同步解码)
         """
         self.video_path = video_path  # 视频路径
         self.video_name = video_path.split('\\')[-1]  # 名称
@@ -27,7 +30,15 @@ class VideoReader:
         self.start_frame = start_frame  # 开始帧
         self.end_frame = min(self.total_frames, end_frame)  # 结束帧
 
-        self.frame_index = 0  # 当前视频帧数
+        self.frame_index = 0  # 当前视频帧数(下一帧的位置)
+        self.current_index = None  # 最近一次返回的帧的帧数
+
+        self.stride = max(1, stride)  # 读取步长
+        self.prefetch = prefetch  # 预解码缓存帧数
+        self._buffer = None  # 预解码缓存
+        self._decode_thread = None  # 预解码线程
+        self._decode_error = None  # 预解码线程中的异常(由消费者在读取结束时重新抛出)
+        self._stop_event = threading.Event()
 
     def video_message(self):
         """
@@ -37,6 +48,16 @@ class VideoReader:
 
         return self.video_name, self.total_frames, self.fps
 
+    def set_range(self, start_frame, end_frame):
+        """
+        设置读取的帧区间(迭代时直接定位到开始帧, 只解码区间内的帧)
+        :param start_frame: 开始帧数
+        :param end_frame: 结束帧数(不包含)
+        :return: None
+        """
+        self.start_frame = start_frame
+        self.end_frame = min(self.total_frames, end_frame)
+
     def frames(self):
         """
         视频数据接口
@@ -44,32 +65,106 @@ class VideoReader:
         """
         return self
 
+    def _seek(self, frame_index):
+        """
+        定位到指定帧
+        优先使用CAP_PROP_POS_FRAMES直接定位, 定位结果不准确时从头使用grab()跳帧(不做图像转换与拷贝)
+        :param frame_index: 目标帧数
+        :return: None
+        """
+        self.cap.set(cv2.CAP_PROP_POS_FRAMES, frame_index)
+        if int(self.cap.get(cv2.CAP_PROP_POS_FRAMES)) != frame_index:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            for _ in range(frame_index):
+                if not self.cap.grab():
+                    break
+        self.frame_index = frame_index
+
+    def _read(self):
+        """
+        解码下一帧, 并跳过步长内的其余帧(只grab不retrieve)
+        :return: (帧数, 图像), 读取结束时返回None
+        """
+        if not self.cap.isOpened() or self.frame_index >= self.end_frame:
+            return None
+        ret, frame = self.cap.read()  # read每次返回新的图像, 无需再拷贝
+        if not ret:
+            return None
+        frame_index = self.frame_index
+        self.frame_index += 1
+        for _ in range(self.stride - 1):
+            if self.frame_index >= self.end_frame or not self.cap.grab():
+                break
+            self.frame_index += 1
+        return frame_index, frame
+
+    def _put(self, item):
+        """
+        放入预解码缓存, 缓存满时等待消费者(停止后放弃)
+        :param item: (帧数, 图像)或结束标记None
+        :return: None
+        """
+        while not self._stop_event.is_set():
+            try:
+                self._buffer.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _decode_loop(self):
+        """
+        预解码线程: 提前解码放入有界缓存, 缓存满时等待消费者
+        解码出现异常时记录异常, 无论如何都放入结束标记, 消费者不会一直等待
+        :return: None
+        """
+        try:
+            while not self._stop_event.is_set():
+                item = self._read()
+                if item is None:
+                    break
+                self._put(item)
+        except Exception as e:
+            self._decode_error = e
+        finally:
+            self._put(None)
+
+    def release(self):
+        """
+        停止预解码线程并释放视频对象
+        :return: None
+        """
+        self._stop_event.set()
+        if self._decode_thread is not None:
+            self._decode_thread.join()
+            self._decode_thread = None
+        self.cap.release()
+
     def __iter__(self):
         """
         迭代器对象方法
         :return: 视频帧序列迭代器
         """
 
-        while self.cap.isOpened():
-            if self.frame_index >= self.start_frame or self.frame_index >= self.end_frame:
-                break
-            self.frame_index += 1
-            self.cap.read()
+        if self.cap.isOpened() and self.frame_index != self.start_frame and self.start_frame < self.end_frame:
+            self._seek(self.start_frame)
+
+        if self.prefetch > 0 and self._decode_thread is None:
+            self._buffer = queue.Queue(maxsize=self.prefetch)
+            self._decode_thread = threading.Thread(target=self._decode_loop, daemon=True)
+            self._decode_thread.start()
 
         return self
 
     def __next__(self):
         """
         生成器对象方法
-        :return: 视频帧
+        :return: 视频帧(帧数见current_index)
         """
 
-        if not self.cap.isOpened():
-            raise StopIteration
-        ret, frame = self.cap.read()
-        result = deepcopy(frame)
-        del frame
-        self.frame_index += 1
-        if not ret or self.frame_index > self.end_frame:
+        item = self._buffer.get() if self._decode_thread is not None else self._read()
+        if item is None:
+            if self._decode_error is not None:
+                raise RuntimeError(f'视频{self.video_name}预解码失败') from self._decode_error
             raise StopIteration
-        return result
+        self.current_index, frame = item
+        return frame
@@ -0,0 +1,402 @@
+import multiprocessing
+import multiprocessing.connection
+import queue
+import threading
+import time
+from multiprocessing import Process, Queue
+import torch
+from video.video_reader import VideoReader
+from video.video_handle import OutputPolicy
+from video_processing import VideoProcessing
+from yolo_processing import YoloProcessing
+from motion_processing import MotionProcessing
+from tools.blur_detector import BlueDetector, BlurGate
+from tools.frame_set import frame_set
+from tools.frame_ring import FrameRing
+from tools.telemetry import StageTelemetry
+from frame_differ_processing import FrameDifferProcessing
+from manager_processing import ManagerProcessing
+from stage_processing import END_OF_STREAM, StageMonitor
+from big_microfauna.really_bug_record import ReallyBugRecord
+from writer.write_to_execl import ExcelWriter, JSONWriter
+from writer.write_to_others import save_blurry_list
+from writer.write_telemetry import TelemetryWriter
+
+
+def processing_watchdog(sign_dict, stage_monitor, processing_dict, stall_timeout, interval=1):
+    """
+    进程监测器(阶段按结束标记依次完成, 只强制杀死超过stall_timeout秒没有心跳的阶段)
+    被杀死或异常退出的阶段由监测器代替其向下游发送结束标记, 下游阶段仍能处理完已有数据并正常结束;
+    被杀死的阶段持有的共享内存槽位不会再被释放, 因此输入端发现有阶段提前结束后必须停止输入(见VideoPipeline._put_input)
+    :param sign_dict: 进程通信标记
+    :param stage_monitor: 阶段心跳记录
+    :param processing_dict: 完成标志名称: (进程, 下游队列列表)
+    :param stall_timeout: 判定阶段卡死的无心跳时间(单位/秒)
+    :param interval: 检查间隔(单位/秒)
+    :return: None
+    """
+    tack_id = sign_dict['task_id']
+    running = dict(processing_dict)
+    while running:
+        for key, (p, output_queues) in list(running.items()):
+            if p.is_alive() and stage_monitor.idle_time(key) <= stall_timeout:
+                continue
+            if p.is_alive():
+                print(f'任务{tack_id} {key} 超过{stall_timeout}秒没有进展, 强制结束')
+                p.kill()
+                p.join()
+            if not sign_dict[key]:
+                sign_dict[key] = True
+                for output_queue in output_queues:
+                    try:
+                        output_queue.put(END_OF_STREAM, timeout=stall_timeout)
+                    except queue.Full:
+                        print(f'任务{tack_id} {key} 的下游队列已满, 结束标记发送失败')
+            running.pop(key)
+        multiprocessing.connection.wait([p.sentinel for p, _ in running.values()], timeout=interval)
+
+
+class InputAborted(Exception):
+    """
+    输入中止(有阶段在输入结束前已经结束或被杀死)
+    """
+
+
+class VideoPipeline:
+    """
+    单个视频的检测流水线(输入、位移矢量、yolo、帧差法、数据管理、视频处理), 在独立进程中运行
+    """
+    PROGRESS_INTERVAL = 200  # 进度汇报间隔(单位/帧)
+    STALL_TIMEOUT = 120  # 阶段超过该时间没有心跳则视为卡死(单位/秒)
+    INPUT_TIMEOUT = 1  # 输入端等待空闲槽位或队列空间的单次超时(单位/秒), 超时后检查各阶段是否已经结束
+    IN_FLIGHT_SLOTS = 2  # yolo批量之外至少需要的槽位数量(视频进程绘制中的一帧, 输入端正在写入的一帧)
+
+    def __init__(self, task_id, path_dir, config, progress_queue=None):
+        """
+
+        :param task_id: 任务编号
+        :param path_dir: 路径管理器对象
+        :param config: 流水线配置(video_display, video_save, video_save_mode, output_level,
+                       output_every_n, output_scale, ring_slots, yolo_batch_size, torch_threads,
+                       prefetch, stride, blur_method, blur_workers, blur_threshold, blur_hysteresis,
+                       blur_max_gap, differ_pyramid, noise_mask_path, motion_backend, record_live, methods,
+                       manual_option, start_index, end_index, detect_index)
+        :param progress_queue: 进度汇报队列, 放入(事件, 任务编号, 视频名称, 信息)
+        """
+        self.check_ring_slots(config['ring_slots'], config['yolo_batch_size'])
+        self.task_id = task_id
+        self.path_dir = path_dir
+        self.config = config
+        self.progress_queue = progress_queue
+
+    @classmethod
+    def check_ring_slots(cls, ring_slots, yolo_batch_size):
+        """
+        检查共享内存槽位数量: yolo凑满一批之前一直持有已输入的帧, 槽位不足时输入端永远等不到空闲槽位
+        :param ring_slots: 槽位数量
+        :param yolo_batch_size: yolo批量检测的帧数
+        :return: None
+        """
+        if ring_slots < yolo_batch_size + cls.IN_FLIGHT_SLOTS:
+            raise ValueError(f'共享内存槽位数量ring_slots({ring_slots})需不小于yolo批量检测帧数yolo_batch_size'
+                             f'({yolo_batch_size}) + {cls.IN_FLIGHT_SLOTS}, 否则流水线会因等待空闲槽位而卡死')
+
+    def report(self, event, video_name, message):
+        """
+        汇报任务进度
+        :param event: 事件(start, progress, finish)
+        :param video_name: 视频名称
+        :param message: 事件信息
+        :return: None
+        """
+        if self.progress_queue is not None:
+            self.progress_queue.put((event, self.task_id, video_name, message))
+
+    def _put_input(self, put, sign_dict, stage_names):
+        """
+        带超时地向流水线放入数据, 超时后重试; 有阶段在输入结束前已经结束(异常退出或被监测器杀死)时中止输入
+        :param put: 放入函数, 参数为超时时间(单位/秒)
+        :param sign_dict: 进程通信标记
+        :param stage_names: 各阶段的完成标志名称
+        :return: 放入函数的返回值
+        """
+        while True:
+            try:
+                return put(self.INPUT_TIMEOUT)
+            except (queue.Full, queue.Empty):
+                finished = [name for name in stage_names if sign_dict[name]]
+                if finished:
+                    raise InputAborted(f'任务{self.task_id} 阶段{finished}已结束, 停止输入')
+
+    def start(self):
+        """
+        运行流水线
+        :return: None
+        """
+        torch.multiprocessing.set_start_method('spawn', force=True)
+        config, path_dir, task_id = self.config, self.path_dir, self.task_id
+        bd = BlueDetector(threshold=config['blur_threshold'], method=config['blur_method'],
+                          workers=config['blur_workers'])
+        blur_gate = BlurGate(config['blur_threshold'], config['blur_hysteresis'], config['blur_max_gap'])
+        manager = multiprocessing.Manager()
+        error_video = []  # 需考量视频列表
+        frame_interval = {}  # 视频对应检测帧区间
+
+        # 进程通信标志
+        sign_dict = manager.dict({
+            'task_id': task_id,
+            'finish': False,
+            'video_display': config['video_display'],
+            'video_save': config['video_save'],
+            'video_input_sign': False,
+            'motion_sign': False,
+            'yolo_detect_sign': False,
+            'frame_detect_sign': False,
+            'manager_sign': False,
+            'video_manager_sign': False,
+        })
+        # 视频读入器
+        video_reader = VideoReader(path_dir.video_input_path, stride=config['stride'], prefetch=config['prefetch'])
+        # 共享内存帧缓冲区
+        frame_ring = FrameRing(config['ring_slots'], (video_reader.height, video_reader.width, 3))
+        # 进程通信队列
+        motion_input_queue = Queue(maxsize=100)
+        yolo_result_queue = Queue(maxsize=100)
+        frame_result_queue = Queue(maxsize=100)
+        frame_input_queue = Queue(maxsize=100)
+        yolo_input_queue = Queue(maxsize=100)
+        video_queue = Queue(maxsize=100)
+        # 阶段心跳记录
+        stage_monitor = StageMonitor(['motion_sign', 'yolo_detect_sign', 'frame_detect_sign', 'manager_sign',
+                                      'video_manager_sign'])
+        # 运行指标(各阶段结束时放入指标汇总)
+        telemetry_queue = Queue()
+        input_telemetry = StageTelemetry('video_input')
+
+        # 设置进程
+
+        # 设置视频管理器进程
+        video_manager_processing = VideoProcessing(sign_dict, frame_ring, video_queue)
+        video_manager_processing.set_fps(video_reader.fps / video_reader.stride)  # 抽帧后保存的视频时间轴与原视频一致
+        video_manager_processing.set_video_message(video_reader.video_message())
+        video_manager_processing.set_video_save_path(path_dir.video_path)
+        video_manager_processing.set_images_save_path(path_dir.images_dir)
+        video_manager_processing.set_save_mode(config['video_save_mode'])
+        output_policy = OutputPolicy(config['output_level'], config['output_every_n'], config['output_scale'])
+        video_manager_processing.set_output_policy(output_policy)
+        video_manager_processing.set_monitor(stage_monitor)
+        video_manager_processing.set_telemetry_queue(telemetry_queue)
+        video_manager_p = Process(target=video_manager_processing.start)
+
+        # 设置位移矢量进程
+        motion_processing = MotionProcessing(sign_dict, frame_ring, motion_input_queue, yolo_input_queue)
+        motion_processing.set_motion_backend(config['motion_backend'])
+        motion_processing.set_monitor(stage_monitor)
+        motion_processing.set_telemetry_queue(telemetry_queue)
+        motion_p = Process(target=motion_processing.start)
+
+        # 设置yolo检测器进程
+        yolo_processing = YoloProcessing(sign_dict, frame_ring, yolo_result_queue, yolo_input_queue,
+                                         frame_input_queue, config['yolo_batch_size'], config['torch_threads'])
+        yolo_processing.set_monitor(stage_monitor)
+        yolo_processing.set_telemetry_queue(telemetry_queue)
+        yolo_p = Process(target=yolo_processing.start)
+
+        # 设置帧差法检测器进程
+        differ_processing = FrameDifferProcessing(sign_dict, frame_ring, frame_input_queue, frame_result_queue)
+        differ_processing.set_pyramid(config['differ_pyramid'])
+        differ_processing.set_noise_mask_path(config['noise_mask_path'])
+        differ_processing.set_monitor(stage_monitor)
+        differ_processing.set_telemetry_queue(telemetry_queue)
+        differ_p = Process(target=differ_processing.start)
+
+        # 初始化微生物记录器(默认在数据管理进程中本地累计, 结束时一次性返回记录结果)
+        bug_record = ReallyBugRecord(path_dir, video_reader.video_name, video_reader.fps, video_reader.total_frames)
+        result_queue = Queue()
+        if config['record_live']:
+            # 实时查看模式: 数据存储对象为Manager代理对象, 运行中可在其他进程读取
+            bug_dead_or_live = manager.dict({
+                'Ar': manager.dict({'die': 0, 'live': 0}),
+                "Do": manager.dict({'die': 0, 'live': 0}),
+                'Mo': manager.dict({'die': 0, 'live': 0}),
+                'Ne': manager.dict({'die': 0, 'live': 0}),
+                'Eu': manager.dict({'die': 0, 'live': 0}),
+            })
+            bug_record_dict = manager.dict({
+                'Ar': manager.list(),
+                "Do": manager.list(),
+                'Mo': manager.list(),
+                'Ne': manager.list(),
+                'Eu': manager.list(),
+                'Gs': manager.list(),
+                "SmallProtozoa": manager.list(),
+            })
+            bug_record.set_ar_colors_list(manager.list())
+            bug_record.set_gs_area_list(manager.list())
+            bug_record.set_bug_dead_or_live(bug_dead_or_live)
+            bug_record.set_bug_record(bug_record_dict)
+
+        # 设置数据同步管理器进程
+        manager_processing = ManagerProcessing(sign_dict, frame_ring, yolo_result_queue, frame_result_queue,
+                                               video_queue, bug_record, result_queue)
+        manager_processing.set_output_policy(output_policy)
+        manager_processing.set_monitor(stage_monitor)
+        manager_processing.set_telemetry_queue(telemetry_queue)
+        manager_p = Process(target=manager_processing.start)
+
+        # 开启所有进程
+        manager_p.start()
+        motion_p.start()
+        yolo_p.start()
+        video_manager_p.start()
+        differ_p.start()
+
+        # 进程监测器字典(完成标志名称: (进程, 下游队列列表))
+        processing_dict = {
+            'motion_sign': (motion_p, [yolo_input_queue]),
+            'yolo_detect_sign': (yolo_p, [frame_input_queue, yolo_result_queue]),
+            'frame_detect_sign': (differ_p, [frame_result_queue]),
+            'manager_sign': (manager_p, [video_queue]),
+            'video_manager_sign': (video_manager_p, []),
+        }
+        # 开启进程监测器(输入过程中同样监测, 剩余数据越多等待越久, 只有卡死的阶段才会被强制结束)
+        watchdog = threading.Thread(target=processing_watchdog,
+                                    args=(sign_dict, stage_monitor, processing_dict, self.STALL_TIMEOUT), daemon=True)
+        watchdog.start()
+
+        # 开始输入数据
+        video_start_time = time.time()
+        print(f'第{task_id}个视频 {video_reader.video_name} 开始时间: {time.ctime()}')
+        blurry_list = []
+        skipped_frames = []  # 模糊跳过检测的帧数
+
+        total_index = video_reader.total_frames
+        frame_list1 = frame_set(config['methods'], config['manual_option'], config['start_index'],
+                                config['end_index'], config['detect_index'], total_index, video_reader.video_name)
+        print(frame_list1)
+        if isinstance(frame_list1, list) and len(frame_list1) > 0:
+            frame_interval[video_reader.video_name] = frame_list1
+        self.report('start', video_reader.video_name, total_index)
+
+        # 只解码需要检测的帧区间
+        if isinstance(frame_list1, list) and len(frame_list1) > 0:
+            video_reader.set_range(frame_list1[0], frame_list1[1] + 1)
+        elif isinstance(frame_list1, str):
+            if frame_list1 not in error_video:
+                error_video.append(frame_list1)
+            video_reader.set_range(0, 0)
+        elif not isinstance(frame_list1, list):
+            print("指定视频检测帧数有误")
+            video_reader.set_range(0, 0)
+
+        # 模糊度在线程池中提前检测(帧标识在读取时获取, 提前检测不影响帧数)
+        frames = ((video_reader.current_index, frame) for frame in video_reader)
+        input_telemetry.start(motion_input=motion_input_queue)
+        wait_start = time.time()
+        try:
+            for frame_index, frame, (_, blurry_text, blurry_mean) in bd.detect_ahead(frames):
+                start_time = time.time()
+                input_telemetry.idle(start_time - wait_start)  # 等待解码与模糊度检测
+                blurry_list.append(blurry_mean)
+                # 下游的模糊标志表示该帧跳过检测
+                blurry = blur_gate.skip(blurry_mean)
+                if blurry:
+                    skipped_frames.append(frame_index)
+                # 阶段卡死或退出时槽位与队列不会再被消费, 放入数据带超时并检查各阶段状态
+                slot = self._put_input(lambda timeout: frame_ring.put(frame, timeout), sign_dict, processing_dict)
+                self._put_input(lambda timeout: motion_input_queue.put((frame_index, slot, blurry, blurry_text),
+                                                                       timeout=timeout), sign_dict, processing_dict)
+
+                if frame_index % self.PROGRESS_INTERVAL < video_reader.stride:
+                    self.report('progress', video_reader.video_name, frame_index)
+                input_telemetry.record(time.time() - start_time)
+                input_telemetry.sample()
+                wait_start = time.time()
+        except InputAborted as e:
+            print(e)
+        except Exception as e:
+            # 解码失败: 已输入的帧照常处理并保存, 视频记入需考量视频列表
+            print(f'任务{task_id} {video_reader.video_name} 读取出现异常: {e!r} (原因: {e.__cause__!r})')
+            if video_reader.video_name not in error_video:
+                error_video.append(video_reader.video_name)
+        video_reader.release()
+        bd.close()
+
+        # 数据输入结束(结束标记依次经过每个阶段)
+        try:
+            self._put_input(lambda timeout: motion_input_queue.put(END_OF_STREAM, timeout=timeout), sign_dict,
+                            processing_dict)
+        except InputAborted as e:
+            print(e)
+        sign_dict['video_input_sign'] = True
+
+        # 等待所有开启的进程依次处理完剩余数据并结束
+        motion_p.join()
+        yolo_p.join()
+        differ_p.join()
+        record_result = self._receive_result(manager_p, result_queue, bug_record)
+        record_result.skipped_frames = skipped_frames
+        video_manager_p.join()
+        watchdog.join()
+        frame_ring.close()
+        self._save_telemetry(video_reader.video_name, input_telemetry, telemetry_queue)
+
+        # 数据保存
+        print('数据保存中')
+        save_blurry_list(path_dir.blurry_path, blurry_list)
+        print('模糊度列表保存完成')
+        json_writer = JSONWriter(path_dir.json_path)
+        json_writer.write(record_result)
+        print('json数据保存成功')
+        try:
+            excel_writer = ExcelWriter(path_dir.execl_path)
+            excel_writer.write(record_result)
+            print('excel数据保存成功')
+        except:
+            print('xlwings库出现异常，excel数据保存失败')
+        print('数据保存完成')
+        video_end_time = time.time()
+        print(f'第 {task_id}个视频结束时间: {time.ctime()}')
+        print(f'第 {task_id}个视频检测时间: {video_end_time - video_start_time}')
+        sign_dict['finish'] = True
+        self.report('finish', video_reader.video_name, {
+            'error_video': error_video,
+            'frame_interval': frame_interval,
+            'detect_time': video_end_time - video_start_time,
+        })
+
+    def _receive_result(self, manager_p, result_queue, bug_record):
+        """
+        接收数据管理进程的记录结果
+        :param manager_p: 数据管理进程
+        :param result_queue: 记录结果队列
+        :param bug_record: 主进程中的微生物记录器(未收到结果时使用, 实时查看模式下其中为代理对象的数据)
+        :return: 微生物记录结果
+        """
+        while manager_p.is_alive() or not result_queue.empty():
+            try:
+                return result_queue.get(timeout=1)
+            except queue.Empty:
+                pass
+        print(f'任务{self.task_id} 未收到数据管理进程的记录结果')
+        return bug_record.result()
+
+    def _save_telemetry(self, video_name, input_telemetry, telemetry_queue):
+        """
+        汇总并保存各阶段的运行指标
+        :param video_name: 视频名称
+        :param input_telemetry: 输入阶段的运行指标
+        :param telemetry_queue: 运行指标队列(各阶段结束时放入的指标汇总)
+        :return: None
+        """
+        summaries = [input_telemetry.summary()]
+        while True:
+            try:
+                summaries.append(telemetry_queue.get_nowait())
+            except queue.Empty:
+                break
+        telemetry_writer = TelemetryWriter(self.path_dir.telemetry_path, self.path_dir.prometheus_path)
+        telemetry_writer.write(video_name, summaries)
+        for summary in summaries:
+            print(f"任务{self.task_id} {summary['stage']}: {summary['frames']}帧, {summary['fps']}帧/秒, "
+                  f"忙碌{summary['busy_time']}秒, 空闲{summary['idle_time']}秒")
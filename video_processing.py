@@ -1,25 +1,28 @@
+import time
+from collections import deque
 from video.video_handle import VideoHandle
-from multiprocessing import Lock
+from stage_processing import StageProcessing
 
-lock = Lock()
 
-
-class VideoProcessing:
+class VideoProcessing(StageProcessing):
     """
     视频进程类
     """
+    SIGN_NAME = 'video_manager_sign'
 
-    def __init__(self, sign_dict, video_queue):
+    def __init__(self, sign_dict, frame_ring, video_queue):
         """
 
         :param sign_dict: 进程通信标记
+        :param frame_ring: 共享内存帧缓冲区
         :param video_queue: 视频结果数据队列
         """
-        self.sign_dict = sign_dict
+        super().__init__(sign_dict)
+        self.frame_ring = frame_ring
         self.video_display = self.sign_dict['video_display']
         self.video_save = self.sign_dict['video_save']
         self.video_queue = video_queue
-        self.video_queue_list = []
+        self.video_queue_list = deque()
         self.handle = VideoHandle()
 
     def start(self):
@@ -28,40 +31,32 @@ class VideoProcessing:
         :return:
         """
 
-        while True:
-            self._get_data()
-            try:
-                if len(self.video_queue_list) > 0:
-                    image, blurry_text, yolo_frame_index, differ_frame_index, bug_list, \
-                        total_bug_numbers = self.video_queue_list.pop(0)
-                    if self.video_display or self.video_save:
-                        frame = self.handle.draw_background(image, blurry_text, yolo_frame_index, differ_frame_index,
-                                                            bug_list, total_bug_numbers)
+        self.telemetry.start(video=self.video_queue)
+        finished = False
+        while not finished:
+            finished = self._get_data(self.video_queue, self.video_queue_list)
+            while len(self.video_queue_list) > 0:
+                start_time = time.time()
+                try:
+                    slot, blurry_text, yolo_frame_index, differ_frame_index, bug_list, \
+                        total_bug_numbers, store = self.video_queue_list.popleft()
+                    try:
+                        frame = self.handle.draw_background(self.frame_ring.get(slot), blurry_text, yolo_frame_index,
+                                                            differ_frame_index, bug_list, total_bug_numbers)
+                    finally:
+                        self.frame_ring.release(slot)
                     if self.video_display:
                         self.handle.display(frame)
-                    if self.video_save:
+                    if store:
                         self.handle.save(frame)
-                else:
-                    if not self.sign_dict['manager_sign']:
-                        continue
-                    else:
-                        break
-            except:
-                print('视频处理器出了点问题，但是没有影响。')
-        lock.acquire()
-        self.sign_dict['video_manager_sign'] = True
-        print('video manager finish')
-        lock.release()
+                except:
+                    print('视频处理器出了点问题，但是没有影响。')
+                self.telemetry.record(time.time() - start_time)
 
-    def _get_data(self):
-        """
-        获取输入数据
-        :return:
-        """
-        lock.acquire()
-        if not self.video_queue.empty():
-            self.video_queue_list.append(self.video_queue.get())
-        lock.release()
+        # 写完输出后更改完成标志
+        self.handle.release()
+        self._finish()
+        print('video manager finish')
 
     def set_fps(self, fps):
         """
@@ -79,6 +74,30 @@ class VideoProcessing:
         """
         self.handle.set_video_save_path(video_save_path)
 
+    def set_images_save_path(self, images_save_path):
+        """
+        设置图片保存路径
+        :param images_save_path: 图片保存路径(文件夹)
+        :return:
+        """
+        self.handle.set_images_save_path(images_save_path)
+
+    def set_save_mode(self, save_mode):
+        """
+        设置保存方式
+        :param save_mode: 保存方式(video: 直接编码为视频, images: 每帧保存为图片, both: 两者都保存)
+        :return:
+        """
+        self.handle.set_save_mode(save_mode)
+
+    def set_output_policy(self, output_policy):
+        """
+        设置保存等级(数据管理进程只发送需要显示或保存的帧, 视频进程按等级缩放后保存)
+        :param output_policy: 保存等级对象
+        :return:
+        """
+        self.handle.set_output_policy(output_policy)
+
     def set_video_message(self, video_message):
         """
         设置视频信息
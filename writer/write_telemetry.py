@@ -0,0 +1,87 @@
+import json
+
+
+class TelemetryWriter:
+    """
+    流水线运行指标保存(JSON文件与Prometheus文本格式文件)
+    """
+    PREFIX = 'mifem_stage'  # Prometheus指标名前缀
+
+    def __init__(self, json_path, prometheus_path):
+        """
+
+        :param json_path: JSON文件路径
+        :param prometheus_path: Prometheus文本格式文件路径
+        """
+        self.json_path = json_path
+        self.prometheus_path = prometheus_path
+
+    def write(self, video_name, summaries):
+        """
+        保存运行指标
+        :param video_name: 视频名称
+        :param summaries: 各阶段的指标字典列表
+        :return: None
+        """
+        with open(self.json_path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({'video_name': video_name, 'stages': summaries}))
+        with open(self.prometheus_path, 'w', encoding='utf-8') as f:
+            f.write(self.prometheus_text(video_name, summaries))
+
+    @staticmethod
+    def _labels(**labels):
+        """
+        生成Prometheus标签文本
+        :param labels: 标签
+        :return: 标签文本
+        """
+        text = ','.join('{}="{}"'.format(key, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                        for key, value in labels.items())
+        return '{' + text + '}'
+
+    @classmethod
+    def prometheus_text(cls, video_name, summaries):
+        """
+        将运行指标转换成Prometheus文本格式
+        :param video_name: 视频名称
+        :param summaries: 各阶段的指标字典列表
+        :return: 文本
+        """
+        metrics = {
+            # 指标名: (类型, 说明, [(标签, 值)])
+            'frames_total': ('counter', 'Frames processed by the stage', []),
+            'fps': ('gauge', 'Average frames per second of the stage', []),
+            'busy_seconds_total': ('counter', 'Time spent processing data', []),
+            'idle_seconds_total': ('counter', 'Time spent waiting for input', []),
+            'latency_seconds': ('summary', 'Per-frame processing latency', []),
+            'queue_depth_max': ('gauge', 'Maximum sampled input queue depth', []),
+            'queue_depth_mean': ('gauge', 'Mean sampled input queue depth', []),
+            'cpu_percent_mean': ('gauge', 'Mean CPU usage of the stage process', []),
+            'rss_bytes_max': ('gauge', 'Peak resident memory of the stage process', []),
+        }
+        for summary in summaries:
+            base = {'video': video_name, 'stage': summary['stage']}
+            metrics['frames_total'][2].append((cls._labels(**base), summary['frames']))
+            metrics['fps'][2].append((cls._labels(**base), summary['fps']))
+            metrics['busy_seconds_total'][2].append((cls._labels(**base), summary['busy_time']))
+            metrics['idle_seconds_total'][2].append((cls._labels(**base), summary['idle_time']))
+            for key, value in summary['latency'].items():
+                if key.startswith('p'):
+                    labels = cls._labels(**base, quantile=int(key[1:]) / 100)
+                    metrics['latency_seconds'][2].append((labels, value))
+            metrics['latency_seconds'][2].append(('_sum' + cls._labels(**base), summary['latency_sum']))
+            metrics['latency_seconds'][2].append(('_count' + cls._labels(**base), summary['frames']))
+            for queue_name, depth in summary['queue_depth'].items():
+                labels = cls._labels(**base, queue=queue_name)
+                metrics['queue_depth_max'][2].append((labels, depth['max']))
+                metrics['queue_depth_mean'][2].append((labels, depth['mean']))
+            metrics['cpu_percent_mean'][2].append((cls._labels(**base), summary['cpu_percent']['mean']))
+            metrics['rss_bytes_max'][2].append((cls._labels(**base), summary['rss_bytes']['max']))
+
+        lines = []
+        for name, (metric_type, help_text, samples) in metrics.items():
+            metric_name = f'{cls.PREFIX}_{name}'
+            lines.append(f'# HELP {metric_name} {help_text}')
+            lines.append(f'# TYPE {metric_name} {metric_type}')
+            lines.extend(f'{metric_name}{labels} {value}' for labels, value in samples)
+        return '\n'.join(lines) + '\n'
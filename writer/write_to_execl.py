@@ -14,7 +14,7 @@ class JSONWriter:
     def generate_json(self, bug_record):
         """
         生成需要储存的JSON
-        :param bug_record: 微生物记录器
+        :param bug_record: 微生物记录结果
         :return: None
         """
 
@@ -29,7 +29,7 @@ class JSONWriter:
     def write(self, bug_record):
         """
         将输入写入成JSON
-        :param bug_record: 微生物记录器
+        :param bug_record: 微生物记录结果
         :return: None
         """
 
@@ -52,7 +52,7 @@ class JSONWriter:
     def number_sheet_to_json(bug_record):
         """
         微生物死活数量转换成JSON信息
-        :param bug_record: 微生物记录器
+        :param bug_record: 微生物记录结果
         :return:
         """
         number_json = {}
@@ -65,13 +65,13 @@ class JSONWriter:
     def movement_sheet_to_json(bug_record):
         """
         微生物各项指标转换成JSON信息
-        :param bug_record: 微生物记录器
+        :param bug_record: 微生物记录结果
         :return:
         """
         movement_json = {}
         bug_record.bug_record['SmallProtozoa'] = bug_record.bug_record['SmallProtozoa'][:20000]
         for bug_name, bug_list in bug_record.bug_record.items():
-            movement_json[str(bug_name)] = list(bug_list)
+            movement_json[str(bug_name)] = [list(message) for message in bug_list]  # 复制, 不改动记录中的数据
         for index, ar_path in enumerate(bug_record.ar_colors_list):
             movement_json['Ar'][index].append(ar_path)
         return movement_json
@@ -80,14 +80,15 @@ class JSONWriter:
     def video_message_to_json(bug_record):
         """
         视频信息转换成JSON信息
-        :param bug_record: 微生物记录器
+        :param bug_record: 微生物记录结果
         :return:
         """
 
         video_message_json = {
             "video_name": bug_record.video_path,
             "video_fps": bug_record.fps,
-            "total_frames": bug_record.frames
+            "total_frames": bug_record.frames,
+            "skipped_frames": list(bug_record.skipped_frames)
         }
         return video_message_json
 
@@ -272,7 +273,7 @@ class ExcelWriter:
     def write(self, bug_record):
         """
         将数据写入excel
-        :param bug_record: 微生物记录器
+        :param bug_record: 微生物记录结果
         :return:
         """
 
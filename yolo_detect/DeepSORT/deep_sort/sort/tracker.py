@@ -57,6 +57,23 @@ class Tracker:
             # for each obj, predict state on time T with KF based on t-1
             track.predict(self.kf)
 
+    def compensate(self, translation):
+        """Shift every track by the global camera (stage) translation.
+
+        Call this before `predict` so the motion model only has to explain
+        the objects' own movement.
+
+        Parameters
+        ----------
+        translation : (float, float)
+            Image-space displacement of the scene from the previous frame
+            to the current one.
+
+        """
+        for track in self.tracks:
+            track.mean[0] += translation[0]
+            track.mean[1] += translation[1]
+
     def update(self, detections):
         # STEP 2: Then we update
         """Perform measurement update and track management.
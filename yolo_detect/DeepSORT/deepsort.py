@@ -60,6 +60,22 @@ class DeepSORT:
             others = []
         return outputs, others
 
+    def compensate(self, translation):
+        """
+        载物台平移补偿(所有追踪目标的卡尔曼状态随位移矢量平移, 在预测之前调用)
+        :param translation: 当前帧相对前一帧的位移矢量(x, y)
+        :return: None
+        """
+        self.deepsort.tracker.compensate(translation)
+
+    def predict(self):
+        """
+        跳过检测的帧只推进追踪器的卡尔曼预测(不匹配检测框, 追踪目标不会被标记丢失)
+        :return: 空的预测框信息, 空的其他信息
+        """
+        self.deepsort.tracker.predict()
+        return torch.zeros((0, 5)), []
+
 
 if __name__ == '__main__':
     d = DeepSORT()
@@ -34,9 +34,10 @@ class YoloDetector:
     AGNOSTIC_NMS = False
     MAX_DET = 1000
 
-    def __init__(self):
+    def __init__(self, batch_size=1):
         """
         建立追踪对象
+        :param batch_size: 批量检测时每批的帧数
         """
         self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
         self.detector = torch.load(r'.\yolo_detect\weights\best5.pt', map_location=self.device)['model'].float()
@@ -47,6 +48,9 @@ class YoloDetector:
         if self.half:
             self.detector.half()
         self.deepsort = DeepSORT()
+        self.batch_size = batch_size
+        self._batch_buffer = None  # 预分配的批量输入(uint8, 批次 x 通道 x 高 x 宽)
+        self._batch_tensor = None  # 预分配的批量网络输入张量
 
     def _init_config(self, config_path=None):
         """
@@ -60,7 +64,6 @@ class YoloDetector:
 
     # 调用函数保存预测框信息到指定文件夹
 
-    @torch.no_grad()
     def detect(self, frame_index, frame):
         """
         yolo检测
@@ -68,19 +71,44 @@ class YoloDetector:
         :param frame: 待检测的图片
         :return: 预测框信息, 其他信息(微生物类别,数量)
         """
-        img = self._numpy2tensor(frame)
-        pred = self.detector(img)[0]
-        # Apply NMS and filter object other than person (cls:0)
-        pred = non_max_suppression(pred, self.BASE_CONF_THRESHOLD, self.IOU_THRESHOLD, classes=self.CLASSES,
-                                   agnostic=self.AGNOSTIC_NMS, max_det=self.MAX_DET)
-
-        det = self._conf_filter(pred[0])
-        det, bug_nums = merge_prediction_box(det, 0)  # 对Gs 进行聚类（0代表GS的类别）
-        outputs, others = self.deepsort.image_track(det, bug_nums, frame, img.shape[2:], frame.shape,
-                                                    frame_index)  # 对预测结果进行追踪
-        cls_list = [other.cls for other in others]
-        logging.info(f'yolo检测:{outputs}, {cls_list}')
-        return frame_index, outputs, others
+        return self.detect_batch([frame_index], [frame])[0]
+
+    @torch.no_grad()
+    def detect_batch(self, frame_indices, frames, skips=None, translations=None):
+        """
+        yolo批量检测(一次前向推理与NMS, 之后按帧顺序送入DeepSORT追踪)
+        :param frame_indices: 帧数列表
+        :param frames: 待检测的图片列表
+        :param skips: 每一帧是否跳过检测(模糊帧不进入网络, 追踪器只做预测), None表示全部检测
+        :param translations: 每一帧相对前一帧的位移矢量(追踪目标先随载物台平移再预测, 计算失败为None), None表示不补偿
+        :return: 每一帧的(帧数, 预测框信息, 其他信息(微生物类别,数量))列表
+        """
+        skips = skips or [False] * len(frames)
+        translations = translations or [None] * len(frames)
+        detect_frames = [frame for frame, skip in zip(frames, skips) if not skip]
+        if detect_frames:
+            img = self._frames2tensor(detect_frames)
+            pred = self.detector(img)[0]
+            # Apply NMS and filter object other than person (cls:0)
+            pred = iter(non_max_suppression(pred, self.BASE_CONF_THRESHOLD, self.IOU_THRESHOLD, classes=self.CLASSES,
+                                            agnostic=self.AGNOSTIC_NMS, max_det=self.MAX_DET))
+
+        results = []
+        for frame_index, frame, skip, translation in zip(frame_indices, frames, skips, translations):
+            if translation is not None:
+                self.deepsort.compensate(translation)
+            if skip:
+                outputs, others = self.deepsort.predict()
+                results.append((frame_index, outputs, others))
+                continue
+            det = self._conf_filter(next(pred))
+            det, bug_nums = merge_prediction_box(det, 0)  # 对Gs 进行聚类（0代表GS的类别）
+            outputs, others = self.deepsort.image_track(det, bug_nums, frame, img.shape[2:], frame.shape,
+                                                        frame_index)  # 对预测结果进行追踪
+            cls_list = [other.cls for other in others]
+            logging.info(f'yolo检测:{outputs}, {cls_list}')
+            results.append((frame_index, outputs, others))
+        return results
 
     def _conf_filter(self, detection):
         """
@@ -102,20 +130,34 @@ class YoloDetector:
         result = torch.cat(filter_list)
         return result
 
-    def _numpy2tensor(self, frame, img_size=640):
+    def _frames2tensor(self, frames, img_size=640):
         """
-        numpy to tensor
-        :param frame: numpy格式的图片
+        将多张numpy格式的图片写入预分配的批量张量
+        :param frames: numpy格式的图片列表
         :param img_size: 转换后图片的大小
-        :return: 装换后的图片
+        :return: 转换后的批量图片(批次 x 通道 x 高 x 宽)
+        """
+        for index, frame in enumerate(frames):
+            img = letterbox(frame, new_shape=img_size)[0]
+            if index == 0:
+                self._allocate_batch(max(self.batch_size, len(frames)), img.shape)
+            # BGR to RGB, HWC to CHW
+            np.copyto(self._batch_buffer[index], img[:, :, ::-1].transpose(2, 0, 1))
+        batch = self._batch_tensor[:len(frames)]
+        batch.copy_(torch.from_numpy(self._batch_buffer[:len(frames)]))  # uint8 to fp16/32
+        batch /= 255.0  # 0 - 255 to 0.0 - 1.0
+        return batch
+
+    def _allocate_batch(self, batch_size, img_shape):
+        """
+        按批次大小与letterbox后的图片大小预分配输入缓存(大小不变时复用)
+        :param batch_size: 批次大小
+        :param img_shape: letterbox后的图片形状(高, 宽, 通道)
+        :return: None
         """
-        img = letterbox(frame, new_shape=img_size)[0]
-        # Convert
-        img = np.ascontiguousarray(img[:, :, ::-1].transpose(2, 0, 1))
-        # numpy to tensor
-        img = torch.from_numpy(img).to(self.device)
-        img = img.half() if self.half else img.float()  # uint8 to fp16/32
-        img /= 255.0  # 0 - 255 to 0.0 - 1.0
-        if img.ndimension() == 3:
-            img = img.unsqueeze(0)
-        return img
+        height, width, channel = img_shape
+        shape = (batch_size, channel, height, width)
+        if self._batch_buffer is not None and self._batch_buffer.shape == shape:
+            return
+        self._batch_buffer = np.empty(shape, dtype=np.uint8)
+        self._batch_tensor = torch.empty(shape, dtype=torch.half if self.half else torch.float, device=self.device)
@@ -1,5 +1,8 @@
+import time
+from collections import deque
+import torch
 from yolo_detect.yolo import YoloDetector
-from multiprocessing import Lock
+from stage_processing import StageProcessing
 
 # import logging
 
@@ -7,99 +10,92 @@ from multiprocessing import Lock
 # logging.basicConfig(level=logging.INFO, filename='app_frame.log', filemode='a',
 #                     format='%(asctime)s - %(levelname)s - %(message)s')
 
-lock = Lock()
 
-
-class YoloProcessing:
+class YoloProcessing(StageProcessing):
     """
     大虫子进程类
     """
+    SIGN_NAME = 'yolo_detect_sign'
 
-    def __init__(self, sign_dict, yolo_result_queue, yolo_input_queue, frame_input_queue):
+    def __init__(self, sign_dict, frame_ring, yolo_result_queue, yolo_input_queue, frame_input_queue, batch_size=1,
+                 num_threads=None):
         """
 
         :param sign_dict: 进程通信标记
+        :param frame_ring: 共享内存帧缓冲区
         :param yolo_result_queue: yolo结果队列
-        :param yolo_input_queue: yolo输入队列
+        :param yolo_input_queue: yolo输入队列(位移矢量进程的输出)
         :param frame_input_queue: 帧差法输入队列
+        :param batch_size: yolo批量检测的帧数(1表示逐帧检测)
+        :param num_threads: 推理使用的CPU线程数(None表示使用torch默认值, 多个视频并行时按CPU预算分配)
         """
-        self.sign_dict = sign_dict
+        super().__init__(sign_dict)
+        self.frame_ring = frame_ring
         self.yolo_result_queue = yolo_result_queue
         self.yolo_input_queue = yolo_input_queue
         self.frame_input_queue = frame_input_queue
-        self.yolo_input_list = []  # yolo输入数据储存列表
+        self.yolo_input_list = deque()  # yolo输入数据缓存
+        self.batch_size = batch_size
+        self.num_threads = num_threads
+        self.differ_translation = (0.0, 0.0)  # 上一次送入帧差法之后累计的位移矢量(有一帧计算失败则为None)
+        self.frame_count = 0  # 已检测的帧数(读取到的帧, 与抽帧步长和起始帧无关)
 
     def start(self):
         """
         进程开启接口
         :return:
         """
-        yolo_detector = YoloDetector()
-        while True:
-                self._get_data()
-            # try:
-                if len(self.yolo_input_list) > 0:
-                    frame_index, frame, blurry, blurry_text = self.yolo_input_list.pop(0)
-                    frame_index, outputs, others = yolo_detector.detect(frame_index, frame)
-                    if frame_index % 2 == 0:
-                        cls_list = [other.cls for other in others]
-                        # logging.info(f'帧差法输入：{frame_index}, {outputs}, {cls_list}')
-                        self._set_frame_input_queue((frame_index, frame, blurry, blurry_text, outputs, others))
-                    self._set_result_queue((frame_index, frame, outputs, others, blurry, blurry_text))
-                    # # 指定文件夹路径和文件名
-                    # folder_path = '/root/home/MIFEM/result'
-                    # file_name = 'yolo_result.txt'
-                    # if not os.path.exists(folder_path):
-                    #     # 创建文件夹（如果不存在）
-                    #     os.makedirs(folder_path, exist_ok=True)
-
-                    # # 构建完整的文件路径
-                    # file_path = os.path.join(folder_path, file_name)
+        if self.num_threads:
+            torch.set_num_threads(self.num_threads)
+        yolo_detector = YoloDetector(self.batch_size)
+        self.telemetry.start(yolo_input=self.yolo_input_queue)
+        finished = False
+        while not finished:
+            backlog_length = len(self.yolo_input_list)
+            finished = self._get_data(self.yolo_input_queue, self.yolo_input_list)
+            idle = len(self.yolo_input_list) == backlog_length  # 等待超时或输入结束, 不足一批也需要检测
+            while len(self.yolo_input_list) >= self.batch_size or (idle and len(self.yolo_input_list) > 0):
+                self._detect_batch(yolo_detector)
 
-                    # # 将数据保存到文本文件
-                    # with open(file_path, 'a') as f:
-                    #     f.write(f'frame_index: {frame_index}\n')
-                    #     f.write(f'outputs: {outputs}\n')
-
-                else:
-                    if not self.sign_dict['video_input_sign']:
-                        continue
-                    else:
-                        break
-            # except:
-            #     print('yolo检测器出了一点问题，但是没有影响。')
-        # 更改完成标志
-        lock.acquire()
-        self.sign_dict['yolo_detect_sign'] = True
+        # 通知下游并更改完成标志
+        self._finish(self.frame_input_queue, self.yolo_result_queue)
         print('yolo detect finish')
-        lock.release()
 
-    def _get_data(self):
+    def _detect_batch(self, yolo_detector):
         """
-        获取输入数据
-        :return:
+        从缓存中取出一批数据检测, 并按帧顺序向下游放入结果
+        :param yolo_detector: yolo检测器
+        :return: None
         """
-        lock.acquire()
-        if not self.yolo_input_queue.empty():
-            self.yolo_input_list.append(self.yolo_input_queue.get(timeout=10))
-        lock.release()
+        start_time = time.time()
+        batch = [self.yolo_input_list.popleft() for _ in range(min(self.batch_size, len(self.yolo_input_list)))]
+        frame_indices = [frame_index for frame_index, slot, blurry, blurry_text, translation in batch]
+        frames = [self.frame_ring.get(slot) for frame_index, slot, blurry, blurry_text, translation in batch]
+        skips = [blurry for frame_index, slot, blurry, blurry_text, translation in batch]
+        translations = [translation for frame_index, slot, blurry, blurry_text, translation in batch]
+        results = yolo_detector.detect_batch(frame_indices, frames, skips, translations)
 
-    def _set_frame_input_queue(self, result):
-        """
-        向帧差法输入队列放入数据
-        :param result: 待放入的数据
-        :return:
-        """
-        lock.acquire()
-        self.frame_input_queue.put(result)
-        lock.release()
+        for (frame_index, slot, blurry, blurry_text, translation), (_, outputs, others) in zip(batch, results):
+            self._accumulate_translation(translation)
+            # 帧差法每隔一帧处理一帧(按读取到的帧计数, 帧数受抽帧步长与起始帧影响, 不能按帧数的奇偶判断)
+            if self.frame_count % 2 == 0:
+                # logging.info(f'帧差法输入：{frame_index}, {outputs}, {[other.cls for other in others]}')
+                self.frame_ring.retain(slot)  # 帧差法进程同样持有该帧
+                self.frame_input_queue.put((frame_index, slot, blurry, blurry_text, outputs, others,
+                                            self.differ_translation))
+                self.differ_translation = (0.0, 0.0)
+            self.yolo_result_queue.put((frame_index, slot, outputs, others, translation, blurry, blurry_text))
+            self.frame_count += 1
+        self.telemetry.record(time.time() - start_time, len(batch))
 
-    def _set_result_queue(self, result):
+    def _accumulate_translation(self, translation):
         """
-        向yolo结果队列放入数据
-        :param result: 待放入的数据
-        :return:
+        累计帧差法两次输入之间的位移矢量(帧差法每隔一帧处理一帧, 相邻两次输入之间的位移为各帧位移之和)
+        :param translation: 当前帧相对前一帧的位移矢量(计算失败为None)
+        :return: None
         """
-        lock.acquire()
-        self.yolo_result_queue.put(result)
-        lock.release()
+        if translation is None or self.differ_translation is None:
+            self.differ_translation = None
+        else:
+            self.differ_translation = (self.differ_translation[0] + translation[0],
+                                       self.differ_translation[1] + translation[1])